@@ -0,0 +1,112 @@
+"""
+attendance_engine.py: One-pass attendance computation over the sorted logs.
+
+A student counts as present on a day if they have at least one behavior, quiz,
+or homework log entry on that day. Both logs are kept sorted by their ISO
+timestamp (the log commands re-sort after every insert and `load_data` sorts on
+load), so the entries for a date range form one contiguous slice of each log.
+That slice is found by bisection and then scanned once to fill a
+(date, student) presence bitmap, instead of re-scanning every log entry for
+every day and student.
+"""
+
+from bisect import bisect_left
+from datetime import date, timedelta
+
+
+def _timestamp_day_key(log_entry):
+    return log_entry.get("timestamp", "")[:10]
+
+
+def log_slice_for_dates(sorted_log, start_date, end_date):
+    """
+    Returns the (lo, hi) index bounds of entries in `sorted_log` dated start_date..end_date inclusive.
+
+    :param sorted_log: A log list sorted by its "timestamp" field (ISO format).
+    :param start_date: First day of the range (datetime.date).
+    :param end_date: Last day of the range (datetime.date).
+    """
+    lo = bisect_left(sorted_log, start_date.isoformat(), key=_timestamp_day_key)
+    hi = bisect_left(sorted_log, (end_date + timedelta(days=1)).isoformat(), lo=lo, key=_timestamp_day_key)
+    return lo, hi
+
+
+class AttendanceGrid:
+    """
+    A dense (date, student) presence bitmap for a report range.
+
+    :param start_date: First day of the report (datetime.date).
+    :param end_date: Last day of the report (datetime.date).
+    :param student_ids: The students covered by the report, in column order of the bitmap.
+    """
+    def __init__(self, start_date, end_date, student_ids):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.num_days = max((end_date - start_date).days + 1, 0)
+        self.student_ids = list(dict.fromkeys(student_ids)) # De-duplicate, keep order
+        self.student_index = {sid: i for i, sid in enumerate(self.student_ids)}
+        self._present = bytearray(self.num_days * len(self.student_ids))
+
+    def __bool__(self):
+        return self.num_days > 0 and bool(self.student_ids)
+
+    def dates(self):
+        return [self.start_date + timedelta(days=i) for i in range(self.num_days)]
+
+    def mark_present(self, day_offset, student_id):
+        s_idx = self.student_index.get(student_id)
+        if s_idx is not None and 0 <= day_offset < self.num_days:
+            self._present[s_idx * self.num_days + day_offset] = 1
+
+    def is_present(self, day, student_id):
+        s_idx = self.student_index.get(student_id)
+        day_offset = (day - self.start_date).days
+        if s_idx is None or not (0 <= day_offset < self.num_days): return False
+        return self._present[s_idx * self.num_days + day_offset] == 1
+
+    def student_row(self, student_id):
+        """Returns the student's presence flags (1/0 per day) as a bytes slice."""
+        s_idx = self.student_index[student_id]
+        return bytes(self._present[s_idx * self.num_days:(s_idx + 1) * self.num_days])
+
+    def totals(self, student_id):
+        """Returns (days_present, days_absent) for a student."""
+        present = self.student_row(student_id).count(1)
+        return present, self.num_days - present
+
+    def to_dict(self):
+        """Legacy {date: {student_id: "P"/"A"}} form, as previously returned by generate_attendance_data."""
+        result = {}
+        for day_offset, day in enumerate(self.dates()):
+            result[day] = {sid: "P" if self._present[s_idx * self.num_days + day_offset] else "A"
+                           for sid, s_idx in self.student_index.items()}
+        return result
+
+
+def build_attendance_grid(sorted_logs, start_date, end_date, student_ids):
+    """
+    Builds an AttendanceGrid with a single pass over the date-bounded slice of each log.
+
+    :param sorted_logs: An iterable of log lists (e.g. behavior_log, homework_log), each sorted by timestamp.
+    :param start_date: First day of the report (datetime.date).
+    :param end_date: Last day of the report (datetime.date).
+    :param student_ids: The students to include.
+    :return: The populated AttendanceGrid.
+    """
+    grid = AttendanceGrid(start_date, end_date, student_ids)
+    if not grid: return grid
+    day_offsets = {} # "YYYY-MM-DD" -> offset; each distinct day is parsed only once
+    for log in sorted_logs:
+        lo, hi = log_slice_for_dates(log, start_date, end_date)
+        for i in range(lo, hi):
+            entry = log[i]
+            student_id = entry.get("student_id")
+            if student_id not in grid.student_index: continue
+            day_key = entry.get("timestamp", "")[:10]
+            day_offset = day_offsets.get(day_key)
+            if day_offset is None:
+                try: day_offset = (date.fromisoformat(day_key) - start_date).days
+                except ValueError: day_offset = -1 # Malformed timestamp, never present
+                day_offsets[day_key] = day_offset
+            grid.mark_present(day_offset, student_id)
+    return grid
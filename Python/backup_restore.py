@@ -0,0 +1,166 @@
+"""
+backup_restore.py: Reading and checking a backup zip before anything is restored from it.
+
+`read_backup_members` streams each member of a zip made by "Backup All
+Application Data" into memory and checks it without writing to disk:
+
+* the member name is one the app writes (main data file, undo history, student
+  groups, custom behaviors/homework types/statuses, quiz/homework templates, or
+  a layout template) and is a plain relative path;
+* the version in its name (`_v9`, `_v10`, ...) is not newer than this app's;
+* its content starts like the app writes it (a Fernet token, JSON, or undo
+  history records);
+* its CRC-32 matches (checked by `zipfile` as the member is read).
+
+The caller then decodes and migrates the contents in memory and, only if all
+of that succeeds, writes them with `replace_files_atomically`, which rolls every
+file back if any of them cannot be replaced.
+"""
+
+import json
+import os
+import re
+import zlib
+
+from data_encryption import decrypt_data
+
+# Member name prefix -> kind; names end in _v<N>.json (or .log), older backups use older <N>
+MEMBER_KINDS = {
+    "classroom_data": "data",
+    "undo_history_": "undo_history",
+    "student_groups_": "student_groups",
+    "custom_behaviors_": "custom_behaviors",
+    "custom_homework_types_": "custom_homework_types",
+    "custom_homework_statuses_": "custom_homework_statuses",
+    "quiz_templates_": "quiz_templates",
+    "homework_templates_": "homework_templates",
+}
+LAYOUT_TEMPLATES_MEMBER_DIR = "layout_templates"
+FERNET_TOKEN_PREFIX = b"gAAAAA" # Version byte 0x80 plus the timestamp's high bytes, base64-encoded
+_VERSION_PATTERN = re.compile(r"_v(\d+)\.(json|log)$")
+_HISTORY_RECORD_PATTERN = re.compile(rb"^\d+\t")
+RESTORE_TEMP_SUFFIX = ".restore_tmp" # New file, written before anything is replaced
+RESTORE_OLD_SUFFIX = ".restore_old" # Replaced or removed file, kept until the restore is complete
+
+
+class BackupFormatError(Exception):
+    """The backup is not one this app can restore; nothing has been changed."""
+    pass
+
+
+def _check_content(name, kind, content):
+    if kind == "undo_history":
+        if content and not _HISTORY_RECORD_PATTERN.match(content):
+            raise BackupFormatError(f"{name} is not an undo history file")
+    elif not (content.startswith(FERNET_TOKEN_PREFIX) or content.lstrip()[:1] in (b"{", b"[")):
+        raise BackupFormatError(f"{name} is neither encrypted nor JSON")
+
+
+def read_backup_members(zip_path, current_version):
+    """
+    Reads and checks every member of a backup zip (see the module docstring).
+
+    :param current_version: This app's data version number, e.g. 10.
+    :return: Dict of kind -> (member name, content) with exactly one "data" entry, plus
+             "layout_templates" -> list of (file name, content).
+    :raises BackupFormatError, zipfile.BadZipFile (bad CRC or archive), OSError:
+    """
+    import zipfile # Only needed for restores, not at startup
+    members = {"layout_templates": []}
+    with zipfile.ZipFile(zip_path, 'r') as zf:
+        for info in zf.infolist():
+            if info.is_dir(): continue
+            name = info.filename
+            parts = name.split("/")
+            if name.startswith("/") or ".." in parts or "\\" in name:
+                raise BackupFormatError(f"Invalid member path: {name}")
+            if len(parts) == 2 and parts[0] == LAYOUT_TEMPLATES_MEMBER_DIR:
+                kind = "layout_template"
+            elif len(parts) == 1:
+                kind = next((kind for prefix, kind in MEMBER_KINDS.items() if name.startswith(prefix)), None)
+            else:
+                kind = None
+            if kind is None:
+                print(f"Restore: skipping unknown backup member {name}")
+                continue
+            version = _VERSION_PATTERN.search(name)
+            if version and int(version.group(1)) > current_version:
+                raise BackupFormatError(f"{name} is from a newer version of the app (v{version.group(1)})")
+            try:
+                with zf.open(info) as f: # Raises BadZipFile on a CRC mismatch once read to the end
+                    content = f.read()
+            except (zlib.error, EOFError) as e: # Damaged compressed data
+                raise BackupFormatError(f"{name} is damaged: {e}")
+            _check_content(name, kind, content)
+            if kind == "layout_template":
+                members["layout_templates"].append((parts[1], content))
+            elif kind in members:
+                raise BackupFormatError(f"The backup holds more than one {kind.replace('_', ' ')} file")
+            else:
+                members[kind] = (name, content)
+    if "data" not in members:
+        raise BackupFormatError("The backup has no main data file")
+    return members
+
+
+def decode_json_content(name, content):
+    """The JSON value of a member's (possibly encrypted) content. :raises BackupFormatError:"""
+    import cryptography.fernet
+    try:
+        try:
+            text = decrypt_data(content)
+        except cryptography.fernet.InvalidToken:
+            text = content.decode('utf-8')
+        return json.loads(text)
+    except (ValueError, UnicodeDecodeError) as e: # json.JSONDecodeError is a ValueError
+        raise BackupFormatError(f"{name} could not be decoded: {e}")
+
+
+def replace_files_atomically(files, remove_paths=()):
+    """
+    Writes (path, content) pairs and removes `remove_paths` as one step: either every file is replaced
+    and removed, or none is.
+
+    Each new file is first written next to its target as `<path>.restore_tmp`. Then every existing
+    target and every file to remove is moved aside to `<path>.restore_old`, and the new files are moved
+    into place. If any of that fails, the files moved so far are moved back, the temporary files are
+    removed and the error is raised. The moved-aside files are deleted once everything is in place.
+
+    :raises OSError: After rolling back.
+    """
+    staged, moved_aside, placed = [], [], []
+    try:
+        for path, content in files:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            temp_path = path + RESTORE_TEMP_SUFFIX
+            staged.append((temp_path, path))
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+        for path in [path for _, path in staged] + list(remove_paths):
+            if os.path.exists(path):
+                os.replace(path, path + RESTORE_OLD_SUFFIX)
+                moved_aside.append(path)
+        for temp_path, path in staged:
+            os.replace(temp_path, path)
+            placed.append(path)
+    except OSError:
+        _roll_back(staged, moved_aside, placed)
+        raise
+    for path in moved_aside:
+        try: os.remove(path + RESTORE_OLD_SUFFIX)
+        except OSError as e: print(f"Restore: could not remove {path + RESTORE_OLD_SUFFIX}: {e}") # The restore itself is complete
+
+
+def _roll_back(staged, moved_aside, placed):
+    """Undoes a failed `replace_files_atomically` as far as possible, continuing past errors."""
+    for path in placed:
+        if path not in moved_aside:
+            try: os.remove(path) # A file the restore added
+            except OSError as e: print(f"Restore rollback: could not remove {path}: {e}")
+    for path in moved_aside:
+        try: os.replace(path + RESTORE_OLD_SUFFIX, path)
+        except OSError as e: print(f"Restore rollback: could not move {path} back: {e}")
+    for temp_path, _ in staged:
+        if os.path.exists(temp_path):
+            try: os.remove(temp_path)
+            except OSError as e: print(f"Restore rollback: could not remove {temp_path}: {e}")
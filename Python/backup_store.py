@@ -0,0 +1,224 @@
+"""
+backup_store.py: Incremental, content-addressed backup snapshots of the app data.
+
+A snapshot is a manifest (`snapshots/<date>_<time>.json` in the store folder)
+listing each backed-up file with its size, SHA-256 and the hashes of its
+chunks. Chunks are stored once, zlib-compressed, as `chunks/<ab>/<sha256>`, so
+a snapshot only writes the chunks no earlier snapshot has:
+
+* A file whose size and modification time match the previous snapshot's entry
+  is not read at all; its entry is reused.
+* Other files are split into content-defined chunks at line boundaries: a chunk
+  ends after a line whose CRC hits CHUNK_BOUNDARY_MASK (once past
+  MIN_CHUNK_SIZE), or at MAX_CHUNK_SIZE. An edit therefore only changes the
+  chunks around it, and the append-only undo history only adds chunks at its
+  end. (Encrypted data files are re-encrypted as a whole on every save, so they
+  are stored again whenever they changed.)
+
+Restoring verifies every chunk's hash and each file's size and hash while
+streaming it into a temporary file next to its target; the targets are only
+replaced (`os.replace`) once every file of the snapshot has verified.
+"""
+
+import hashlib
+import json
+import os
+import zlib
+from datetime import datetime
+
+SNAPSHOTS_DIR_NAME = "snapshots"
+CHUNKS_DIR_NAME = "chunks"
+MANIFEST_FORMAT = 1
+MIN_CHUNK_SIZE = 16 * 1024
+MAX_CHUNK_SIZE = 256 * 1024
+CHUNK_BOUNDARY_MASK = 0x7FF # A boundary every ~2048 lines on average
+CHUNK_COMPRESSION_LEVEL = 6
+DEFAULT_MAX_SNAPSHOTS = 200
+BACKUP_STORE_DIR_NAME = "backups" # In the app data folder
+
+
+class BackupVerificationError(Exception):
+    """A chunk or file of a snapshot is missing or does not match its recorded hash."""
+    pass
+
+
+def iter_chunks(f):
+    """Yields the content-defined chunks of a binary file object (see the module docstring)."""
+    chunk = bytearray()
+    for line in iter(lambda: f.readline(MAX_CHUNK_SIZE), b""):
+        if len(chunk) + len(line) > MAX_CHUNK_SIZE:
+            yield bytes(chunk); chunk.clear()
+        chunk += line
+        if len(chunk) >= MIN_CHUNK_SIZE and (zlib.crc32(line) & CHUNK_BOUNDARY_MASK) == 0:
+            yield bytes(chunk); chunk.clear()
+    if chunk: yield bytes(chunk)
+
+
+class BackupStore:
+    """
+    The chunk store and snapshot manifests in `folder`.
+
+    :param folder: The store's folder (created if needed).
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self.snapshots_dir = os.path.join(folder, SNAPSHOTS_DIR_NAME)
+        self.chunks_dir = os.path.join(folder, CHUNKS_DIR_NAME)
+        os.makedirs(self.snapshots_dir, exist_ok=True)
+        os.makedirs(self.chunks_dir, exist_ok=True)
+
+    # --- Chunks ---
+    def _chunk_path(self, digest):
+        return os.path.join(self.chunks_dir, digest[:2], digest)
+
+    def _write_chunk(self, chunk):
+        """Stores a chunk unless it is already stored. :return: (its hash, bytes written)."""
+        digest = hashlib.sha256(chunk).hexdigest()
+        path = self._chunk_path(digest)
+        if os.path.exists(path): return digest, 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zlib.compress(chunk, CHUNK_COMPRESSION_LEVEL)
+        temp_path = path + ".tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(compressed)
+        os.replace(temp_path, path)
+        return digest, len(compressed)
+
+    def _read_chunk(self, digest):
+        try:
+            with open(self._chunk_path(digest), 'rb') as f:
+                chunk = zlib.decompress(f.read())
+        except (OSError, zlib.error) as e:
+            raise BackupVerificationError(f"Chunk {digest[:12]} is missing or unreadable: {e}")
+        if hashlib.sha256(chunk).hexdigest() != digest:
+            raise BackupVerificationError(f"Chunk {digest[:12]} is corrupted")
+        return chunk
+
+    # --- Snapshots ---
+    def snapshot_ids(self):
+        """Ids of the stored snapshots, oldest first."""
+        return sorted(name[:-len(".json")] for name in os.listdir(self.snapshots_dir) if name.endswith(".json"))
+
+    def read_manifest(self, snapshot_id):
+        with open(os.path.join(self.snapshots_dir, f"{snapshot_id}.json"), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def latest_manifest(self):
+        for snapshot_id in reversed(self.snapshot_ids()):
+            try: return self.read_manifest(snapshot_id)
+            except (OSError, ValueError) as e: print(f"Warning: Skipping unreadable backup snapshot {snapshot_id}: {e}")
+        return None
+
+    def create_snapshot(self, files, label="auto", app_version="", skip_if_unchanged=False):
+        """
+        Backs up `files` as a new snapshot.
+
+        :param files: (path relative to the backed-up folder with "/" separators, absolute path) pairs; missing files are skipped.
+        :param label: Shown in the restore list, e.g. "auto", "manual" or "before import".
+        :param skip_if_unchanged: Don't write a snapshot if no file changed since the latest one.
+        :return: (snapshot id or None if skipped, number of files, bytes of new chunks written)
+        """
+        previous = self.latest_manifest()
+        previous_entries = {entry["path"]: entry for entry in previous["files"]} if previous else {}
+        entries, bytes_written, changed = [], 0, previous is None
+        for relative_path, path in files:
+            try: stat = os.stat(path)
+            except OSError: continue
+            stamp = [stat.st_size, stat.st_mtime_ns]
+            old_entry = previous_entries.get(relative_path)
+            if old_entry and old_entry.get("stamp") == stamp:
+                entries.append(old_entry); continue
+            file_hash, chunk_digests, size = hashlib.sha256(), [], 0
+            with open(path, 'rb') as f:
+                for chunk in iter_chunks(f):
+                    file_hash.update(chunk); size += len(chunk)
+                    digest, written = self._write_chunk(chunk)
+                    chunk_digests.append(digest); bytes_written += written
+            entry = {"path": relative_path, "size": size, "sha256": file_hash.hexdigest(), "chunks": chunk_digests, "stamp": stamp}
+            changed = changed or not old_entry or old_entry["sha256"] != entry["sha256"]
+            entries.append(entry)
+        changed = changed or set(previous_entries) != {entry["path"] for entry in entries}
+        if skip_if_unchanged and not changed: return None, len(entries), bytes_written
+        now = datetime.now()
+        snapshot_id = now.strftime('%Y%m%d_%H%M%S_%f')
+        manifest = {"format": MANIFEST_FORMAT, "created": now.isoformat(timespec='seconds'), "label": label,
+                    "app_version": app_version, "files": entries}
+        temp_path = os.path.join(self.snapshots_dir, f"{snapshot_id}.json.tmp")
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, os.path.join(self.snapshots_dir, f"{snapshot_id}.json"))
+        return snapshot_id, len(entries), bytes_written
+
+    def describe(self, snapshot_id):
+        """One line for the restore list, e.g. "2025-10-06 14:05  auto  12 files, 3.4 MB"."""
+        try: manifest = self.read_manifest(snapshot_id)
+        except (OSError, ValueError): return f"{snapshot_id}  (unreadable)"
+        total = sum(entry["size"] for entry in manifest["files"])
+        return f"{manifest['created'].replace('T', ' ')[:16]}  {manifest.get('label', '')}  {len(manifest['files'])} files, {total / 1024 / 1024:.1f} MB"
+
+    def restore_snapshot(self, snapshot_id, target_folder, remove_missing_under=()):
+        """
+        Restores a snapshot's files into `target_folder`, verifying every chunk and file hash first.
+
+        Each file is streamed into `<target>.restore_tmp`; only when all files have verified are they
+        moved into place. On any error the temporary files are removed and nothing is replaced.
+
+        :param remove_missing_under: Relative folders (e.g. "layout_templates") whose files that are not in
+                                     the snapshot are deleted after the restore.
+        :return: The restored relative paths.
+        """
+        manifest = self.read_manifest(snapshot_id)
+        if manifest.get("format") != MANIFEST_FORMAT:
+            raise BackupVerificationError(f"Unsupported snapshot format {manifest.get('format')}")
+        staged = []
+        try:
+            for entry in manifest["files"]:
+                target = os.path.normpath(os.path.join(target_folder, *entry["path"].split("/")))
+                if os.path.commonpath([os.path.abspath(target), os.path.abspath(target_folder)]) != os.path.abspath(target_folder):
+                    raise BackupVerificationError(f"Invalid path in snapshot: {entry['path']}")
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                temp_path = target + ".restore_tmp"
+                staged.append((temp_path, target))
+                file_hash, size = hashlib.sha256(), 0
+                with open(temp_path, 'wb') as f:
+                    for digest in entry["chunks"]:
+                        chunk = self._read_chunk(digest)
+                        file_hash.update(chunk); size += len(chunk)
+                        f.write(chunk)
+                if size != entry["size"] or file_hash.hexdigest() != entry["sha256"]:
+                    raise BackupVerificationError(f"{entry['path']} does not match its recorded hash")
+        except Exception:
+            for temp_path, _ in staged:
+                if os.path.exists(temp_path): os.remove(temp_path)
+            raise
+        for temp_path, target in staged:
+            os.replace(temp_path, target)
+        restored = [entry["path"] for entry in manifest["files"]]
+        for folder in remove_missing_under:
+            folder_path = os.path.join(target_folder, folder)
+            if not os.path.isdir(folder_path): continue
+            for name in os.listdir(folder_path):
+                if f"{folder}/{name}" not in restored and os.path.isfile(os.path.join(folder_path, name)):
+                    os.remove(os.path.join(folder_path, name))
+        return restored
+
+    def prune(self, max_snapshots=DEFAULT_MAX_SNAPSHOTS):
+        """Deletes the oldest snapshots beyond `max_snapshots` and the chunks no remaining snapshot uses. :return: Chunks deleted."""
+        snapshot_ids = self.snapshot_ids()
+        if len(snapshot_ids) <= max_snapshots: return 0
+        for snapshot_id in snapshot_ids[:len(snapshot_ids) - max_snapshots]:
+            os.remove(os.path.join(self.snapshots_dir, f"{snapshot_id}.json"))
+        used = set()
+        for snapshot_id in snapshot_ids[len(snapshot_ids) - max_snapshots:]:
+            try:
+                for entry in self.read_manifest(snapshot_id)["files"]: used.update(entry["chunks"])
+            except (OSError, ValueError, KeyError):
+                return 0 # Never delete chunks a snapshot might still need
+        deleted = 0
+        for prefix in os.listdir(self.chunks_dir):
+            prefix_dir = os.path.join(self.chunks_dir, prefix)
+            if not os.path.isdir(prefix_dir): continue
+            for name in os.listdir(prefix_dir):
+                if name not in used:
+                    os.remove(os.path.join(prefix_dir, name)); deleted += 1
+        return deleted
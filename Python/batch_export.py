@@ -0,0 +1,161 @@
+"""
+batch_export.py: Exports many classroom data files from the command line, without opening a window.
+
+Each data file is read and migrated by `ClassroomData` (the app's widget-free
+`ClassroomModel`), together with the student groups and custom homework types files in
+its folder, and exported with the same code as the app's Export Log menu and
+attendance report, so the files match what the app would produce. Files are
+processed in parallel by a process pool.
+
+Usage:
+    python batch_export.py DATA_FILE_OR_FOLDER... --output-dir exports
+        [--formats xlsx,csv,attendance,layout] [--start 2025-09-01] [--end 2025-09-07] [--dpi 300] [--workers 4]
+
+Folders are searched recursively for `classroom_data*.json`. Output files are
+named after the data file's folder and name, e.g. `TeacherA_classroom_data_v10_log.xlsx`.
+Dates limit the log exports and set the attendance report's range (default: the last 7 days).
+"layout" (not exported by default) draws the seating chart to a PNG with layout_renderer.py,
+with group colors and conditional formatting (checked in the file's saved mode, outside live sessions)
+but without the recent logs shown on the boxes of the running app.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, timedelta
+
+EXPORT_FORMATS = ("xlsx", "csv", "attendance", "layout")
+DEFAULT_FORMATS = ("xlsx", "csv", "attendance")
+DEFAULT_ATTENDANCE_DAYS = 7
+DATA_FILE_PATTERN = "classroom_data*.json"
+
+
+def find_data_files(paths):
+    """The data files given directly or found (recursively) in the given folders, without duplicates."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, "**", DATA_FILE_PATTERN), recursive=True)))
+        else:
+            files.append(path)
+    return list(dict.fromkeys(os.path.abspath(f) for f in files))
+
+
+def output_prefix(data_file):
+    """`<folder>_<name>` of a data file, since every teacher's file has the same name."""
+    folder_name = os.path.basename(os.path.dirname(data_file)) or "data"
+    return f"{folder_name}_{os.path.splitext(os.path.basename(data_file))[0]}"
+
+
+def export_filter_settings(start_date, end_date):
+    """The Export Log dialog's filters for all students, logs and summaries between two dates (None = open)."""
+    return {"start_date": start_date, "end_date": end_date,
+            "selected_students": "all", "student_ids": [],
+            "selected_behaviors": "all", "behaviors_list": [],
+            "selected_homework_types": "all", "homework_types_list": [],
+            "include_behavior_logs": True, "include_quiz_logs": True, "include_homework_logs": True,
+            "include_summaries": True, "separate_sheets_by_log_type": True, "excel_export_master_log_by_default": True}
+
+
+def process_file(data_file, output_dir, formats, start_date, end_date, dpi=None):
+    """
+    Loads one data file and writes the requested exports. Runs in a worker process.
+
+    :return: Dict with the file, its log count, the written files and the seconds per step, or "error".
+    """
+    import contextlib
+    import io
+    from export_jobs import ExportJob
+    from seatingchartmain import ClassroomData
+    result = {"file": data_file, "outputs": [], "seconds": {}}
+    started = time.perf_counter()
+    classroom = ClassroomData()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()): # Migrations report on stdout
+            classroom.load_file(data_file)
+    except Exception as e:
+        result["error"] = f"Could not load: {type(e).__name__}: {e}"
+        return result
+    result["seconds"]["load"] = time.perf_counter() - started
+    result["logs"] = len(classroom.behavior_log) + len(classroom.homework_log)
+    result["students"] = len(classroom.students)
+
+    prefix = os.path.join(output_dir, output_prefix(data_file))
+    filter_settings = export_filter_settings(start_date, end_date)
+    attendance_start = start_date or (end_date or date.today()) - timedelta(days=DEFAULT_ATTENDANCE_DAYS - 1)
+    attendance_end = end_date or date.today()
+    exports = {
+        "xlsx": (f"{prefix}_log.xlsx", lambda path, job: classroom.export_data_to_excel(path, "xlsx", dict(filter_settings), job=job)),
+        "csv": (f"{prefix}_log.zip", lambda path, job: classroom.export_data_to_csv_zip(path, dict(filter_settings), job=job)),
+        "attendance": (f"{prefix}_attendance.xlsx", lambda path, job: classroom.export_attendance_to_excel(
+            path, classroom.generate_attendance_data(attendance_start, attendance_end, list(classroom.students)),
+            attendance_start, attendance_end, job=job)),
+        "layout": (f"{prefix}_layout.png", lambda path, job: render_layout(
+            classroom.build_layout_scene(), path, dpi or int(classroom.settings.get("output_dpi", 600)), job=job)),
+    }
+    if "layout" in formats:
+        from layout_renderer import render_layout
+    for export_format in formats:
+        path, export = exports[export_format]
+        step_started = time.perf_counter()
+        # Run as an ExportJob so errors are raised and reported here instead of in message boxes
+        job = ExportJob(export_format, lambda job, path=path, export=export: export(path, job))
+        job.run()
+        result["seconds"][export_format] = time.perf_counter() - step_started
+        if job.error is not None:
+            result.setdefault("export_errors", []).append(f"{export_format}: {type(job.error).__name__}: {job.error}")
+        else:
+            result["outputs"].append(path)
+    result["seconds"]["total"] = time.perf_counter() - started
+    return result
+
+
+def parse_date(text):
+    return date.fromisoformat(text) if text else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export classroom data files to Excel/CSV logs, attendance reports and layout images without the GUI.")
+    parser.add_argument("paths", nargs="+", help="Data files, or folders to search for classroom_data*.json")
+    parser.add_argument("--output-dir", required=True, help="Folder for the exported files (created if needed)")
+    parser.add_argument("--formats", default=",".join(DEFAULT_FORMATS), help=f"Comma-separated, any of {', '.join(EXPORT_FORMATS)} (default: {','.join(DEFAULT_FORMATS)})")
+    parser.add_argument("--start", type=parse_date, help="First day (YYYY-MM-DD) of the exported logs and attendance report")
+    parser.add_argument("--end", type=parse_date, help="Last day (YYYY-MM-DD) of the exported logs and attendance report")
+    parser.add_argument("--dpi", type=int, help="Resolution of layout images (default: each file's image export setting)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Number of worker processes (default: CPU count)")
+    args = parser.parse_args(argv)
+
+    formats = [f.strip() for f in args.formats.split(",") if f.strip()]
+    unknown = [f for f in formats if f not in EXPORT_FORMATS]
+    if unknown: parser.error(f"Unknown format(s): {', '.join(unknown)}")
+    data_files = find_data_files(args.paths)
+    if not data_files:
+        print("No data files found.", file=sys.stderr); return 1
+    os.makedirs(args.output_dir, exist_ok=True)
+
+    started = time.perf_counter()
+    results, failed = [], 0
+    workers = max(1, min(args.workers, len(data_files)))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(process_file, f, args.output_dir, formats, args.start, args.end, args.dpi) for f in data_files]
+        for future in as_completed(futures):
+            result = future.result()
+            results.append(result)
+            if "error" in result or "export_errors" in result:
+                failed += 1
+                for error in [result.get("error")] + result.get("export_errors", []):
+                    if error: print(f"FAILED {result['file']}: {error}")
+            else:
+                print(f"{result['file']}: {result['logs']} logs, {result['students']} students, {result['seconds']['total']:.2f} s")
+    elapsed = time.perf_counter() - started
+    total_logs = sum(r.get("logs", 0) for r in results)
+    print(f"\n{len(results)} file(s) ({failed} with errors), {total_logs} logs in {elapsed:.2f} s: "
+          f"{len(results) / elapsed:.2f} files/s, {total_logs / elapsed:.0f} logs/s with {workers} worker(s)")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
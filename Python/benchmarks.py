@@ -0,0 +1,176 @@
+"""
+benchmarks.py: Headless benchmarks of the desktop app's hot paths at synthetic scales.
+
+For each scale (students x logs) a classroom is generated with
+`synthetic_classroom.py` into a temporary folder, the app is started against it
+with its Tk window withdrawn, and these methods are timed:
+
+    load_data, save_data_wrapper, draw_all_items, applies_to_conditional (every
+    student against every rule), export_data_to_excel, export_data_to_csv_zip,
+    generate_attendance_data (last 30 days)
+
+The app's data file paths are pointed at the temporary folder first, so the real
+app data is never read or written. Results are written as JSON; `--compare`
+prints the change of each median against an earlier results file.
+
+Usage:
+    python benchmarks.py [--scales 30x5000,60x50000] [--repeat 3] [--only load_data,draw_all_items]
+                         [--output results.json] [--compare baseline.json]
+
+Tk needs a display; on a Linux machine without one, run it under `xvfb-run`.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from synthetic_classroom import generate_classroom, write_classroom
+
+DEFAULT_SCALES = "30x1000,30x10000,60x50000"
+# Module constants of seatingchartmain holding the paths of the app's files
+APP_FILE_CONSTANTS = ("DATA_FILE", "CUSTOM_BEHAVIORS_FILE", "CUSTOM_HOMEWORK_TYPES_FILE", "CUSTOM_HOMEWORK_STATUSES_FILE",
+                      "AUTOSAVE_EXCEL_FILE", "LAYOUT_TEMPLATES_DIR", "UNDO_HISTORY_FILE", "STUDENT_GROUPS_FILE",
+                      "QUIZ_TEMPLATES_FILE", "HOMEWORK_TEMPLATES_FILE", "LOCK_FILE_PATH", "LAYOUT_SNAPSHOT_FILE")
+# The filters of the periodic Excel autosave: everything, with summaries and separate sheets
+EXPORT_FILTER_SETTINGS = {
+    "start_date": None, "end_date": None,
+    "selected_students": "all", "student_ids": [],
+    "selected_behaviors": "all", "behaviors_list": [],
+    "selected_homework_types": "all", "homework_types_list": [],
+    "include_behavior_logs": True, "include_quiz_logs": True, "include_homework_logs": True,
+    "include_summaries": True, "separate_sheets_by_log_type": True, "excel_export_master_log_by_default": True
+}
+ATTENDANCE_DAYS = 30
+
+
+def parse_scales(text):
+    """"30x5000,60x50000" -> [(30, 5000), (60, 50000)]"""
+    scales = []
+    for part in text.split(","):
+        students, _, logs = part.strip().partition("x")
+        scales.append((int(students), int(logs)))
+    return scales
+
+
+def redirect_app_files(app_module, folder):
+    """Points the app's file path constants at `folder`."""
+    for name in APP_FILE_CONSTANTS:
+        setattr(app_module, name, os.path.join(folder, os.path.basename(getattr(app_module, name))))
+    os.makedirs(app_module.LAYOUT_TEMPLATES_DIR, exist_ok=True)
+
+
+def time_function(function, repeat):
+    """Runs `function` `repeat` times. :return: Dict of the run times and their min/median in ms."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        runs.append((time.perf_counter() - start) * 1000)
+    return {"runs_ms": [round(run, 2) for run in runs], "min_ms": round(min(runs), 2), "median_ms": round(statistics.median(runs), 2)}
+
+
+def app_benchmarks(app, folder):
+    """The benchmarked operations of a started app, as name -> callable."""
+    student_ids = list(app.students)
+    rules = app.settings.get("conditional_formatting_rules", [])
+    end_date = datetime.now().date()
+    start_date = end_date - timedelta(days=ATTENDANCE_DAYS)
+
+    def check_conditional_rules():
+        for student_id in student_ids:
+            for rule in rules: app.applies_to_conditional(student_id, rule)
+
+    return {
+        "load_data": app.load_data,
+        "save_data_wrapper": lambda: app.save_data_wrapper(source="autosave"),
+        "draw_all_items": app.draw_all_items,
+        "applies_to_conditional": check_conditional_rules,
+        "export_data_to_excel": lambda: app.export_data_to_excel(os.path.join(folder, "benchmark_export.xlsx"), "xlsx",
+                                                                 dict(EXPORT_FILTER_SETTINGS), is_autosave=True),
+        "export_data_to_csv_zip": lambda: app.export_data_to_csv_zip(os.path.join(folder, "benchmark_export.zip"), dict(EXPORT_FILTER_SETTINGS)),
+        "generate_attendance_data": lambda: app.generate_attendance_data(start_date, end_date, student_ids),
+    }
+
+
+def run_scale(app_module, num_students, num_logs, repeat, only=None, seed=0):
+    """Benchmarks one scale in a fresh temporary app data folder. :return: name -> timings (or {"error": ...})."""
+    import tkinter as tk
+    results = {}
+    with tempfile.TemporaryDirectory() as folder:
+        redirect_app_files(app_module, folder)
+        write_classroom(generate_classroom(num_students, num_logs, seed=seed), app_module.DATA_FILE)
+        root = tk.Tk()
+        root.withdraw()
+        app = None
+        try:
+            with contextlib.redirect_stdout(io.StringIO()): # The app reports loads and saves on stdout
+                app = app_module.SeatingChartApp(root)
+                app.wait_for_full_load()
+                root.update_idletasks()
+                for name, function in app_benchmarks(app, folder).items():
+                    if only and name not in only: continue
+                    try:
+                        results[name] = time_function(function, repeat)
+                    except Exception as e: # e.g. openpyxl not installed; the other benchmarks still run
+                        results[name] = {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            if app is not None: app.file_lock_manager.release_lock()
+            root.destroy()
+    return results
+
+
+def compare(results, baseline):
+    """Prints the change of each median against a baseline results dict."""
+    for scale, scale_results in results["scales"].items():
+        baseline_scale = baseline.get("scales", {}).get(scale)
+        if not baseline_scale: continue
+        print(f"{scale} (vs {baseline.get('app_version', '?')} at {baseline.get('timestamp', '?')}):")
+        for name, timing in scale_results["results"].items():
+            old = baseline_scale["results"].get(name, {})
+            if "median_ms" not in timing or not old.get("median_ms"): continue
+            change = (timing["median_ms"] / old["median_ms"] - 1) * 100
+            print(f"  {name:28} {old['median_ms']:10.1f} ms -> {timing['median_ms']:10.1f} ms  ({change:+.0f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the desktop app's hot paths on synthetic classrooms.")
+    parser.add_argument("--scales", default=DEFAULT_SCALES, help=f"Comma-separated STUDENTSxLOGS (default {DEFAULT_SCALES})")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per benchmark (the median is reported)")
+    parser.add_argument("--only", default="", help="Comma-separated benchmark names to run")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write the JSON results here (default: print them)")
+    parser.add_argument("--compare", help="Results file of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    import seatingchartmain
+    only = {name.strip() for name in args.only.split(",") if name.strip()}
+    results = {"app_version": seatingchartmain.APP_VERSION, "timestamp": datetime.now().isoformat(timespec='seconds'),
+               "python": platform.python_version(), "platform": platform.platform(), "repeat": args.repeat, "scales": {}}
+    for num_students, num_logs in parse_scales(args.scales):
+        print(f"Benchmarking {num_students} students x {num_logs} logs...", file=sys.stderr)
+        results["scales"][f"{num_students}x{num_logs}"] = {
+            "students": num_students, "logs": num_logs,
+            "results": run_scale(seatingchartmain, num_students, num_logs, args.repeat, only, args.seed)
+        }
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(results, indent=2))
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
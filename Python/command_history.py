@@ -0,0 +1,327 @@
+"""
+command_history.py: Paged undo/redo history kept in its own append-only file.
+
+The undo and redo stacks used to be serialized into the main data file on every
+save and fully rebuilt into live `Command` objects on load. Now each command is
+written once to a separate history file as one line:
+
+    <seq>\t<timestamp>\t<command type>\t<description>\t<payload>
+
+where the payload is the command's `to_dict()` JSON and the description its
+`get_description()` text, both Fernet-encrypted when data file encryption is on.
+The header fields let the history dialog list and filter entries without
+rebuilding their commands. The main data file only stores the sequence numbers of
+the entries on each stack. Lines are only ever appended; a command whose state
+changed (e.g. after undo/redo) is appended again under the same sequence number
+and the last line wins. The file is compacted to the live entries when it has
+accumulated enough garbage.
+
+`PagedCommandStack` is a list-like stack of history entries. Only the most
+recent entries are kept as live `Command` objects; older ones are read back from
+the file (paged in) when an undo reaches them or the history dialog shows them.
+"""
+
+import json
+import os
+import zlib
+
+from commands import Command
+from data_encryption import encrypt_data, decrypt_data
+from log_records import json_default
+
+RESIDENT_COMMAND_LIMIT = 50 # Most recent commands per stack kept as live Command objects
+MIN_COMPACTION_GARBAGE_BYTES = 256 * 1024
+ARCHIVING_COMMAND_TYPES = ("DeleteItemCommand", "CompositeCommand") # Record types that can refer to app.log_archive
+
+
+def _digest(serialized):
+    return zlib.crc32(serialized.encode('utf-8'))
+
+
+class HistoryEntryUnavailableError(Exception):
+    """Raised when undoing or redoing a history entry whose record could not be read back."""
+
+
+class CommandHistoryStore:
+    """
+    The append-only history file with an in-memory index of seq -> (offset, length, timestamp, type, description).
+
+    :param path: Path of the history file.
+    :param should_encrypt: Callable returning whether new records should be encrypted.
+    """
+    def __init__(self, path, should_encrypt=lambda: True):
+        self.path = path
+        self.should_encrypt = should_encrypt
+        self.index = {}
+        self.next_seq = 1
+        self.file_size = 0
+        self.open()
+
+    def open(self):
+        """(Re)builds the index by scanning the record headers; payloads are not decoded."""
+        self.index.clear(); self.next_seq = 1; self.file_size = 0
+        if not os.path.exists(self.path): return
+        offset = 0
+        with open(self.path, 'rb') as f:
+            for line in f:
+                parts = line.split(b"\t", 4)
+                if len(parts) == 5 and line.endswith(b"\n"): # A torn last line (crash mid-write) is ignored
+                    try:
+                        seq = int(parts[0])
+                        self.index[seq] = (offset, len(line), parts[1].decode('utf-8'), parts[2].decode('utf-8'), parts[3])
+                        self.next_seq = max(self.next_seq, seq + 1)
+                    except ValueError: pass
+                offset += len(line)
+        self.file_size = offset
+
+    def __contains__(self, seq):
+        return seq in self.index
+
+    def timestamp(self, seq): return self.index[seq][2]
+    def record_size(self, seq): return self.index[seq][1]
+    def command_type(self, seq): return self.index[seq][3]
+
+    def description(self, seq):
+        """The stored description of `seq`, decrypted if needed ("" if unavailable)."""
+        import cryptography.fernet
+        raw = self.index[seq][4]
+        try: return (raw if raw.startswith(b"=") else decrypt_data(raw).encode('utf-8'))[1:].decode('utf-8')
+        except (ValueError, cryptography.fernet.InvalidToken): return ""
+
+    def _encode(self, seq, command_dict, serialized, description):
+        # Plain descriptions get a "=" marker (never the first character of a Fernet token); tabs/newlines would break the line
+        description = "=" + description.replace("\t", " ").replace("\n", " ")
+        if self.should_encrypt():
+            description, payload = encrypt_data(description), encrypt_data(serialized)
+        else:
+            description, payload = description.encode('utf-8'), serialized.encode('utf-8')
+        header = f"{seq}\t{command_dict.get('timestamp', '')}\t{command_dict.get('type', '')}\t".encode('utf-8')
+        return header + description + b"\t" + payload + b"\n", description
+
+    def write(self, command_dict, seq=None, serialized=None, description=""):
+        """
+        Appends a record and returns its sequence number.
+
+        :param seq: Existing sequence number to supersede, or None to allocate a new one.
+        :param serialized: The JSON text of `command_dict`, if already computed.
+        :param description: The command's description, shown in the history dialog.
+        """
+        if seq is None:
+            seq = self.next_seq; self.next_seq += 1
+        line, stored_description = self._encode(seq, command_dict, serialized or json.dumps(command_dict, default=json_default), description)
+        with open(self.path, 'ab') as f:
+            f.write(line)
+        self.index[seq] = (self.file_size, len(line), command_dict.get('timestamp', ''), command_dict.get('type', ''), stored_description)
+        self.file_size += len(line)
+        return seq
+
+    def read(self, seq):
+        """Returns the serialized command dict of `seq`, or None if it is missing or unreadable."""
+        import cryptography.fernet
+        entry = self.index.get(seq)
+        if entry is None: return None
+        offset, length = entry[:2]
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(offset); line = f.read(length)
+            payload = line.split(b"\t", 4)[4].rstrip(b"\n")
+            if not payload.startswith(b"{"): payload = decrypt_data(payload)
+            return json.loads(payload)
+        except (OSError, IndexError, ValueError, cryptography.fernet.InvalidToken) as e:
+            print(f"Warning: Could not read undo history entry {seq}: {e}")
+            return None
+
+    def live_size(self, seqs):
+        return sum(self.index[seq][1] for seq in seqs if seq in self.index)
+
+    def compact(self, live_seqs):
+        """Rewrites the file with only the records of `live_seqs` (in order), atomically replacing it."""
+        temp_path = self.path + ".tmp"
+        new_index, offset = {}, 0
+        with open(self.path, 'rb') as src, open(temp_path, 'wb') as dst:
+            for seq in live_seqs:
+                entry = self.index.get(seq)
+                if entry is None or seq in new_index: continue
+                src.seek(entry[0]); line = src.read(entry[1])
+                dst.write(line)
+                new_index[seq] = (offset, len(line)) + entry[2:]; offset += len(line)
+        os.replace(temp_path, self.path)
+        self.index, self.file_size = new_index, offset
+
+    def maybe_compact(self, live_seqs):
+        """Compacts when the superseded and dropped records outweigh the live ones."""
+        garbage = self.file_size - self.live_size(live_seqs)
+        if garbage > max(MIN_COMPACTION_GARBAGE_BYTES, self.file_size // 2):
+            self.compact(live_seqs)
+
+    def reset(self):
+        """Deletes the file and forgets all records."""
+        if os.path.exists(self.path): os.remove(self.path)
+        self.open()
+
+
+class PagedCommandStack:
+    """
+    A list-like undo or redo stack whose older commands live only in the history store.
+
+    Each entry is [seq, command, digest]: `seq` is the record in the store (None until written),
+    `command` the live Command or None while paged out, and `digest` a checksum of the
+    serialization that was written, used to append a new record only when a command changed.
+
+    :param app: The main SeatingChartApp instance (needed to rebuild commands).
+    :param store: The CommandHistoryStore shared by the undo and redo stacks.
+    :param resident_limit: Number of most recent commands kept in memory.
+    """
+    def __init__(self, app, store, resident_limit=RESIDENT_COMMAND_LIMIT):
+        self.app = app
+        self.store = store
+        self.resident_limit = resident_limit
+        self._entries = []
+        self._descriptions = {} # seq -> description of paged-out entries, so the history dialog decrypts each once
+
+    # --- List protocol ---
+    def __len__(self): return len(self._entries)
+    def __bool__(self): return bool(self._entries)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._materialize(entry) for entry in self._entries[index]]
+        return self._materialize(self._entries[index])
+
+    def __delitem__(self, index):
+        del self._entries[index]
+
+    def __iter__(self):
+        for entry in list(self._entries): yield self._materialize(entry)
+
+    def __reversed__(self):
+        for entry in reversed(list(self._entries)): yield self._materialize(entry)
+
+    def append(self, command):
+        # A command moved between the stacks keeps its record; it is rewritten on save only if it changed
+        seq, digest = getattr(command, "history_seq", None), getattr(command, "history_digest", None)
+        self._entries.append([seq, command, digest])
+
+    def pop(self):
+        entry = self._entries[-1]
+        command = self._materialize(entry)
+        self._entries.pop()
+        command.history_seq, command.history_digest = entry[0], entry[2]
+        return command
+
+    def clear(self):
+        self._entries.clear()
+
+    # --- Paging ---
+    def _materialize(self, entry):
+        if entry[1] is None:
+            command_dict = self.store.read(entry[0])
+            command = Command.from_dict(self.app, command_dict) if command_dict else None
+            if command is None: command = _MissingHistoryCommand(self.app, entry[0], command_dict)
+            entry[1] = command
+        return entry[1]
+
+    def is_resident(self, index):
+        return self._entries[index][1] is not None
+
+    def timestamp(self, index):
+        """The timestamp of an entry, read from the index without paging it in if possible."""
+        seq, command, _ = self._entries[index]
+        if command is not None: return command.timestamp
+        return self.store.timestamp(seq) if seq in self.store else ""
+
+    def command_type(self, index):
+        """The command class name of an entry, without paging it in."""
+        seq, command, _ = self._entries[index]
+        if command is not None: return type(command).__name__
+        return self.store.command_type(seq) if seq in self.store else "Unknown"
+
+    def description(self, index):
+        """The description of an entry, from the record header (cached) when it is paged out."""
+        seq, command, _ = self._entries[index]
+        if command is not None: return command.get_description()
+        if seq not in self._descriptions:
+            self._descriptions[seq] = (self.store.description(seq) if seq in self.store else "") or self.command_type(index)
+        return self._descriptions[seq]
+
+    def flush(self):
+        """
+        Writes new and changed resident commands to the store and pages out all but the most recent ones.
+
+        :return: The list of sequence numbers on this stack, oldest first.
+        """
+        for position, entry in enumerate(self._entries):
+            command = entry[1]
+            if command is None or isinstance(command, _MissingHistoryCommand): continue
+            command_dict = command.to_dict()
+            serialized = json.dumps(command_dict, default=json_default)
+            digest = _digest(serialized)
+            if entry[0] is None or digest != entry[2]:
+                entry[0] = self.store.write(command_dict, seq=entry[0], serialized=serialized, description=command.get_description())
+                entry[2] = digest
+                self._descriptions.pop(entry[0], None)
+            command.history_seq, command.history_digest = entry[0], entry[2]
+            if position < len(self._entries) - self.resident_limit: entry[1] = None
+        return self.seqs()
+
+    def seqs(self):
+        """The sequence numbers of the entries already written to the store, oldest first."""
+        return [entry[0] for entry in self._entries if entry[0] is not None]
+
+    def load(self, seqs):
+        """Replaces the stack with paged-out entries for `seqs` (unknown sequence numbers are skipped)."""
+        self._entries = [[seq, None, None] for seq in seqs if seq in self.store]
+        self._descriptions.clear()
+
+
+class _MissingHistoryCommand(Command):
+    """Placeholder for a history entry whose record could not be read or whose command type is unknown."""
+    def __init__(self, app, seq, command_dict=None):
+        super().__init__(app, (command_dict or {}).get('timestamp'))
+        self.history_seq = seq
+        self.command_type = (command_dict or {}).get('type', "Unknown")
+    def execute(self): raise HistoryEntryUnavailableError(f"{self.get_description()}: its undo history record could not be read, so it cannot be redone.")
+    def undo(self): raise HistoryEntryUnavailableError(f"{self.get_description()}: its undo history record could not be read, so it cannot be undone.")
+    def to_dict(self): return None
+    def get_description(self): return f"{self.command_type} (unavailable)"
+
+
+def apply_retention(store, undo_seqs, redo_seqs, cutoff_timestamp, max_bytes):
+    """
+    Applies the day- and size-based history limits.
+
+    Entries older than `cutoff_timestamp` are dropped, then the oldest undo entries are dropped
+    until the records of both stacks fit in `max_bytes` (the redo stack, being newer, goes last).
+
+    :return: The retained (undo_seqs, redo_seqs).
+    """
+    def recent(seqs): return [seq for seq in seqs if seq in store and store.timestamp(seq) >= cutoff_timestamp]
+    undo_seqs, redo_seqs = recent(undo_seqs), recent(redo_seqs)
+    budget = max_bytes
+    kept_redo = []
+    for seq in reversed(redo_seqs):
+        budget -= store.record_size(seq)
+        if budget < 0: break
+        kept_redo.append(seq)
+    kept_undo = []
+    for seq in reversed(undo_seqs):
+        budget -= store.record_size(seq)
+        if budget < 0: break
+        kept_undo.append(seq)
+    return kept_undo[::-1], kept_redo[::-1]
+
+
+def archive_keys(store, seqs):
+    """
+    The log archive keys (see `DeleteItemCommand`) referenced by the records of `seqs`, including
+    deletions grouped in a `CompositeCommand`. Only records of those two types are read.
+    """
+    keys = set()
+    def collect(command_dict):
+        if not isinstance(command_dict, dict): return
+        data = command_dict.get("data") or {}
+        if command_dict.get("type") == "DeleteItemCommand" and data.get("archive_key"): keys.add(data["archive_key"])
+        for sub_command in data.get("commands", []): collect(sub_command)
+    for seq in seqs:
+        if seq in store and store.command_type(seq) in ARCHIVING_COMMAND_TYPES: collect(store.read(seq))
+    return keys
@@ -1,6 +1,10 @@
 import os
 import sys
+from bisect import bisect_left, bisect_right, insort_right
+from collections import Counter
 from datetime import datetime
+from log_stats import HOMEWORK_LOG_TYPES
+from render_cache import without_render_fields
 import tkinter as tk
 
 # def listener(callback: typing.Callable[[str], None]) -> None: ...
@@ -257,6 +261,48 @@ class Command:
         raise NotImplementedError
 
 
+class CompositeCommand(Command):
+    """
+    Command that groups several commands into a single undoable action.
+
+    The children are executed in order and undone in reverse order inside
+    `app.batched_updates()`, so the redraws they each request collapse into one
+    repaint, and `execute_command` saves the group once. The group is applied
+    all-or-nothing: if a child fails, the children already applied are reverted
+    before the error is re-raised.
+
+    :param commands: The child Command instances, in execution order.
+    :param description: Optional text shown for the group in the undo history.
+    """
+    def __init__(self, app, commands, description="", timestamp=None):
+        super().__init__(app, timestamp)
+        self.commands = list(commands)
+        self.description = description
+
+    def execute(self):
+        self._apply(self.commands, lambda command: command.execute(), lambda command: command.undo())
+
+    def undo(self):
+        self._apply(list(reversed(self.commands)), lambda command: command.undo(), lambda command: command.execute())
+
+    def _apply(self, commands, forward, rollback):
+        with self.app.batched_updates():
+            applied = []
+            try:
+                for command in commands:
+                    forward(command); applied.append(command)
+            except Exception:
+                for command in reversed(applied): rollback(command)
+                raise
+
+    def _get_data_for_serialization(self):
+        return {'commands': [command.to_dict() for command in self.commands], 'description': self.description}
+    @classmethod
+    def _from_serializable_data(cls, app, data, timestamp):
+        commands = [Command.from_dict(app, command_data) for command_data in data['commands']]
+        return cls(app, [command for command in commands if command is not None], data.get('description', ""), timestamp)
+    def get_description(self):
+        return self.description or f"{len(self.commands)} grouped action(s)"
 
 
 class MoveGuideCommand(Command):
@@ -468,7 +514,7 @@ class AddItemCommand(Command):
 
     def _get_data_for_serialization(self): return {'item_id': self.item_id, 'item_type': self.item_type, 'item_data': self.item_data, 'old_next_id_num': self.old_next_id_num}
     @classmethod
-    def _from_serializable_data(cls, app, data, timestamp): return cls(app, data['item_id'], data['item_type'], data['item_data'], data['old_next_id_num'], timestamp)
+    def _from_serializable_data(cls, app, data, timestamp): return cls(app, data['item_id'], data['item_type'], without_render_fields(data['item_data']), data['old_next_id_num'], timestamp)
     def get_description(self):
         item_name = self.item_data.get('full_name', self.item_data.get('name', self.item_id))
         return f"Add {self.item_type}: {item_name}"
@@ -477,27 +523,29 @@ class DeleteItemCommand(Command):
     """
     Command to delete a student or furniture item.
 
-    This is a "High-Integrity" command. When a student is deleted, it doesn't
-    just remove the student record; it captures a complete snapshot of all
-    associated behavioral, quiz, and homework logs. This ensures that undoing
-    a deletion restores the student's entire history, maintaining data continuity.
+    This is a "High-Integrity" command. When a student is deleted, their behavioral,
+    quiz, and homework logs are moved out of the logs into `app.log_archive` under
+    this command's archive key, and moved back on undo. This ensures that undoing
+    a deletion restores the student's entire history, maintaining data continuity,
+    while the command itself (and so the undo history) only holds the archive key.
+
+    The student's entries are found through `app.log_stats` and located in the sorted
+    logs by bisection, and each log is then rebuilt once, so deleting or restoring a
+    student with k logs costs O(k log n) lookups plus one O(n) pass per log.
 
     :param item_id: The unique identifier of the item to delete.
     :param item_type: The type of item ('student' or 'furniture').
     :param item_data: A snapshot of the item's properties before deletion.
-    :param associated_logs: A list of behavior/quiz log snapshots (student-only).
+    :param associated_logs: Behavior/quiz log snapshots; only present in histories saved before the log archive.
     """
     def __init__(self, app, item_id, item_type, item_data, associated_logs=None, timestamp=None):
         super().__init__(app, timestamp)
         self.item_id = item_id
         self.item_type = item_type
         self.item_data = item_data
-        self.associated_logs = associated_logs or [] # For behavior and quiz logs
-        self.associated_homework_logs = [] # New for homework logs
-
-        if item_type == 'student': # Separate homework logs for students
-            self.associated_homework_logs = [log.copy() for log in app.homework_log if log["student_id"] == item_id]
-
+        self.archive_key = f"{item_id}@{self.timestamp}"
+        self.associated_logs = associated_logs or [] # Legacy snapshots, used if the archive entry is missing
+        self.associated_homework_logs = []
 
     def execute(self):
         data_source = self.app.students if self.item_type == 'student' else self.app.furniture
@@ -509,15 +557,13 @@ class DeleteItemCommand(Command):
         if self.item_id in self.app.selected_items: self.app.selected_items.remove(self.item_id)
 
         if self.item_type == 'student':
-            original_log_count = len(self.app.behavior_log)
-            self.app.behavior_log = [log for log in self.app.behavior_log if log["student_id"] != self.item_id]
-            logs_removed_count = original_log_count - len(self.app.behavior_log)
-
-            original_homework_log_count = len(self.app.homework_log)
-            self.app.homework_log = [log for log in self.app.homework_log if log["student_id"] != self.item_id]
-            homework_logs_removed_count = original_homework_log_count - len(self.app.homework_log)
+            student_entries = self.app.log_stats.student_entries(self.item_id)
+            removed_logs = _remove_log_entries(self.app.behavior_log, [e for e in student_entries if e.get("type") not in HOMEWORK_LOG_TYPES])
+            removed_homework_logs = _remove_log_entries(self.app.homework_log, [e for e in student_entries if e.get("type") in HOMEWORK_LOG_TYPES])
+            self.app.log_stats.remove_entries(removed_logs); self.app.log_stats.remove_entries(removed_homework_logs)
+            self.app.log_archive[self.archive_key] = {"behavior_log": removed_logs, "homework_log": removed_homework_logs}
 
-            self.app.update_status(f"Student '{item_name}', {logs_removed_count} behavior/quiz log(s), and {homework_logs_removed_count} homework log(s) deleted.")
+            self.app.update_status(f"Student '{item_name}', {len(removed_logs)} behavior/quiz log(s), and {len(removed_homework_logs)} homework log(s) deleted.")
         else:
             self.app.update_status(f"Furniture '{item_name}' deleted.")
         self.app.draw_all_items(check_collisions_on_redraw=True)
@@ -527,13 +573,11 @@ class DeleteItemCommand(Command):
         data_source[self.item_id] = self.item_data.copy()
         if self.item_type == 'student':
             self.app.update_student_display_text(self.item_id)
-            for log_entry in self.associated_logs:
-                if log_entry not in self.app.behavior_log: self.app.behavior_log.append(log_entry.copy())
-            self.app.behavior_log.sort(key=lambda x: x.get("timestamp", ""))
-
-            for hw_log_entry in self.associated_homework_logs: # Restore homework logs
-                if hw_log_entry not in self.app.homework_log: self.app.homework_log.append(hw_log_entry.copy())
-            self.app.homework_log.sort(key=lambda x: x.get("timestamp", ""))
+            archived = self.app.log_archive.pop(self.archive_key, None)
+            if archived is None: # Deleted before the log archive existed: the logs were snapshotted into the command
+                archived = {"behavior_log": self.associated_logs, "homework_log": self.associated_homework_logs}
+            self.app.log_stats.add_entries(_insert_log_entries_sorted(self.app.behavior_log, archived.get("behavior_log", []), self.app.log_records))
+            self.app.log_stats.add_entries(_insert_log_entries_sorted(self.app.homework_log, archived.get("homework_log", []), self.app.log_records)) # Restore homework logs
 
             self.app.update_status(f"Undid delete of student '{self.item_data['full_name']}'. Logs restored.")
         else:
@@ -541,26 +585,92 @@ class DeleteItemCommand(Command):
         self.app.draw_all_items(check_collisions_on_redraw=True)
 
     def _get_data_for_serialization(self):
-        return {
-            'item_id': self.item_id, 'item_type': self.item_type,
-            'item_data': self.item_data, 'associated_logs': self.associated_logs,
-            'associated_homework_logs': self.associated_homework_logs # Serialize homework logs
-        }
+        data = {'item_id': self.item_id, 'item_type': self.item_type, 'item_data': self.item_data, 'archive_key': self.archive_key}
+        if self.associated_logs or self.associated_homework_logs: # Keep legacy snapshots until the command leaves the history
+            data['associated_logs'] = self.associated_logs
+            data['associated_homework_logs'] = self.associated_homework_logs
+        return data
     @classmethod
     def _from_serializable_data(cls, app, data, timestamp):
-        cmd = cls(app, data['item_id'], data['item_type'], data['item_data'], data.get('associated_logs'), timestamp)
-        cmd.associated_homework_logs = data.get('associated_homework_logs', []) # Deserialize homework logs
+        cmd = cls(app, data['item_id'], data['item_type'], without_render_fields(data['item_data']), data.get('associated_logs'), timestamp)
+        cmd.associated_homework_logs = data.get('associated_homework_logs', [])
+        cmd.archive_key = data.get('archive_key', cmd.archive_key)
         return cmd
     def get_description(self):
         item_name = self.item_data.get('full_name', self.item_data.get('name', self.item_id))
         return f"Delete {self.item_type}: {item_name}"
 
+def _log_timestamp_key(log_entry):
+    return log_entry.get("timestamp", "")
+
+def _insert_log_entry_sorted(log, log_entry, records):
+    """
+    Inserts `log_entry`, as a LogRecord of `records`, into a timestamp-sorted log unless an identical entry exists.
+
+    Equal entries share a timestamp, so only that run of the log is compared, and the
+    insertion point is found by bisection instead of appending and re-sorting the log.
+    Like the stable sort it replaces, the new entry goes after entries with the same timestamp.
+
+    :param records: The app's LogRecordBook.
+    :return: The inserted record, or None if the entry was a duplicate.
+    """
+    timestamp = _log_timestamp_key(log_entry)
+    lo = bisect_left(log, timestamp, key=_log_timestamp_key)
+    hi = bisect_right(log, timestamp, lo=lo, key=_log_timestamp_key)
+    if any(log[i] == log_entry for i in range(lo, hi)): return None
+    record = records.make(log_entry)
+    insort_right(log, record, lo=lo, hi=hi, key=_log_timestamp_key)
+    return record
+
+def _insert_log_entries_sorted(log, log_entries, records):
+    """
+    Inserts several entries like `_insert_log_entry_sorted`, but re-sorts the log once instead of shifting it per entry.
+
+    The log is one sorted run and the new records another, so the stable sort merges them in O(n + k log k);
+    as with the single insert, new entries go after existing entries with the same timestamp.
+
+    :return: The inserted records (duplicates of existing or earlier entries are skipped).
+    """
+    new_records, pending = [], {} # timestamp -> entries inserted by this call
+    for log_entry in log_entries:
+        timestamp = _log_timestamp_key(log_entry)
+        lo = bisect_left(log, timestamp, key=_log_timestamp_key)
+        hi = bisect_right(log, timestamp, lo=lo, key=_log_timestamp_key)
+        same_time = pending.setdefault(timestamp, [])
+        if any(log[i] == log_entry for i in range(lo, hi)) or log_entry in same_time: continue
+        record = records.make(log_entry)
+        same_time.append(record); new_records.append(record)
+    if new_records:
+        log.extend(sorted(new_records, key=_log_timestamp_key))
+        log.sort(key=_log_timestamp_key)
+    return new_records
+
+def _remove_log_entries(log, log_entries):
+    """
+    Removes entries equal to `log_entries` from a timestamp-sorted log, locating each by bisection.
+
+    Several entries are removed by rebuilding the log once (O(n)) rather than deleting them one by one.
+
+    :return: The removed entries, in log order.
+    """
+    found = set()
+    for log_entry in log_entries:
+        timestamp = _log_timestamp_key(log_entry)
+        lo = bisect_left(log, timestamp, key=_log_timestamp_key)
+        hi = bisect_right(log, timestamp, lo=lo, key=_log_timestamp_key)
+        index = next((i for i in range(lo, hi) if i not in found and log[i] == log_entry), None)
+        if index is not None: found.add(index)
+    removed = [log[i] for i in sorted(found)]
+    if len(found) == 1: del log[next(iter(found))]
+    elif found: log[:] = [entry for i, entry in enumerate(log) if i not in found]
+    return removed
+
 class LogEntryCommand(Command):
     """
     Command to record a behavior or quiz incident for a student.
 
-    This command adds an entry to `app.behavior_log` and ensures the log
-    remains sorted chronologically by timestamp.
+    This command inserts an entry into `app.behavior_log` at its chronological
+    position, keeping the log sorted by timestamp.
 
     :param log_entry: A dictionary containing log details (type, behavior, timestamp, etc.).
     :param student_id: The ID of the student the log belongs to.
@@ -572,9 +682,8 @@ class LogEntryCommand(Command):
 
     def execute(self):
         # Behavior/Quiz logs go into self.app.behavior_log
-        if not any(le == self.log_entry for le in self.app.behavior_log):
-            self.app.behavior_log.append(self.log_entry.copy())
-            self.app.behavior_log.sort(key=lambda x: x.get("timestamp", ""))
+        record = _insert_log_entry_sorted(self.app.behavior_log, self.log_entry, self.app.log_records)
+        if record: self.app.log_stats.add_entry(record)
         self.app.update_student_display_text(self.student_id)
         log_type = self.log_entry.get("type", "behavior")
         behavior_name = self.log_entry.get("behavior", "Unknown")
@@ -582,14 +691,14 @@ class LogEntryCommand(Command):
         self.app.update_status(f"{log_type.capitalize()} '{behavior_name}' logged for {student_name}.")
 
     def undo(self):
-        try:
-            self.app.behavior_log.remove(self.log_entry)
-        except ValueError:
+        removed = _remove_log_entries(self.app.behavior_log, [self.log_entry])
+        if removed: self.app.log_stats.remove_entries(removed)
+        else:
             for i, entry in enumerate(self.app.behavior_log):
                 if entry["timestamp"] == self.log_entry["timestamp"] and \
                    entry["student_id"] == self.log_entry["student_id"] and \
                    entry["behavior"] == self.log_entry["behavior"]:
-                    del self.app.behavior_log[i]; break
+                    del self.app.behavior_log[i]; self.app.log_stats.remove_entry(entry); break
         self.app.update_student_display_text(self.student_id)
         log_type = self.log_entry.get("type", "behavior")
         behavior_name = self.log_entry.get("behavior", "Unknown")
@@ -621,24 +730,23 @@ class LogHomeworkEntryCommand(Command):
 
     def execute(self):
         # Homework logs go into self.app.homework_log
-        if not any(le == self.log_entry for le in self.app.homework_log):
-            self.app.homework_log.append(self.log_entry.copy())
-            self.app.homework_log.sort(key=lambda x: x.get("timestamp", ""))
+        record = _insert_log_entry_sorted(self.app.homework_log, self.log_entry, self.app.log_records)
+        if record: self.app.log_stats.add_entry(record)
         self.app.update_student_display_text(self.student_id) # Redraw student box
         homework_name = self.log_entry.get("homework_type", self.log_entry.get("behavior", "Unknown Homework")) # Use "homework_type" or "behavior"
         student_name = self.app.students.get(self.student_id, {}).get('full_name', 'Unknown Student')
         self.app.update_status(f"Homework '{homework_name}' logged for {student_name}.")
 
     def undo(self):
-        try:
-            self.app.homework_log.remove(self.log_entry)
-        except ValueError:
+        removed = _remove_log_entries(self.app.homework_log, [self.log_entry])
+        if removed: self.app.log_stats.remove_entries(removed)
+        else:
             for i, entry in enumerate(self.app.homework_log):
                  # Match based on key fields for homework
                 if entry["timestamp"] == self.log_entry["timestamp"] and \
                    entry["student_id"] == self.log_entry["student_id"] and \
                    entry.get("homework_type", entry.get("behavior")) == self.log_entry.get("homework_type", self.log_entry.get("behavior")):
-                    del self.app.homework_log[i]; break
+                    del self.app.homework_log[i]; self.app.log_stats.remove_entry(entry); break
         self.app.update_student_display_text(self.student_id)
         homework_name = self.log_entry.get("homework_type", self.log_entry.get("behavior", "Unknown Homework"))
         student_name = self.app.students.get(self.student_id, {}).get('full_name', 'Unknown Student')
@@ -652,6 +760,93 @@ class LogHomeworkEntryCommand(Command):
         hw_type = self.log_entry.get("homework_type", self.log_entry.get("behavior", "entry"))
         return f"Log Homework: '{hw_type}' for {student_name}"
 
+def _import_log_key(log_entry):
+    """Identity used to detect duplicate imported logs: (student_id, timestamp, behavior, type)."""
+    return (log_entry.get("student_id"), log_entry.get("timestamp"), log_entry.get("behavior"), log_entry.get("type", "behavior"))
+
+class ImportDataCommand(Command):
+    """
+    Command that adds a batch of imported students and behavior/quiz logs as one action.
+
+    Importing another teacher's workbook can produce thousands of rows. Executing them
+    as individual `AddItemCommand`/`LogEntryCommand`s would re-sort the log, save and
+    redraw once per row and flood the undo history. This command applies the whole
+    batch with a single sort and a single redraw, and `execute_command` saves it once.
+
+    :param students_data: Dictionary of new student ID -> student data.
+    :param log_entries: List of new behavior/quiz log entries (already de-duplicated).
+    :param old_next_id_num: The student ID counter before the import.
+    :param new_next_id_num: The student ID counter after the import.
+    :param source_name: Optional name of the imported file, for the history description.
+    :param added_log_keys: `_import_log_key`s of the log entries the last execute actually added
+                           (entries already in the log are skipped), so undo removes only those.
+    """
+    def __init__(self, app, students_data, log_entries, old_next_id_num, new_next_id_num, source_name="", timestamp=None, added_log_keys=None):
+        super().__init__(app, timestamp)
+        self.students_data = students_data
+        self.log_entries = log_entries
+        self.old_next_id_num = old_next_id_num
+        self.new_next_id_num = new_next_id_num
+        self.source_name = source_name
+        self.added_log_keys = added_log_keys
+
+    def execute(self):
+        for student_id, s_data in self.students_data.items():
+            self.app.students[student_id] = s_data.copy()
+        if self.students_data:
+            self.app.next_student_id_num = max(self.app.next_student_id_num, self.new_next_id_num)
+
+        existing_keys = {_import_log_key(log) for log in self.app.behavior_log}
+        added_logs = [log for log in self.log_entries if _import_log_key(log) not in existing_keys]
+        self.added_log_keys = [_import_log_key(log) for log in added_logs]
+        added_records = self.app.log_records.make_all(added_logs)
+        self.app.behavior_log.extend(added_records)
+        self.app.behavior_log.sort(key=lambda x: x.get("timestamp", "")) # One sort for the whole batch
+        self.app.log_stats.add_entries(added_records)
+
+        for student_id in set(self.students_data) | {log["student_id"] for log in added_logs}:
+            if student_id in self.app.students: self.app.update_student_display_text(student_id)
+        self.app.update_status(f"Imported {len(self.students_data)} student(s) and {len(added_logs)} log(s).")
+        self.app.draw_all_items(check_collisions_on_redraw=True)
+
+    def undo(self):
+        for student_id in self.students_data:
+            if student_id in self.app.students:
+                del self.app.students[student_id]
+                self.app.canvas.delete(student_id)
+                self.app.selected_items.discard(student_id)
+        if self.students_data: self.app.next_student_id_num = self.old_next_id_num
+
+        # Only the entries this import added, one per key; history saved before the keys were kept falls back to all of them
+        keys_to_remove = Counter(self.added_log_keys if self.added_log_keys is not None else map(_import_log_key, self.log_entries))
+        kept_logs, removed_logs = [], []
+        for log in self.app.behavior_log:
+            key = _import_log_key(log)
+            if keys_to_remove[key] > 0:
+                keys_to_remove[key] -= 1; removed_logs.append(log)
+            else: kept_logs.append(log)
+        self.app.behavior_log[:] = kept_logs
+        self.app.log_stats.remove_entries(removed_logs)
+
+        for student_id in {log["student_id"] for log in removed_logs}:
+            if student_id in self.app.students: self.app.update_student_display_text(student_id)
+        self.app.update_status(f"Undid import of {len(self.students_data)} student(s) and {len(removed_logs)} log(s).")
+        self.app.draw_all_items(check_collisions_on_redraw=True)
+
+    def _get_data_for_serialization(self):
+        return {'students_data': self.students_data, 'log_entries': self.log_entries,
+                'old_next_id_num': self.old_next_id_num, 'new_next_id_num': self.new_next_id_num,
+                'source_name': self.source_name, 'added_log_keys': self.added_log_keys}
+    @classmethod
+    def _from_serializable_data(cls, app, data, timestamp):
+        added_log_keys = data.get('added_log_keys')
+        return cls(app, data.get('students_data', {}), data.get('log_entries', []), data['old_next_id_num'],
+                   data['new_next_id_num'], data.get('source_name', ""), timestamp,
+                   [tuple(key) for key in added_log_keys] if added_log_keys is not None else None) # JSON turns the keys into lists
+    def get_description(self):
+        source = f" from {self.source_name}" if self.source_name else ""
+        return f"Import{source}: {len(self.students_data)} student(s), {len(self.log_entries)} log(s)"
+
 class EditItemCommand(Command):
     """
     Command to modify properties of an existing student or furniture item.
@@ -703,7 +898,7 @@ class EditItemCommand(Command):
     @classmethod
     def _from_serializable_data(cls, app, data, timestamp):
         return cls(app, data['item_id'], data['item_type'],
-                   data['old_item_data_snapshot'], data['new_item_data_changes'], timestamp)
+                   without_render_fields(data['old_item_data_snapshot']), without_render_fields(data['new_item_data_changes']), timestamp)
     def get_description(self):
         item_name = self.old_item_data_snapshot.get('full_name', self.old_item_data_snapshot.get('name', self.item_id))
         changed_keys = ", ".join(self.new_item_data_changes.keys())
@@ -12,15 +12,22 @@ The implementation currently relies on a shared 32-byte key imported from
 and never committed to public version control.
 """
 
-from cryptography.fernet import Fernet
 import os
 from encryption_key import encryption_key as ENCRYPTION_KEY
 import json
-import cryptography.fernet
 
-# Initialize the Fernet cipher suite using the shared encryption key.
-# This instance is used for all encryption/decryption operations within the module.
-f = Fernet(ENCRYPTION_KEY)
+# The Fernet cipher suite for the shared encryption key, used for all encryption/decryption
+# operations within the module. Created on first use so that importing this module does not
+# load `cryptography` (see `--profile-startup` in seatingchartmain.py).
+f = None
+
+def _cipher():
+    """Returns the module's Fernet instance, creating it on first use."""
+    global f
+    if f is None:
+        from cryptography.fernet import Fernet
+        f = Fernet(ENCRYPTION_KEY)
+    return f
 
 # --- Encryption and Decryption Functions ---
 
@@ -31,7 +38,7 @@ def encrypt_data(data_string):
     :param data_string: The raw string to encrypt (typically a JSON string).
     :return: A URL-safe base64-encoded Fernet token as bytes.
     """
-    encrypted_data = f.encrypt(data_string.encode('utf-8'))
+    encrypted_data = _cipher().encrypt(data_string.encode('utf-8'))
     return encrypted_data
 
 def decrypt_data(encrypted_data):
@@ -42,7 +49,7 @@ def decrypt_data(encrypted_data):
     :return: The decrypted plaintext string.
     :raises cryptography.fernet.InvalidToken: If the token is invalid or the key is incorrect.
     """
-    decrypted_data = f.decrypt(encrypted_data).decode('utf-8')
+    decrypted_data = _cipher().decrypt(encrypted_data).decode('utf-8')
     return decrypted_data
 
 def _read_and_decrypt_file(file_path):
@@ -69,6 +76,7 @@ def _read_and_decrypt_file(file_path):
         if not file_content: # File is empty
             return None
 
+        import cryptography.fernet
         try:
             # Attempt to decrypt first
             decrypted_data_string = decrypt_data(file_content)
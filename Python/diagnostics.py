@@ -0,0 +1,118 @@
+"""
+diagnostics.py: The profiling and memory commands of the Diagnostics menu.
+
+* `ActionProfiler` runs `cProfile` on the Tk thread from when it is started
+  until the given number of user actions (commands executed, undone or redone)
+  have finished, then writes `profile_<date>_<time>.pstats` (for `pstats`,
+  snakeviz, ...) and a text summary (`.txt`, top functions by cumulative and by
+  own time) to the app data folder.
+* `measure_memory` runs one operation between two `tracemalloc` snapshots and
+  writes the allocation sites that grew the most, with the peak traced memory,
+  to `memory_<operation>_<date>_<time>.txt` in the app data folder.
+
+cProfile, pstats and tracemalloc are imported when first used, not at startup.
+"""
+
+import io
+import os
+import time
+from datetime import datetime
+
+DEFAULT_PROFILED_ACTIONS = 10
+PROFILE_SUMMARY_FUNCTIONS = 40
+MEMORY_TOP_SITES = 25
+TRACEMALLOC_FRAMES = 10
+
+
+def _report_path(folder, prefix, extension):
+    return os.path.join(folder, f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.{extension}")
+
+
+class ActionProfiler:
+    """cProfile around the next N user actions."""
+    def __init__(self):
+        self.profiler = None
+        self.actions_left = 0
+        self.actions_done = []
+        self.started = None
+
+    @property
+    def active(self):
+        return self.profiler is not None
+
+    def start(self, num_actions):
+        import cProfile
+        self.profiler = cProfile.Profile()
+        self.actions_left = num_actions
+        self.actions_done = []
+        self.started = time.perf_counter()
+        self.profiler.enable()
+
+    def action_finished(self, description):
+        """Counts a finished user action. :return: True once the last profiled action has finished."""
+        if not self.active: return False
+        self.actions_done.append(description)
+        self.actions_left -= 1
+        return self.actions_left <= 0
+
+    def stop(self, folder, app_version=""):
+        """Stops profiling and writes the .pstats file and text summary. :return: The summary path, or None on error."""
+        profiler, self.profiler = self.profiler, None
+        if profiler is None: return None
+        profiler.disable()
+        import pstats
+        stats_path = _report_path(folder, "profile", "pstats")
+        summary_path = stats_path[:-len(".pstats")] + ".txt"
+        stream = io.StringIO()
+        stream.write(f"Profile of {len(self.actions_done)} action(s) over {time.perf_counter() - self.started:.1f} s, {app_version}\n")
+        stream.write("Actions: " + ", ".join(self.actions_done) + "\n\n")
+        stats = pstats.Stats(profiler, stream=stream).strip_dirs()
+        stream.write("=== By cumulative time ===\n")
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_SUMMARY_FUNCTIONS)
+        stream.write("=== By own time ===\n")
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(PROFILE_SUMMARY_FUNCTIONS)
+        try:
+            profiler.dump_stats(stats_path)
+            with open(summary_path, 'w', encoding='utf-8') as f:
+                f.write(stream.getvalue())
+        except OSError as e:
+            print(f"Warning: Could not write profile to {folder}: {e}")
+            return None
+        return summary_path
+
+
+def measure_memory(operation_name, function, folder):
+    """
+    Runs `function` between two tracemalloc snapshots and writes the top allocation sites.
+
+    :param operation_name: Short name used in the report and its file name, e.g. "redraw".
+    :return: (report_path or None, summary lines for showing to the user)
+    """
+    import tracemalloc
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing: tracemalloc.start(TRACEMALLOC_FRAMES)
+    try:
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+        start = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - start
+        after = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        if started_tracing: tracemalloc.stop()
+    snapshot_filter = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap>"))
+    differences = after.filter_traces(snapshot_filter).compare_to(before.filter_traces(snapshot_filter), "lineno")
+    growth = sum(stat.size_diff for stat in differences)
+    summary = [f"{operation_name}: {elapsed * 1000:.0f} ms, {growth / 1024:+.0f} KiB retained, peak {peak / 1024 / 1024:.1f} MiB traced"]
+    lines = summary + ["", f"Top {MEMORY_TOP_SITES} allocation sites by growth:"]
+    lines += [f"{stat.size_diff / 1024:+10.1f} KiB {stat.count_diff:+8d} blocks  {stat.traceback}" for stat in differences[:MEMORY_TOP_SITES]]
+    lines += ["", f"Traced memory after: {current / 1024 / 1024:.1f} MiB"]
+    report_path = _report_path(folder, f"memory_{operation_name.replace(' ', '_').lower()}", "txt")
+    try:
+        with open(report_path, 'w', encoding='utf-8') as f:
+            f.write("\n".join(lines) + "\n")
+    except OSError as e:
+        print(f"Warning: Could not write memory report to {folder}: {e}")
+        report_path = None
+    return report_path, summary + [f"{stat.size_diff / 1024:+.0f} KiB  {stat.traceback}" for stat in differences[:5]]
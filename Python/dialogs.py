@@ -1017,6 +1017,33 @@ class ExitConfirmationDialog(simpledialog.Dialog): # Same as v50
     def save_quit(self): self.result = "save_quit"; self.destroy()
     def no_save_quit(self): self.result = "no_save_quit"; self.destroy()
 
+class RestoreSnapshotDialog(simpledialog.Dialog):
+    """Lets the user pick a backup snapshot. :param snapshots: (snapshot id, description) pairs, newest first."""
+    def __init__(self, parent, title, snapshots):
+        self.snapshots = snapshots
+        self.result = None # The chosen snapshot id
+        super().__init__(parent, title)
+
+    def body(self, master):
+        ttk.Label(master, text="Snapshots of all classrooms, newest first:").pack(anchor=tk.W, padx=5, pady=(5, 2))
+        list_frame = ttk.Frame(master); list_frame.pack(fill=tk.BOTH, expand=True, padx=5, pady=2)
+        self.snapshot_listbox = tk.Listbox(list_frame, height=15, width=60, exportselection=False)
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.snapshot_listbox.yview)
+        self.snapshot_listbox.configure(yscrollcommand=scrollbar.set)
+        self.snapshot_listbox.pack(side=tk.LEFT, fill=tk.BOTH, expand=True); scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        for _, description in self.snapshots: self.snapshot_listbox.insert(tk.END, description)
+        self.snapshot_listbox.selection_set(0)
+        self.snapshot_listbox.bind("<Double-Button-1>", lambda e: self.ok())
+        return self.snapshot_listbox
+
+    def validate(self):
+        if not self.snapshot_listbox.curselection():
+            messagebox.showwarning("No Snapshot", "Please select a snapshot to restore.", parent=self); return False
+        return True
+
+    def apply(self):
+        self.result = self.snapshots[self.snapshot_listbox.curselection()[0]][0]
+
 class ImportExcelOptionsDialog(simpledialog.Dialog): # Same as v50, but ensure app_instance is passed
     def __init__(self, parent, app_instance):
         self.app_instance = app_instance
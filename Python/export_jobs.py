@@ -0,0 +1,180 @@
+"""
+export_jobs.py: Background execution of long-running exports.
+
+Exports (Excel/CSV logs, attendance reports, layout images) used to run on the
+Tk thread, freezing the window until the file was written. This module runs
+them on a worker thread against a snapshot of the application data, reports
+row-level progress back to the UI, and supports cooperative cancellation.
+
+Tkinter is not thread-safe, so the worker never touches widgets. It only
+updates plain counters on its `ExportJob`; the `ExportJobManager` polls those
+counters from the Tk thread with `root.after` and dispatches the completion
+callbacks there as well.
+"""
+
+import copy
+import threading
+import traceback
+
+# How often (ms) the Tk thread polls the running job for progress.
+PROGRESS_POLL_INTERVAL_MS = 100
+
+
+class ExportCancelled(Exception):
+    """Raised inside an export when the user cancels the running job."""
+    pass
+
+
+class ExportSnapshot:
+    """
+    A point-in-time copy of the data an export reads.
+
+    Log entries are copied one level deep: commands replace entries rather than
+    mutating their nested dicts, so this is enough to keep the export consistent
+    while the user keeps logging on the Tk thread.
+    """
+    def __init__(self, app):
+        self.behavior_log = [dict(log) for log in app.behavior_log]
+        self.homework_log = [dict(log) for log in app.homework_log]
+        self.students = {sid: dict(s) for sid, s in app.students.items()}
+        self.settings = copy.deepcopy(app.settings)
+        self.student_groups = copy.deepcopy(app.student_groups)
+        self.all_homework_session_types = copy.deepcopy(app.all_homework_session_types)
+        self.log_aggregates = app.log_aggregates.copy(settings=self.settings)
+
+
+class ExportJob:
+    """
+    A single export unit of work.
+
+    :param description: Short, human-readable label shown in the status bar.
+    :param work: Callable taking this job as its only argument. It should call
+                 `set_total`/`advance` as it writes rows and returns the
+                 job's result.
+    :param on_complete: Called on the Tk thread with the result of `work`.
+    :param on_error: Called on the Tk thread with the raised exception.
+    :param on_cancel: Called on the Tk thread if the job was cancelled.
+    :param quiet: If True, the job runs without showing the status-bar progress widget
+                  (used for the periodic Excel autosave).
+    """
+    def __init__(self, description, work, on_complete=None, on_error=None, on_cancel=None, quiet=False):
+        self.description = description
+        self.quiet = quiet
+        self.work = work
+        self.on_complete = on_complete
+        self.on_error = on_error
+        self.on_cancel = on_cancel
+        self.total = 0
+        self.done = 0
+        self.result = None
+        self.error = None
+        self.status = "pending" # pending -> running -> completed / failed / cancelled
+        self._cancel_event = threading.Event()
+
+    def set_total(self, total):
+        """Sets the number of progress steps (usually rows) the job will perform."""
+        self.total = max(int(total), 0)
+
+    def advance(self, steps=1):
+        """Records completed steps. Raises ExportCancelled if cancellation was requested."""
+        if self._cancel_event.is_set():
+            raise ExportCancelled()
+        self.done += steps
+
+    def check_cancelled(self):
+        """Raises ExportCancelled if cancellation was requested."""
+        if self._cancel_event.is_set():
+            raise ExportCancelled()
+
+    def cancel(self):
+        """Requests cancellation. The worker stops at its next progress checkpoint."""
+        self._cancel_event.set()
+
+    @property
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def fraction_done(self):
+        if self.total <= 0: return 0.0
+        return min(self.done / self.total, 1.0)
+
+    def run(self):
+        """Worker-thread entry point. Never touches Tk."""
+        self.status = "running"
+        try:
+            self.result = self.work(self)
+            self.status = "completed"
+        except ExportCancelled:
+            self.status = "cancelled"
+        except Exception as e:
+            self.error = e
+            self.status = "failed"
+            traceback.print_exc()
+
+
+class ExportJobManager:
+    """
+    Runs ExportJobs one at a time on a daemon worker thread.
+
+    :param root: The Tk root, used to schedule polling on the UI thread.
+    :param on_progress: Called on the Tk thread as `on_progress(job)` while a job runs,
+                        and with `None` when the queue becomes idle.
+    """
+    def __init__(self, root, on_progress=None):
+        self.root = root
+        self.on_progress = on_progress
+        self.pending_jobs = []
+        self.current_job = None
+        self._thread = None
+
+    def submit(self, job):
+        """Queues a job. It starts immediately if no other export is running."""
+        self.pending_jobs.append(job)
+        if self.current_job is None:
+            self._start_next()
+        return job
+
+    def cancel_current(self):
+        if self.current_job: self.current_job.cancel()
+
+    def cancel_all(self):
+        for job in self.pending_jobs: job.cancel()
+        self.cancel_current()
+
+    def is_busy(self):
+        return self.current_job is not None or bool(self.pending_jobs)
+
+    def _start_next(self):
+        if not self.pending_jobs:
+            self.current_job = None
+            if self.on_progress: self.on_progress(None)
+            return
+        job = self.pending_jobs.pop(0)
+        self.current_job = job
+        if job.is_cancelled: # Cancelled while still queued
+            job.status = "cancelled"
+            self._finish(job)
+            return
+        self._thread = threading.Thread(target=job.run, name=f"ExportJob-{job.description}", daemon=True)
+        self._thread.start()
+        self.root.after(PROGRESS_POLL_INTERVAL_MS, self._poll)
+
+    def _poll(self):
+        job = self.current_job
+        if job is None: return
+        if self._thread is not None and self._thread.is_alive():
+            if self.on_progress: self.on_progress(job)
+            self.root.after(PROGRESS_POLL_INTERVAL_MS, self._poll)
+            return
+        self._finish(job)
+
+    def _finish(self, job):
+        try:
+            if job.status == "completed" and job.on_complete: job.on_complete(job.result)
+            elif job.status == "failed" and job.on_error: job.on_error(job.error)
+            elif job.status == "cancelled" and job.on_cancel: job.on_cancel()
+        except Exception as e:
+            print(f"Error in export job callback for '{job.description}': {e}")
+        finally:
+            self._thread = None
+            self._start_next()
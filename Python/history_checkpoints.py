@@ -0,0 +1,121 @@
+"""
+history_checkpoints.py: Periodic state checkpoints along the undo stack.
+
+Jumping to an earlier point in the undo history used to undo every later
+command one at a time. `HistoryCheckpoints` records a lightweight copy of the
+command-managed classroom state every few commands, keyed by the undo stack
+length at which it was taken. Navigation restores the checkpoint nearest to the
+target and replays only the few commands in between (undoing them, or
+re-executing them when the checkpoint lies before the target), so a jump costs
+about the same whatever its distance.
+
+A checkpoint holds copies of the students, furniture and guides plus shallow
+copies of the logs and of the deleted students' log archive: log entries are
+never modified in place once logged (and archive entries are only added or
+removed whole), so they are shared with the live state rather than copied.
+"""
+
+import copy
+
+from commands import CompositeCommand, ResetSettingsCommand, ManageStudentGroupCommand, \
+    MarkLiveQuizQuestionCommand, MarkLiveHomeworkCommand
+
+CHECKPOINT_INTERVAL = 20 # Commands between checkpoints (doubles as checkpoints are thinned out)
+MAX_CHECKPOINTS = 32
+
+# Commands that change state a checkpoint does not capture (settings, group definitions, live session marks).
+# Navigation never restores a checkpoint across one of these; it falls back to undoing step by step.
+_UNCAPTURED_COMMAND_TYPES = (ResetSettingsCommand, ManageStudentGroupCommand, MarkLiveQuizQuestionCommand, MarkLiveHomeworkCommand)
+
+
+def is_checkpoint_safe(command):
+    """True if everything `command` changes is captured by a checkpoint."""
+    if isinstance(command, CompositeCommand):
+        return all(is_checkpoint_safe(child) for child in command.commands)
+    return not isinstance(command, _UNCAPTURED_COMMAND_TYPES)
+
+
+class StateCheckpoint:
+    """The command-managed state of the app after the first `history_length` commands of the undo stack."""
+    def __init__(self, app, history_length):
+        self.history_length = history_length
+        self.students = copy.deepcopy(app.students)
+        self.furniture = copy.deepcopy(app.furniture)
+        self.guides = copy.deepcopy(app.guides)
+        self.behavior_log = list(app.behavior_log)
+        self.homework_log = list(app.homework_log)
+        self.log_archive = dict(app.log_archive)
+        self.next_ids = {name: getattr(app, name) for name in
+                         ("next_student_id_num", "next_furniture_id_num", "next_guide_id_num")}
+
+    def restore(self, app):
+        """Puts the checkpointed state back into `app` in place, keeping `app.log_stats` consistent."""
+        for target, saved in ((app.students, self.students), (app.furniture, self.furniture), (app.guides, self.guides)):
+            target.clear(); target.update(copy.deepcopy(saved)) # The checkpoint must stay pristine for reuse
+        _restore_log(app.behavior_log, self.behavior_log, app.log_stats)
+        _restore_log(app.homework_log, self.homework_log, app.log_stats)
+        app.log_archive.clear(); app.log_archive.update(self.log_archive)
+        for name, value in self.next_ids.items(): setattr(app, name, value)
+        app.selected_items.intersection_update(set(app.students) | set(app.furniture))
+
+
+def _restore_log(live_log, saved_log, log_stats):
+    """Replaces the contents of `live_log` with `saved_log`, reporting only the entries that differ to the catalog."""
+    saved_ids = {id(entry) for entry in saved_log}
+    live_ids = {id(entry) for entry in live_log}
+    log_stats.remove_entries([entry for entry in live_log if id(entry) not in saved_ids])
+    log_stats.add_entries([entry for entry in saved_log if id(entry) not in live_ids])
+    live_log[:] = saved_log
+
+
+class HistoryCheckpoints:
+    """
+    The checkpoints taken along the current undo stack.
+
+    :param interval: Initial number of commands between checkpoints.
+    :param max_checkpoints: Checkpoints kept before the interval is doubled and every other one dropped.
+    """
+    def __init__(self, interval=CHECKPOINT_INTERVAL, max_checkpoints=MAX_CHECKPOINTS):
+        self.interval = interval
+        self.max_checkpoints = max_checkpoints
+        self.checkpoints = {} # undo stack length -> StateCheckpoint
+
+    def clear(self):
+        self.checkpoints.clear()
+
+    def discard_after(self, history_length):
+        """Drops checkpoints of history beyond `history_length` commands (that history was replaced)."""
+        for length in [length for length in self.checkpoints if length > history_length]:
+            del self.checkpoints[length]
+
+    def command_executed(self, app):
+        """Called after a command is pushed onto `app.undo_stack`; takes a checkpoint when one is due."""
+        history_length = len(app.undo_stack)
+        if history_length % self.interval: return
+        self.checkpoints[history_length] = StateCheckpoint(app, history_length)
+        if len(self.checkpoints) > self.max_checkpoints:
+            self.interval *= 2
+            for length in [length for length in self.checkpoints if length % self.interval]:
+                del self.checkpoints[length]
+
+    def plan(self, undo_stack, target_length):
+        """
+        Chooses how to reach the state after the first `target_length` commands of `undo_stack`.
+
+        :return: The StateCheckpoint to restore first, or None to undo step by step from the current state.
+        """
+        current_length = len(undo_stack)
+        # Restoring a checkpoint skips over the commands between it, the target and the current state,
+        # so none of those may change state the checkpoint does not hold. Only the commands down to the
+        # nearest checkpoint at or below the target need checking (older ones may not even be paged in).
+        scan_floor = max((length for length in self.checkpoints if length <= target_length), default=target_length)
+        lowest_safe_length = current_length
+        while lowest_safe_length > scan_floor and is_checkpoint_safe(undo_stack[lowest_safe_length - 1]):
+            lowest_safe_length -= 1
+        if target_length < lowest_safe_length: return None
+        best, best_cost = None, current_length - target_length
+        for length, checkpoint in self.checkpoints.items():
+            if length < lowest_safe_length or length > current_length: continue
+            cost = abs(length - target_length)
+            if cost < best_cost: best, best_cost = checkpoint, cost
+        return best
@@ -0,0 +1,279 @@
+"""
+layout_renderer.py: Draws the seating chart layout directly into an image with Pillow.
+
+"Export Layout as Image" used to have Tk write the canvas as PostScript and
+Pillow rasterize that through Ghostscript, which had to be installed separately
+and only saw what the canvas had drawn. This module draws the layout from the
+data instead, at any DPI, without Tk or Ghostscript, so batch_export.py can
+render layouts too.
+
+The layout is passed as a scene (see `ClassroomModel.build_layout_scene`), a
+dict of plain values in world coordinates (canvas pixels at 100% zoom):
+
+* "boxes": students and furniture in drawing order. Each box has "x", "y",
+  "width", "height", "fill", "outline", "outline_width", "stripes" (list of
+  {"fill", "outline"} for the conditional formatting rules that apply),
+  "group_color" (the group indicator, or None), "text_panel" (draw light panels
+  behind the text), "center_text" (center the text vertically, for furniture),
+  "font_family" and "lines": dicts with "text", "font_size" (points), "bold",
+  "color", "align" ("center" or "left") and "block" ("name" or "detail").
+  A box grows to fit its text, like on the canvas.
+* "guides": ("h" or "v", world coordinate) pairs, drawn dashed in "guide_color".
+* "background": the image's background color.
+
+The image is drawn in horizontal bands of at most TILE_PIXELS pixels. A PNG is
+written band by band (each band's rows are compressed into the file as soon as
+they are drawn), so memory stays bounded however large the layout or DPI.
+Other formats are assembled from the bands into one image that Pillow saves.
+"""
+
+import functools
+import os
+import struct
+import zlib
+
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+WORLD_UNITS_PER_INCH = 96 # Tk draws the canvas at the screen's ~96 pixels per inch
+POINTS_PER_INCH = 72
+TILE_PIXELS = 16 * 1024 * 1024 # Pixels per band, ~48 MB as RGB
+LAYOUT_MARGIN = 20 # World units of background around the items
+BOX_PADDING = 5
+TEXT_PANEL_PADDING = 2
+TEXT_PANEL_FILL = "#F0F0F0"
+GROUP_INDICATOR_SIZE = 12
+MAX_STRIPES = 3
+GUIDE_DASH = (4, 2)
+PNG_COMPRESSION_LEVEL = 6
+# Tried after the box's font family (Tk family names rarely match a font file name)
+FALLBACK_FONT_FILES = {
+    False: ("DejaVuSans.ttf", "arial.ttf", "Arial.ttf", "LiberationSans-Regular.ttf", "Helvetica.ttc"),
+    True: ("DejaVuSans-Bold.ttf", "arialbd.ttf", "Arial Bold.ttf", "LiberationSans-Bold.ttf", "Helvetica.ttc"),
+}
+
+
+@functools.lru_cache(maxsize=128)
+def _font(family, size_px, bold):
+    """A TrueType font for a Tk font family, falling back to common system fonts and then Pillow's default font."""
+    names = dict.fromkeys((family, family.replace(" ", ""), family.lower().replace(" ", ""))) if family else {}
+    suffixes = (" Bold", "bd", "-Bold") if bold else ("",)
+    for file_name in [f"{name}{suffix}.ttf" for name in names for suffix in suffixes] + list(FALLBACK_FONT_FILES[bold]):
+        try: return ImageFont.truetype(file_name, size_px)
+        except OSError: continue
+    try: return ImageFont.load_default(size_px) # Scalable since Pillow 10.1
+    except TypeError: return ImageFont.load_default()
+
+
+@functools.lru_cache(maxsize=128)
+def _linespace(font):
+    try:
+        ascent, descent = font.getmetrics()
+        return ascent + descent
+    except AttributeError: # Pillow's bitmap default font
+        return font.getbbox("Ag")[3]
+
+
+@functools.lru_cache(maxsize=256)
+def _rgb(color):
+    """A Tk color as an RGB tuple, or None for "" (no fill/outline). Unknown names are drawn black."""
+    if not color: return None
+    for name in (color, color.replace(" ", "").lower()):
+        try: return ImageColor.getrgb(name)[:3]
+        except ValueError: continue
+    print(f"Warning: Unknown color '{color}' in layout image, using black.")
+    return (0, 0, 0)
+
+
+def _wrap(text, font, width):
+    """Splits text into lines at spaces so each fits `width` pixels where possible, like Tk's text wrapping."""
+    if width <= 0 or font.getlength(text) <= width: return [text]
+    lines, line = [], ""
+    for word in text.split(" "):
+        candidate = f"{line} {word}" if line else word
+        if line and font.getlength(candidate) > width:
+            lines.append(line); line = word
+        else:
+            line = candidate
+    lines.append(line)
+    return lines
+
+
+def _layout_box(box, scale, dpi):
+    """
+    Places a box's text and panels at `scale` (pixels per world unit).
+
+    :return: Dict with the box's pixel "left", "top", "width", "height" (relative to world 0,0) and its
+             "texts" [(x, y, text, font, color)] and "panels" [(x0, y0, x1, y1)] relative to the box.
+    """
+    width = max(1, round(box["width"] * scale))
+    padding = BOX_PADDING * scale
+    panel_padding = TEXT_PANEL_PADDING * scale
+    text_width = width - 2 * padding
+    texts, blocks, y = [], {}, padding
+    for line in box["lines"]:
+        if line["block"] == "detail" and "detail" not in blocks: y += padding / 2 # Space before the logs
+        font = _font(box.get("font_family"), max(1, round(line["font_size"] * dpi / POINTS_PER_INCH)), bool(line.get("bold")))
+        left_aligned = line.get("align") == "left"
+        for part in _wrap(line["text"], font, text_width - (padding if left_aligned else 0)):
+            part_width = font.getlength(part)
+            x = padding if left_aligned else (width - part_width) / 2
+            texts.append((round(x), round(y), part, font, _rgb(line.get("color")) or (0, 0, 0))) # Whole pixels, so bands line up
+            block = blocks.setdefault(line["block"], [y, y, 0])
+            block[1] = y + _linespace(font); block[2] = max(block[2], min(part_width, text_width))
+            y += _linespace(font)
+    height = max(round(box["height"] * scale), round(y + padding))
+    if box.get("center_text") and texts: # Furniture: the name is centered in the box
+        shift = (height - (y - padding)) / 2 - padding
+        texts = [(x, round(text_y + shift), text, font, color) for x, text_y, text, font, color in texts]
+    panels = []
+    if box.get("text_panel"):
+        for top, bottom, block_width in blocks.values():
+            panel_width = min(block_width + 2 * panel_padding, text_width - 2 * panel_padding)
+            x0 = (width - panel_width) / 2
+            y0, y1 = top - panel_padding, bottom + panel_padding
+            if y1 < height - padding * 0.5: panels.append((x0, y0, x0 + panel_width, y1))
+    return {"left": round(box["x"] * scale), "top": round(box["y"] * scale), "width": width, "height": height,
+            "texts": texts, "panels": panels, "box": box}
+
+
+def _rectangle(draw, x0, y0, x1, y1, fill=None, outline=None, width=1):
+    """A rectangle with its outline inside (x0, y0)-(x1, y1), clipped to the band first (Pillow's outlines are off by a row when cut at the band's top)."""
+    band_bottom = draw.im.size[1] - 1
+    def part(top, bottom, left, right, color):
+        top, bottom = max(top, 0), min(bottom, band_bottom)
+        if color is not None and top <= bottom and left <= right: draw.rectangle((left, top, right, bottom), fill=color)
+    part(y0, y1, x0, x1, fill)
+    if outline is not None:
+        part(y0, y0 + width - 1, x0, x1, outline); part(y1 - width + 1, y1, x0, x1, outline)
+        part(y0, y1, x0, x0 + width - 1, outline); part(y0, y1, x1 - width + 1, x1, outline)
+
+
+def _draw_box(draw, placed, offset_x, offset_y, scale):
+    box = placed["box"]
+    x0, y0 = placed["left"] - offset_x, placed["top"] - offset_y
+    x1, y1 = x0 + placed["width"] - 1, y0 + placed["height"] - 1
+    fill, outline = _rgb(box.get("fill")), _rgb(box.get("outline"))
+    stripes = box.get("stripes", [])[:MAX_STRIPES]
+    if not stripes:
+        _rectangle(draw, x0, y0, x1, y1, fill, outline, max(1, round(box.get("outline_width", 2) * scale)))
+    else:
+        stripe_height = placed["height"] / len(stripes)
+        for i, stripe in enumerate(stripes):
+            stripe_y0 = y0 + round(i * stripe_height)
+            stripe_y1 = y1 if i == len(stripes) - 1 else y0 + round((i + 1) * stripe_height) - 1
+            _rectangle(draw, x0, stripe_y0, x1, stripe_y1, _rgb(stripe.get("fill")) or fill,
+                       _rgb(stripe.get("outline")) or outline, max(1, round(scale))) # Thinner outline for stripes
+    panel_fill = _rgb(TEXT_PANEL_FILL)
+    for px0, py0, px1, py1 in placed["panels"]:
+        _rectangle(draw, x0 + round(px0), y0 + round(py0), x0 + round(px1), y0 + round(py1), panel_fill)
+    for x, y, text, font, color in placed["texts"]:
+        draw.text((x0 + x, y0 + y), text, font=font, fill=color)
+    if box.get("group_color"):
+        size, gap = round(GROUP_INDICATOR_SIZE * scale), round(2 * scale)
+        _rectangle(draw, x1 + 1 - size - gap, y0 + gap, x1 - gap, y0 + gap + size - 1, _rgb(box["group_color"]), outline, max(1, round(scale)))
+
+
+def _draw_dashed_line(draw, horizontal, position, start, end, dash, color, phase_origin):
+    """A dashed line at `position` from `start` to `end` (pixels along the line), with dashes aligned to `phase_origin`."""
+    on, period = dash[0], dash[0] + dash[1]
+    first = start - (start - phase_origin) % period
+    for dash_start in range(int(first), int(end), max(1, int(period))):
+        a, b = max(dash_start, start), min(dash_start + on, end) - 1 # Pillow's lines include both ends
+        if a > b: continue
+        draw.line((a, position, b, position) if horizontal else (position, a, position, b), fill=color, width=1)
+
+
+class _PngWriter:
+    """Writes an RGB PNG row by row: IHDR and pHYs, then the rows through one zlib stream split into IDAT chunks."""
+    def __init__(self, path, width, height, dpi):
+        self.width = width
+        self.file = open(path, 'wb')
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        self._chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)) # 8-bit RGB, no interlacing
+        pixels_per_meter = round(dpi / 0.0254)
+        self._chunk(b"pHYs", struct.pack(">IIB", pixels_per_meter, pixels_per_meter, 1))
+        self.compressor = zlib.compressobj(PNG_COMPRESSION_LEVEL)
+
+    def _chunk(self, kind, data):
+        self.file.write(struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data)))
+
+    def write_rows(self, image):
+        raw, stride = memoryview(image.tobytes()), self.width * 3
+        compressed = []
+        for start in range(0, len(raw), stride):
+            compressed.append(self.compressor.compress(b"\x00")) # Filter type 0 (none); flat colors compress well without one
+            compressed.append(self.compressor.compress(raw[start:start + stride]))
+        compressed = b"".join(compressed)
+        if compressed: self._chunk(b"IDAT", compressed)
+
+    def close(self):
+        self._chunk(b"IDAT", self.compressor.flush())
+        self._chunk(b"IEND", b"")
+        self.file.close()
+
+
+def render_layout(scene, file_path, dpi=600, job=None):
+    """
+    Draws a layout scene (see the module docstring) into an image file.
+
+    :param dpi: Output resolution; one world unit is 1/96 inch.
+    :param job: Optional ExportJob for progress and cancellation (checked between bands).
+    :return: (width, height) of the image in pixels.
+    """
+    scale = dpi / WORLD_UNITS_PER_INCH
+    placed = [dict(_layout_box(box, scale, dpi), order=index) for index, box in enumerate(scene.get("boxes", []))]
+    placed.sort(key=lambda p: p["top"]) # "order" keeps the scene's stacking for overlapping boxes
+    margin = round(LAYOUT_MARGIN * scale)
+    if placed:
+        min_x = min(p["left"] for p in placed) - margin; min_y = placed[0]["top"] - margin
+        max_x = max(p["left"] + p["width"] for p in placed) + margin; max_y = max(p["top"] + p["height"] for p in placed) + margin
+    else:
+        min_x, min_y, max_x, max_y = -margin, -margin, round(400 * scale) + margin, round(300 * scale) + margin
+    width, height = max_x - min_x, max_y - min_y
+    band_rows = max(1, min(height, TILE_PIXELS // width))
+    background = _rgb(scene.get("background", "white")) or (255, 255, 255)
+    guide_color = _rgb(scene.get("guide_color", "blue"))
+    dash = (max(1, round(GUIDE_DASH[0] * scale)), max(1, round(GUIDE_DASH[1] * scale)))
+    guides = [(kind, round(coord * scale)) for kind, coord in scene.get("guides", [])]
+    is_png = os.path.splitext(file_path)[1].lower() in (".png", "")
+    if job: job.set_total(height)
+
+    writer = _PngWriter(file_path, width, height, dpi) if is_png else None
+    full_image = None if is_png else Image.new("RGB", (width, height), background)
+    try:
+        active, next_index = [], 0
+        for band_top in range(0, height, band_rows):
+            if job: job.check_cancelled()
+            band_height = min(band_rows, height - band_top)
+            world_top, world_bottom = min_y + band_top, min_y + band_top + band_height
+            start_index = next_index
+            while next_index < len(placed) and placed[next_index]["top"] < world_bottom: # Boxes are sorted by top
+                active.append(placed[next_index]); next_index += 1
+            if next_index > start_index: active.sort(key=lambda p: p["order"]) # Drawn in scene order, as on the canvas
+            active = [p for p in active if p["top"] + p["height"] > world_top]
+            band = Image.new("RGB", (width, band_height), background)
+            draw = ImageDraw.Draw(band)
+            for item in active: _draw_box(draw, item, min_x, world_top, scale)
+            for kind, coord in guides: # Guides on top of the items, as on the canvas
+                if kind == "h" and world_top <= coord < world_bottom:
+                    _draw_dashed_line(draw, True, coord - world_top, 0, width, dash, guide_color, 0)
+                elif kind == "v" and min_x <= coord < max_x:
+                    _draw_dashed_line(draw, False, coord - min_x, 0, band_height, dash, guide_color, -band_top)
+            if writer: writer.write_rows(band)
+            else: full_image.paste(band, (0, band_top))
+            band.close()
+            if job: job.advance(band_height)
+        if writer:
+            writer.close(); writer = None
+        else:
+            if os.path.splitext(file_path)[1].lower() == ".pgm": full_image = full_image.convert("L")
+            full_image.save(file_path, dpi=(dpi, dpi))
+    except BaseException:
+        if writer: # Don't leave a truncated PNG behind (e.g. when cancelled)
+            writer.file.close()
+            try: os.remove(file_path)
+            except OSError: pass
+        raise
+    finally:
+        if full_image is not None: full_image.close()
+    return width, height
@@ -0,0 +1,158 @@
+"""
+log_aggregates.py: Pre-aggregated (student, item, day) buckets for log summaries.
+
+The export summary sheet ("Behavior Summary by Student", "Quiz Averages by
+Student", "Homework Completion by Student") used to be rebuilt from every
+filtered log entry, re-deriving each quiz score from the configured mark types.
+`LogAggregateCube` keeps one bucket per (log type, student, item name, day)
+holding the entry count, the sum of quiz score percentages and the sum of
+homework points. Buckets are updated as entries are added or removed, so a
+date-ranged summary is assembled from day buckets in O(buckets) instead of
+O(logs).
+
+Quiz scores and homework points depend on the configured mark types. The cube
+records the mark-type configuration it was built with; `ensure_current`
+rebuilds it when that configuration has changed.
+"""
+
+import json
+from datetime import date
+
+from log_stats import HOMEWORK_LOG_TYPES, log_item_name
+
+# Indices into a bucket list
+COUNT, SCORE_SUM, POINTS_SUM = 0, 1, 2
+
+
+def quiz_entry_score(log_entry, quiz_mark_types):
+    """Score (%) of a quiz log entry, computed the same way as the export summary always has."""
+    num_questions = log_entry.get("num_questions", 0)
+    marks_data = log_entry.get("marks_data", {}) or {}
+    total_earned = 0; extra_credit = 0
+    for mark_type in quiz_mark_types:
+        points = marks_data.get(mark_type["id"], 0)
+        if points > 0:
+            if mark_type.get("is_extra_credit", False): extra_credit += points * mark_type.get("default_points", 1)
+            else: total_earned += points * mark_type.get("default_points", 1)
+    main_total_possible = 0
+    correct_type = next((m for m in quiz_mark_types if m.get("id") == "mark_correct"), None)
+    if correct_type and num_questions > 0: main_total_possible = correct_type.get("default_points", 1) * num_questions
+    if main_total_possible > 0:
+        return ((total_earned + extra_credit) / main_total_possible) * 100
+    return 100 if total_earned + extra_credit > 0 else 0
+
+
+def homework_entry_points(log_entry, homework_mark_types):
+    """Points earned by a homework log entry (graded marks, or approximated from live session details)."""
+    total_points = 0.0
+    log_type = log_entry.get("type")
+    if log_type == "homework" and "marks_data" in log_entry:
+        for mark_value in log_entry["marks_data"].values():
+            if isinstance(mark_value, (int, float)): total_points += mark_value
+    elif log_type == "homework_session_y":
+        for status_value in (log_entry.get("homework_details", {}) or {}).values():
+            if str(status_value).lower() == "yes": # Simplified: 'yes' adds default points of 'complete' mark type
+                complete_mark_type = next((m for m in homework_mark_types if m["id"] == "hmark_complete"), None)
+                if complete_mark_type: total_points += complete_mark_type.get("default_points", 0)
+    elif log_type == "homework_session_s":
+        for option_name in (log_entry.get("homework_details", {}) or {}).get("selected_options", []):
+            option_mark_type = next((m for m in homework_mark_types if m["name"] == option_name), None)
+            if option_mark_type: total_points += option_mark_type.get("default_points", 0)
+    return total_points
+
+
+def _valid_day(timestamp):
+    """The "YYYY-MM-DD" part of an ISO timestamp, or None if it is not a valid date."""
+    day = (timestamp or "")[:10]
+    try: date.fromisoformat(day)
+    except ValueError: return None
+    return day
+
+
+class LogAggregateCube:
+    """
+    Count/score/points buckets keyed by (log_type, student_id, item_name, day).
+
+    :param get_settings: Callable returning the settings dict whose "quiz_mark_types" and
+                         "homework_mark_types" are used to score entries. It is called at update
+                         time, so it keeps working when the application replaces its settings.
+    """
+    def __init__(self, get_settings):
+        self.get_settings = get_settings
+        self.buckets = {}
+        self.config_key = self._make_config_key(get_settings())
+
+    @staticmethod
+    def _make_config_key(settings):
+        return json.dumps([settings.get("quiz_mark_types", []), settings.get("homework_mark_types", [])], sort_keys=True, default=str)
+
+    def clear(self):
+        self.buckets.clear()
+        self.config_key = self._make_config_key(self.get_settings())
+
+    def rebuild(self, *logs):
+        self.clear()
+        for log in logs:
+            for entry in log: self.add_entry(entry)
+
+    def ensure_current(self, *logs):
+        """Rebuilds from `logs` if the mark-type configuration changed since the buckets were scored."""
+        if self.config_key != self._make_config_key(self.get_settings()):
+            self.rebuild(*logs)
+
+    def _bucket_values(self, log_entry):
+        log_type = log_entry.get("type", "behavior")
+        day = _valid_day(log_entry.get("timestamp"))
+        if day is None: return None, None
+        key = (log_type, log_entry.get("student_id"), log_item_name(log_entry), day)
+        settings = self.get_settings()
+        score = quiz_entry_score(log_entry, settings.get("quiz_mark_types", [])) if log_type == "quiz" else 0
+        points = homework_entry_points(log_entry, settings.get("homework_mark_types", [])) if log_type in HOMEWORK_LOG_TYPES else 0
+        return key, (score, points)
+
+    def add_entry(self, log_entry):
+        key, values = self._bucket_values(log_entry)
+        if key is None: return
+        bucket = self.buckets.get(key)
+        if bucket is None: bucket = self.buckets[key] = [0, 0.0, 0.0]
+        bucket[COUNT] += 1; bucket[SCORE_SUM] += values[0]; bucket[POINTS_SUM] += values[1]
+
+    def remove_entry(self, log_entry):
+        key, values = self._bucket_values(log_entry)
+        bucket = self.buckets.get(key) if key is not None else None
+        if bucket is None: return
+        bucket[COUNT] -= 1; bucket[SCORE_SUM] -= values[0]; bucket[POINTS_SUM] -= values[1]
+        if bucket[COUNT] <= 0: del self.buckets[key]
+
+    def copy(self, settings=None):
+        """
+        An independent copy, safe to read from a worker thread while this cube keeps changing.
+
+        :param settings: Optional settings dict (e.g. a snapshot's) for the copy to score against.
+        """
+        cube = LogAggregateCube.__new__(LogAggregateCube)
+        cube.get_settings = (lambda: settings) if settings is not None else self.get_settings
+        cube.buckets = {key: list(bucket) for key, bucket in self.buckets.items()}
+        cube.config_key = self.config_key
+        return cube
+
+    def summarize(self, start_date=None, end_date=None, accepts=None):
+        """
+        Rolls day buckets up into {(log_type, student_id, item_name): [count, score_sum, points_sum]}.
+
+        :param start_date: Optional first day (datetime.date) to include.
+        :param end_date: Optional last day (datetime.date) to include.
+        :param accepts: Optional predicate `accepts(log_type, student_id, item_name)` to filter buckets.
+        """
+        start_key = start_date.isoformat() if start_date else None
+        end_key = end_date.isoformat() if end_date else None
+        result = {}
+        for (log_type, student_id, item_name, day), bucket in self.buckets.items():
+            if start_key and day < start_key: continue
+            if end_key and day > end_key: continue
+            if accepts and not accepts(log_type, student_id, item_name): continue
+            total = result.get((log_type, student_id, item_name))
+            if total is None: result[(log_type, student_id, item_name)] = list(bucket)
+            else:
+                total[COUNT] += bucket[COUNT]; total[SCORE_SUM] += bucket[SCORE_SUM]; total[POINTS_SUM] += bucket[POINTS_SUM]
+        return result
@@ -0,0 +1,194 @@
+"""
+log_columns.py: A columnar mirror of the behavior and homework logs.
+
+Conditional formatting rules and the recent-log lines on student boxes ask
+the same questions over and over for every student on every redraw: which of
+this student's logs of these types fall in a time window, how many logs of a
+behavior there are, what a student's quiz scores are. Answering them from the
+log lists means walking every entry dict and parsing its timestamp each time.
+
+`LogColumnStore` keeps one row per log entry in parallel typed arrays (`array`
+module): epoch seconds, a student code, a log type code and an item
+(behavior/quiz/homework name) code, plus the rows of each student. The entries
+themselves are the side table for the variable-size fields (comments, marks,
+homework details). Filters are evaluated on the arrays, vectorized with NumPy
+when it is installed and with a plain loop over the arrays otherwise; both give
+the same results. Per-student queries only visit that student's rows.
+
+Like the aggregate cube, the store is attached to `LogStatsCatalog`, which
+forwards every entry the log commands add or remove. Removed rows are marked
+dead and the arrays are compacted once dead rows make up half of them.
+"""
+
+from array import array
+from datetime import datetime
+
+from log_stats import log_item_name
+
+try:
+    import numpy as np
+except ImportError: # Optional; the pure-Python path below is used instead
+    np = None
+
+_EPOCH = datetime(1970, 1, 1)
+MIN_COMPACTION_ROWS = 1024
+
+
+def to_epoch(value):
+    """Seconds since 1970-01-01 of an ISO timestamp string or datetime, read as naive local time (NaN if invalid)."""
+    if isinstance(value, str):
+        try: value = datetime.fromisoformat(value)
+        except ValueError: return float("nan")
+    if not isinstance(value, datetime): return float("nan")
+    return (value.replace(tzinfo=None) - _EPOCH).total_seconds()
+
+
+class _Codes:
+    """Assigns small integer codes to the distinct values of one column."""
+    def __init__(self):
+        self.codes = {}
+        self.values = []
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+    def lookup(self, value):
+        return self.codes.get(value, -1)
+
+
+class LogColumnStore:
+    """Parallel arrays over the log entries reported by `LogStatsCatalog`; see the module docstring."""
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.epoch = array('d')
+        self.student = array('q')
+        self.type_code = array('i')
+        self.item = array('i')
+        self.live = array('b')
+        self.entries = [] # Side table: the entry of each row (None once removed)
+        self.student_rows = {} # student code -> array of that student's rows (dead ones included until compaction)
+        self.students, self.types, self.items = _Codes(), _Codes(), _Codes()
+        self._rows_by_key = {} # (timestamp, student_id, type, item) -> rows, to find an entry's row on removal
+        self.dead_rows = 0
+
+    @staticmethod
+    def _key(log_entry):
+        return (log_entry.get("timestamp"), log_entry.get("student_id"), log_entry.get("type", "behavior"), log_item_name(log_entry))
+
+    def __len__(self):
+        return len(self.entries) - self.dead_rows
+
+    # --- Updates (called through LogStatsCatalog) ---
+    def add_entry(self, log_entry):
+        row = len(self.entries)
+        self.epoch.append(to_epoch(log_entry.get("timestamp")))
+        student_code = self.students.code(log_entry.get("student_id"))
+        self.student.append(student_code)
+        self.student_rows.setdefault(student_code, array('q')).append(row)
+        self.type_code.append(self.types.code(log_entry.get("type", "behavior")))
+        self.item.append(self.items.code(log_item_name(log_entry)))
+        self.live.append(1)
+        self.entries.append(log_entry)
+        self._rows_by_key.setdefault(self._key(log_entry), []).append(row)
+
+    def remove_entry(self, log_entry):
+        key = self._key(log_entry)
+        rows = self._rows_by_key.get(key)
+        if not rows: return
+        # Prefer the row holding this very object; otherwise any row with the same key is an equal entry
+        row = next((r for r in rows if self.entries[r] is log_entry), rows[-1])
+        rows.remove(row)
+        if not rows: del self._rows_by_key[key]
+        self.live[row] = 0; self.entries[row] = None
+        self.dead_rows += 1
+        if self.dead_rows >= MIN_COMPACTION_ROWS and self.dead_rows * 2 >= len(self.entries): self.compact()
+
+    def compact(self):
+        """Drops dead rows from the arrays."""
+        keep = [row for row, alive in enumerate(self.live) if alive]
+        self.epoch = array('d', (self.epoch[row] for row in keep))
+        self.student = array('q', (self.student[row] for row in keep))
+        self.type_code = array('i', (self.type_code[row] for row in keep))
+        self.item = array('i', (self.item[row] for row in keep))
+        self.live = array('b', [1]) * len(keep)
+        self.entries = [self.entries[row] for row in keep]
+        self._rows_by_key, self.student_rows = {}, {}
+        for row, log_entry in enumerate(self.entries):
+            self._rows_by_key.setdefault(self._key(log_entry), []).append(row)
+            self.student_rows.setdefault(self.student[row], array('q')).append(row)
+        self.dead_rows = 0
+
+    # --- Queries ---
+    def _item_codes(self, item_names=None, name_contains=None):
+        if item_names is not None: return [self.items.lookup(name) for name in item_names]
+        needle = name_contains.lower()
+        return [code for code, name in enumerate(self.items.values) if needle in str(name or "").lower()]
+
+    def select(self, student_id=None, log_types=None, item_names=None, name_contains=None,
+               since=None, after=None, until=None, newest_first=False):
+        """
+        Rows of the live entries matching every given filter.
+
+        :param log_types: Log types to include (e.g. ("behavior", "quiz")).
+        :param item_names: Behavior/quiz/homework names to include.
+        :param name_contains: Case-insensitive substring the item name must contain.
+        :param since: Only entries at or after this time (datetime or ISO string).
+        :param after: Only entries strictly after this time.
+        :param until: Only entries at or before this time.
+        :param newest_first: Order rows by timestamp, most recent first (else in row order).
+        :return: A list of row indices (see `entries_for`).
+        """
+        if not self.entries: return []
+        candidates = None # Rows to examine: one student's, or all
+        if student_id is not None:
+            candidates = self.student_rows.get(self.students.lookup(student_id))
+            if candidates is None: return []
+        type_codes = None if log_types is None else {self.types.lookup(t) for t in log_types}
+        item_codes = None if item_names is None and name_contains is None else set(self._item_codes(item_names, name_contains))
+        timed = since is not None or after is not None or until is not None
+        lowest = to_epoch(since) if since is not None else float("-inf")
+        above = to_epoch(after) if after is not None else float("-inf")
+        highest = to_epoch(until) if until is not None else float("inf")
+        if np is not None:
+            return self._select_numpy(candidates, type_codes, item_codes, timed, lowest, above, highest, newest_first)
+        live, type_column, item_column, epoch = self.live, self.type_code, self.item, self.epoch
+        rows = []
+        for row in (candidates if candidates is not None else range(len(live))):
+            if not live[row]: continue
+            if type_codes is not None and type_column[row] not in type_codes: continue
+            if item_codes is not None and item_column[row] not in item_codes: continue
+            if timed and not (lowest <= epoch[row] <= highest and epoch[row] > above): continue
+            rows.append(row)
+        if newest_first: rows.sort(key=epoch.__getitem__, reverse=True)
+        return rows
+
+    def _select_numpy(self, candidates, type_codes, item_codes, timed, lowest, above, highest, newest_first):
+        rows = np.frombuffer(candidates, dtype=np.int64) if candidates is not None else np.arange(len(self.live))
+        rows = rows[np.frombuffer(self.live, dtype=np.int8)[rows] != 0]
+        if type_codes is not None: rows = rows[np.isin(np.frombuffer(self.type_code, dtype=np.int32)[rows], list(type_codes))]
+        if item_codes is not None: rows = rows[np.isin(np.frombuffer(self.item, dtype=np.int32)[rows], list(item_codes))]
+        epoch = np.frombuffer(self.epoch, dtype=np.float64)[rows]
+        if timed:
+            keep = (epoch >= lowest) & (epoch <= highest) & (epoch > above)
+            rows, epoch = rows[keep], epoch[keep]
+        if newest_first: rows = rows[np.argsort(-epoch, kind="stable")]
+        return rows.tolist()
+
+    def entries_for(self, rows):
+        return [self.entries[row] for row in rows]
+
+    def count(self, **filters):
+        """Number of live entries matching the `select` filters, without looking at the entries."""
+        return len(self.select(**filters))
+
+    def quiz_scores(self, score_function, student_id=None, name_contains=None):
+        """Scores of the matching quiz entries, computed by `score_function(entry)` (None results are skipped)."""
+        rows = self.select(student_id=student_id, log_types=("quiz",), name_contains=name_contains)
+        scores = (score_function(self.entries[row]) for row in rows)
+        return [score for score in scores if score is not None]
@@ -0,0 +1,169 @@
+"""
+log_records.py: Compact in-memory representation of behavior and homework log entries.
+
+Log entries are saved as plain dicts, but holding tens of thousands of them as
+dicts in memory costs a dict per entry plus a separate copy of the same few
+strings (student names, behavior, type, day) in every one. `LogRecord` stores
+an entry in `__slots__`, with its repeated strings interned, and does not store
+the student's name at all: `student_first_name`/`student_last_name` are looked
+up in the classroom's students when read. Entries logged under a different name
+than the student currently has keep that name.
+
+`LogRecord` is a (mutable) mapping, so code that reads log entries with
+`entry["key"]`, `entry.get(...)`, `in`, iteration or `dict(entry)` works
+unchanged, and it compares equal to the dict it was made from. Conversion
+happens at the boundaries: entries become records when they are loaded or
+inserted into a log (`LogRecordBook.make`), and back into dicts when saved
+(`json_default`).
+"""
+
+import sys
+from collections.abc import Mapping, MutableMapping
+
+_MISSING = object() # Value of a slotted field the entry does not have
+
+# Fields stored in slots, in the order the dict view lists them (the name fields come after student_id).
+_SLOT_KEYS = ("timestamp", "student_id", "behavior", "comment", "type", "day")
+_SLOT_KEY_SET = frozenset(_SLOT_KEYS)
+_NAME_KEYS = {"student_first_name": "first_name", "student_last_name": "last_name"}
+_KEY_ORDER = ("timestamp", "student_id", "student_first_name", "student_last_name", "behavior", "comment", "type", "day")
+# String values of these fields repeat across many entries and are interned
+_INTERNED_KEYS = frozenset(("student_id", "behavior", "type", "day", "homework_type", "homework_status"))
+MAX_INTERNED_COMMENT_LENGTH = 40 # Short comments are mostly stock text ("From Class Quiz session.")
+
+
+def _intern(key, value):
+    if type(value) is str and (key in _INTERNED_KEYS or (key == "comment" and len(value) <= MAX_INTERNED_COMMENT_LENGTH)):
+        return sys.intern(value)
+    return value
+
+
+def json_default(obj):
+    """`default` hook for json.dump(s): writes LogRecords as plain dicts."""
+    if isinstance(obj, LogRecord): return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class LogRecordBook:
+    """
+    Makes the LogRecords of one classroom and resolves their student names.
+
+    :param students_getter: Callable returning the current students dict (it is replaced on load).
+    """
+    def __init__(self, students_getter):
+        self.students = students_getter
+        self.last_names_seen = {} # student_id -> (first, last) as last logged, used once the student is deleted
+
+    def make(self, log_entry):
+        """The LogRecord for a log entry dict (records of this book are returned as they are)."""
+        if isinstance(log_entry, LogRecord) and log_entry._book is self: return log_entry
+        return LogRecord(self, log_entry)
+
+    def make_all(self, log_entries):
+        return [self.make(log_entry) for log_entry in log_entries]
+
+    def student_name(self, student_id, key):
+        student = self.students().get(student_id)
+        if student is not None: return student.get(_NAME_KEYS[key])
+        names = self.last_names_seen.get(student_id)
+        if names is None: return None
+        return names[0] if key == "student_first_name" else names[1]
+
+
+class LogRecord(MutableMapping):
+    """
+    A log entry stored in slots; behaves like the dict it was made from.
+
+    Keys without a slot (marks_data, homework_type, score_details, ...) are kept in `_extra`,
+    which is None when there are none. The student name fields are resolved through the
+    book unless the entry's names differ from the student's, in which case they are in `_extra`.
+    """
+    __slots__ = ("_book", "timestamp", "student_id", "behavior", "comment", "type", "day", "_has_names", "_extra")
+
+    def __init__(self, book, log_entry):
+        self._book = book
+        get = log_entry.get
+        for key in _SLOT_KEYS:
+            setattr(self, key, _intern(key, get(key, _MISSING)))
+        self._extra = None
+        self._has_names = "student_first_name" in log_entry or "student_last_name" in log_entry
+        student = book.students().get(self.student_id) if self._has_names else None
+        # Names are resolved as a pair, only if the entry has the student's current first and last name
+        resolve_names = student is not None and all(student.get(field) == get(key) for key, field in _NAME_KEYS.items())
+        for key, value in log_entry.items():
+            if key in _SLOT_KEY_SET: continue
+            if key in _NAME_KEYS:
+                if resolve_names: continue
+                if type(value) is str: value = sys.intern(value)
+            if self._extra is None: self._extra = {}
+            self._extra[key] = _intern(key, value)
+        if self._has_names:
+            book.last_names_seen[self.student_id] = (get("student_first_name"), get("student_last_name"))
+
+    # --- Mapping protocol ---
+    def __getitem__(self, key):
+        value = self.get(key, _MISSING)
+        if value is _MISSING: raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        if key in _SLOT_KEY_SET:
+            value = getattr(self, key)
+            return default if value is _MISSING else value
+        if self._extra is not None and key in self._extra: return self._extra[key]
+        if key in _NAME_KEYS and self._has_names:
+            value = self._book.student_name(self.student_id, key)
+            return default if value is None else value
+        return default
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __iter__(self):
+        for key in _KEY_ORDER:
+            if key in self: yield key
+        if self._extra is not None:
+            for key in self._extra:
+                if key not in _NAME_KEYS: yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __setitem__(self, key, value):
+        if key in _SLOT_KEY_SET: setattr(self, key, _intern(key, value)); return
+        if self._extra is None: self._extra = {}
+        self._extra[key] = _intern(key, value)
+        if key in _NAME_KEYS: self._has_names = True
+
+    def __delitem__(self, key):
+        if key not in self: raise KeyError(key)
+        if key in _SLOT_KEY_SET: setattr(self, key, _MISSING); return
+        if self._extra is not None: self._extra.pop(key, None)
+        if key in _NAME_KEYS and key in self: # Resolved name: drop both, names are resolved as a pair
+            other = "student_last_name" if key == "student_first_name" else "student_first_name"
+            if other in self: self._extra = dict(self._extra or {}, **{other: self[other]})
+            self._has_names = False
+
+    def __eq__(self, other):
+        if other is self: return True
+        if not isinstance(other, Mapping): return NotImplemented
+        # Cheap rejections first: logs compare entries with equal timestamps against each other
+        if other.get("timestamp", _MISSING) != self.get("timestamp", _MISSING) or \
+           other.get("student_id", _MISSING) != self.get("student_id", _MISSING):
+            return False
+        return self.to_dict() == (other if isinstance(other, dict) else dict(other))
+
+    __hash__ = None
+
+    def to_dict(self):
+        """The entry as a plain dict (the form it is saved in)."""
+        return {key: self[key] for key in self}
+
+    def copy(self):
+        return self.to_dict()
+
+    def __reduce__(self): # Pickles and deep copies are plain dicts
+        return (dict, (self.to_dict(),))
+
+    def __repr__(self):
+        return f"LogRecord({self.to_dict()!r})"
@@ -0,0 +1,143 @@
+"""
+log_stats.py: Incrementally maintained statistics over the behavior and homework logs.
+
+`LogStatsCatalog` answers the questions the export and reporting UI keep asking
+(earliest/latest log, how many logs of each type, per student, per behavior,
+which behavior names occur, which entries belong to a student) without scanning
+or sorting the logs. It is rebuilt
+once when data is loaded and then kept current by the log commands in
+`commands.py`, which report every entry they add or remove. An optional
+aggregate cube (see `log_aggregates.py`) and column store (see `log_columns.py`)
+attached to the catalog receive the same updates.
+"""
+
+from collections import Counter
+from datetime import date
+
+HOMEWORK_LOG_TYPES = ("homework", "homework_session_y", "homework_session_s")
+
+
+def log_item_name(log_entry):
+    """The name a log entry is filed under: the homework type for homework logs, else the behavior/quiz name."""
+    if log_entry.get("type") in HOMEWORK_LOG_TYPES:
+        return log_entry.get("homework_type", log_entry.get("behavior"))
+    return log_entry.get("behavior")
+
+
+class LogStatsCatalog:
+    """
+    Counts and bounds over a set of log entries, updated per entry.
+
+    Earliest/latest timestamps are tracked with a multiset of timestamps, so
+    removing an entry (e.g. on undo) only needs a rescan of the distinct
+    timestamps when the removed entry was the current minimum or maximum.
+    """
+    def __init__(self, aggregates=None, columns=None):
+        self.aggregates = aggregates # Optional LogAggregateCube kept in step with this catalog
+        self.columns = columns # Optional LogColumnStore, likewise
+        self.clear()
+
+    def clear(self):
+        if self.aggregates is not None: self.aggregates.clear()
+        if self.columns is not None: self.columns.clear()
+        self.total_count = 0
+        self.counts_by_type = Counter()
+        self.counts_by_student = Counter()
+        self.counts_by_item = Counter() # (log_type, item_name) -> count
+        self.entries_by_student = {} # student_id -> list of entries (equal to the ones in the logs)
+        self._timestamp_counts = Counter()
+        self._min_timestamp = None
+        self._max_timestamp = None
+
+    def rebuild(self, *logs):
+        """Recomputes the catalog from scratch from one or more log lists."""
+        self.clear()
+        for log in logs:
+            for entry in log: self.add_entry(entry)
+
+    def add_entry(self, log_entry):
+        if self.aggregates is not None: self.aggregates.add_entry(log_entry)
+        if self.columns is not None: self.columns.add_entry(log_entry)
+        log_type = log_entry.get("type", "behavior")
+        self.total_count += 1
+        self.counts_by_type[log_type] += 1
+        self.counts_by_student[log_entry.get("student_id")] += 1
+        self.counts_by_item[(log_type, log_item_name(log_entry))] += 1
+        self.entries_by_student.setdefault(log_entry.get("student_id"), []).append(log_entry)
+        timestamp = log_entry.get("timestamp")
+        if timestamp:
+            self._timestamp_counts[timestamp] += 1
+            if self._min_timestamp is None or timestamp < self._min_timestamp: self._min_timestamp = timestamp
+            if self._max_timestamp is None or timestamp > self._max_timestamp: self._max_timestamp = timestamp
+
+    def remove_entry(self, log_entry):
+        if self.aggregates is not None: self.aggregates.remove_entry(log_entry)
+        if self.columns is not None: self.columns.remove_entry(log_entry)
+        log_type = log_entry.get("type", "behavior")
+        self.total_count = max(self.total_count - 1, 0)
+        self._decrement(self.counts_by_type, log_type)
+        self._decrement(self.counts_by_student, log_entry.get("student_id"))
+        self._decrement(self.counts_by_item, (log_type, log_item_name(log_entry)))
+        student_entries = self.entries_by_student.get(log_entry.get("student_id"))
+        if student_entries is not None:
+            try: student_entries.remove(log_entry)
+            except ValueError: pass
+            if not student_entries: del self.entries_by_student[log_entry.get("student_id")]
+        timestamp = log_entry.get("timestamp")
+        if timestamp and self._decrement(self._timestamp_counts, timestamp) == 0:
+            if timestamp == self._min_timestamp: self._min_timestamp = min(self._timestamp_counts, default=None)
+            if timestamp == self._max_timestamp: self._max_timestamp = max(self._timestamp_counts, default=None)
+
+    def add_entries(self, log_entries):
+        for entry in log_entries: self.add_entry(entry)
+
+    def remove_entries(self, log_entries):
+        for entry in log_entries: self.remove_entry(entry)
+
+    @staticmethod
+    def _decrement(counter, key):
+        remaining = counter.get(key, 0) - 1
+        if remaining > 0: counter[key] = remaining
+        else: counter.pop(key, None); remaining = 0
+        return remaining
+
+    # --- Queries ---
+    def earliest_timestamp(self): return self._min_timestamp
+    def latest_timestamp(self): return self._max_timestamp
+
+    def earliest_date(self, default=None):
+        """The date of the earliest log as a datetime.date, or `default` if there are no (valid) logs."""
+        return self._timestamp_to_date(self._min_timestamp, default)
+
+    def latest_date(self, default=None):
+        return self._timestamp_to_date(self._max_timestamp, default)
+
+    @staticmethod
+    def _timestamp_to_date(timestamp, default):
+        if not timestamp: return default
+        try: return date.fromisoformat(timestamp[:10])
+        except ValueError: return default
+
+    def count(self, log_type=None, student_id=None):
+        """Number of logs, optionally of one type or for one student (not both)."""
+        if log_type is not None: return self.counts_by_type.get(log_type, 0)
+        if student_id is not None: return self.counts_by_student.get(student_id, 0)
+        return self.total_count
+
+    def student_entries(self, student_id):
+        """The student's log entries (behavior, quiz and homework), as equal copies of the logged entries."""
+        return list(self.entries_by_student.get(student_id, ()))
+
+    def count_for_item(self, item_name, log_types=None):
+        """Number of logs filed under `item_name`, optionally restricted to the given log types."""
+        return sum(c for (log_type, name), c in self.counts_by_item.items()
+                   if name == item_name and (log_types is None or log_type in log_types))
+
+    def distinct_item_names(self, log_types=None):
+        """Sorted distinct behavior/quiz/homework names present in the logs, optionally for some log types only."""
+        return sorted({name for (log_type, name) in self.counts_by_item
+                       if name is not None and (log_types is None or log_type in log_types)}, key=str)
+
+    def distinct_behaviors(self):
+        """Sorted distinct behavior and quiz names present in the logs."""
+        return self.distinct_item_names(("behavior", "quiz"))
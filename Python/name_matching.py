@@ -0,0 +1,141 @@
+"""
+name_matching.py: Finding students by names that may be spelled a little differently.
+
+Used when a layout template names students that have to be found in the
+classroom. `NameIndex` normalizes every name once (case, accents,
+underscores and extra spaces are ignored) and indexes its character trigrams.
+A query then only computes the edit distance to candidates that can still reach
+the similarity threshold:
+
+* A candidate whose length differs by more than the allowed number of edits is
+  skipped.
+* Each edit changes at most 3 trigrams, so a candidate must share at least
+  `max(len) + 2 - 3 * allowed_edits` trigrams (of the names padded with two
+  spaces on each side) with the query.
+* The edit distance itself (`bounded_distance`) is only computed within the
+  diagonal band of allowed edits and stops as soon as a whole row exceeds it.
+  Recent results are memoized, so repeated comparisons are looked up.
+
+Similarity is `1 - distance / max(len)`, between 0 and 1.
+"""
+
+import functools
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+DEFAULT_SIMILARITY_THRESHOLD = 0.85
+AMBIGUITY_MARGIN = 0.05 # The best match must beat the next one by this much to be used on its own
+NGRAM_SIZE = 3
+_PADDING = " " * (NGRAM_SIZE - 1)
+_SEPARATORS = re.compile(r"[\s_]+")
+
+
+def normalize_name(name):
+    """Lowercase, without accents, with underscores as spaces and runs of spaces collapsed, e.g. "José_ Smith" -> "jose smith"."""
+    decomposed = unicodedata.normalize("NFKD", str(name or ""))
+    without_accents = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return _SEPARATORS.sub(" ", without_accents.casefold()).strip()
+
+
+def _ngrams(key):
+    padded = f"{_PADDING}{key}{_PADDING}"
+    return Counter(padded[i:i + NGRAM_SIZE] for i in range(len(padded) - NGRAM_SIZE + 1))
+
+
+def _allowed_edits(length, threshold):
+    return int((1.0 - threshold) * length + 1e-9)
+
+
+@functools.lru_cache(maxsize=16384)
+def bounded_distance(a, b, max_distance):
+    """
+    The Levenshtein distance of two strings if it is at most `max_distance`, else `max_distance + 1`.
+
+    Only cells within `max_distance` of the diagonal are computed, in two reused rows.
+    """
+    if a == b: return 0
+    if len(a) < len(b): a, b = b, a
+    n, m, over = len(a), len(b), max_distance + 1
+    if n - m > max_distance: return over
+    if m == 0: return n
+    previous = [j if j <= max_distance else over for j in range(m + 1)]
+    current = [over] * (m + 1)
+    for i in range(1, n + 1):
+        lo, hi = max(1, i - max_distance), min(m, i + max_distance)
+        current[lo - 1] = i if lo == 1 and i <= max_distance else over
+        row_min = current[lo - 1]
+        c = a[i - 1]
+        for j in range(lo, hi + 1):
+            value = previous[j - 1] + (c != b[j - 1])
+            if previous[j] + 1 < value: value = previous[j] + 1
+            if current[j - 1] + 1 < value: value = current[j - 1] + 1
+            if value > over: value = over
+            current[j] = value
+            if value < row_min: row_min = value
+        if hi < m: current[hi + 1] = over # Outside the next row's band
+        if row_min > max_distance: return over # Every path already needs more edits
+        previous, current = current, previous
+    return min(previous[m], over)
+
+
+def similarity(a, b, threshold=0.0):
+    """The similarity (0-1) of two normalized names, or 0.0 if it is below `threshold`."""
+    if not a and not b: return 1.0
+    if not a or not b: return 0.0
+    length = max(len(a), len(b))
+    max_distance = _allowed_edits(length, threshold)
+    distance = bounded_distance(a, b, max_distance)
+    return 0.0 if distance > max_distance else 1.0 - distance / length
+
+
+class NameIndex:
+    """
+    Names of items (e.g. students) indexed for fuzzy lookup.
+
+    :param names: Optional (item_id, name) pairs to add.
+    """
+    def __init__(self, names=()):
+        self._keys = {} # item_id -> normalized name
+        self._positions = {} # item_id -> order added, for ranking ties
+        self._ngrams = defaultdict(list) # trigram -> [(item_id, count)]
+        self._ids_by_length = defaultdict(list)
+        for item_id, name in names: self.add(item_id, name)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def add(self, item_id, name):
+        key = normalize_name(name)
+        if item_id in self._keys or not key: return
+        self._positions[item_id] = len(self._keys)
+        self._keys[item_id] = key
+        self._ids_by_length[len(key)].append(item_id)
+        for gram, count in _ngrams(key).items(): self._ngrams[gram].append((item_id, count))
+
+    def matches(self, name, threshold=DEFAULT_SIMILARITY_THRESHOLD, among=None):
+        """
+        The items whose names are at least `threshold` similar to `name`.
+
+        :param among: Optional collection of item ids to restrict the search to.
+        :return: [(similarity, item_id)], best first (ties in the order the items were added).
+        """
+        key = normalize_name(name)
+        if not key: return []
+        shared = Counter()
+        for gram, query_count in _ngrams(key).items():
+            for item_id, count in self._ngrams.get(gram, ()):
+                shared[item_id] += min(query_count, count)
+        results = []
+        for length, item_ids in self._ids_by_length.items():
+            longest = max(length, len(key))
+            allowed = _allowed_edits(longest, threshold)
+            if abs(length - len(key)) > allowed: continue
+            required_shared = longest + NGRAM_SIZE - 1 - NGRAM_SIZE * allowed
+            for item_id in item_ids:
+                if among is not None and item_id not in among: continue
+                if shared[item_id] < required_shared: continue
+                score = similarity(key, self._keys[item_id], threshold)
+                if score >= threshold and score > 0: results.append((score, item_id))
+        results.sort(key=lambda result: (-result[0], self._positions[result[1]]))
+        return results
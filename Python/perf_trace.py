@@ -0,0 +1,134 @@
+"""
+perf_trace.py: Timing and counters for the app's hot paths.
+
+The `traced` decorator wraps a method of the app in a named span of the app's
+`PerfTracer`. While the tracer is disabled (the default), a traced call costs
+one attribute check. When it is enabled (Settings > "Show performance overlay"):
+
+* every span is kept as a Chrome trace event ("ph": "X"), so a session can be
+  exported with `write_chrome_trace` and opened in chrome://tracing or Perfetto;
+* the last duration of each span is kept for the status-bar overlay;
+* `TracedCanvas` counts the canvas items created and deleted. A frame ends with
+  each full redraw (`draw_all_items`) or single-box redraw outside one; its
+  duration, the item counts and the canvas item total are recorded as a counter
+  event.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+import tkinter as tk
+from collections import deque
+from datetime import datetime
+
+# Oldest events are dropped beyond this, so a long session stays bounded (~100 bytes per event)
+MAX_TRACE_EVENTS = 200_000
+# Spans that draw a frame; only the outermost one on the Tk thread ends it
+FRAME_SPAN_NAMES = ("draw_all_items", "draw_single_student")
+
+
+def traced(name, category="app"):
+    """Decorator for methods of an object with a `perf_tracer`: times each call as span `name` while tracing is on."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(self, *args, **kwargs):
+            tracer = self.perf_tracer
+            if not tracer.enabled: return function(self, *args, **kwargs)
+            start = time.perf_counter()
+            tracer.span_started(name)
+            try:
+                return function(self, *args, **kwargs)
+            finally:
+                tracer.span_finished(name, category, start)
+        return wrapper
+    return decorator
+
+
+class PerfTracer:
+    """Span timings, canvas item counters and the trace events of one session."""
+    def __init__(self):
+        self.enabled = False
+        self.on_update = None # Called with the span name after a span on the Tk thread finishes
+        self.canvas = None # Set by TracedCanvas
+        self.last_ms = {} # Span name -> duration (ms) of its last call
+        self.items_created = 0 # Since the last frame
+        self.items_deleted = 0
+        self.last_frame = None # {"ms", "created", "deleted", "items"}
+        self.events = deque(maxlen=MAX_TRACE_EVENTS)
+        self._origin = time.perf_counter()
+        self._tk_thread_id = threading.get_ident()
+        self._frame_depth = 0
+
+    def set_enabled(self, enabled):
+        if enabled and not self.enabled:
+            self.items_created = self.items_deleted = 0
+            self._frame_depth = 0
+        self.enabled = enabled
+
+    def span_started(self, name):
+        if name in FRAME_SPAN_NAMES and threading.get_ident() == self._tk_thread_id:
+            self._frame_depth += 1
+
+    def span_finished(self, name, category, start):
+        end = time.perf_counter()
+        thread_id = threading.get_ident()
+        duration_ms = (end - start) * 1000
+        self.last_ms[name] = duration_ms
+        self.events.append({"name": name, "cat": category, "ph": "X", "pid": os.getpid(), "tid": thread_id,
+                            "ts": round((start - self._origin) * 1_000_000, 1), "dur": round(duration_ms * 1000, 1)})
+        if thread_id != self._tk_thread_id: return
+        if name in FRAME_SPAN_NAMES:
+            self._frame_depth = max(0, self._frame_depth - 1)
+            if self._frame_depth == 0: self._end_frame(duration_ms, end)
+        if self.on_update is not None: self.on_update(name)
+
+    def _end_frame(self, duration_ms, end):
+        item_count = len(self.canvas.find_all()) if self.canvas is not None else 0
+        self.last_frame = {"ms": duration_ms, "created": self.items_created, "deleted": self.items_deleted, "items": item_count}
+        self.events.append({"name": "canvas items", "ph": "C", "pid": os.getpid(), "tid": self._tk_thread_id,
+                            "ts": round((end - self._origin) * 1_000_000, 1),
+                            "args": {"items": item_count, "created": self.items_created, "deleted": self.items_deleted}})
+        self.items_created = self.items_deleted = 0
+
+    def overlay_text(self):
+        """One line for the status bar: last frame, last save and canvas items."""
+        parts = []
+        if self.last_frame:
+            parts.append(f"Frame {self.last_frame['ms']:.1f} ms")
+        if "save_data_wrapper" in self.last_ms:
+            parts.append(f"Save {self.last_ms['save_data_wrapper']:.1f} ms")
+        if self.last_frame:
+            parts.append(f"{self.last_frame['items']} items (+{self.last_frame['created']}/-{self.last_frame['deleted']})")
+        return " | ".join(parts) or "Performance: waiting for a redraw"
+
+    def write_chrome_trace(self, folder, app_version=""):
+        """Writes the recorded events as a Chrome trace-event JSON file. :return: Its path, or None on error."""
+        path = os.path.join(folder, f"perf_trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+        trace = {"traceEvents": list(self.events), "displayTimeUnit": "ms",
+                 "otherData": {"app_version": app_version, "exported": datetime.now().isoformat(timespec='seconds')}}
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(trace, f)
+        except OSError as e:
+            print(f"Warning: Could not write performance trace to {folder}: {e}")
+            return None
+        return path
+
+
+class TracedCanvas(tk.Canvas):
+    """A Canvas that counts the items created and deleted while its tracer is enabled."""
+    def __init__(self, master, tracer, **kwargs):
+        super().__init__(master, **kwargs)
+        self.tracer = tracer
+        tracer.canvas = self
+
+    def _create(self, itemType, args, kw): # Every create_* method goes through here
+        if self.tracer.enabled: self.tracer.items_created += 1
+        return super()._create(itemType, args, kw)
+
+    def delete(self, *args):
+        if self.tracer.enabled:
+            self.tracer.items_deleted += sum(len(self.find_withtag(tag_or_id)) for tag_or_id in args)
+        super().delete(*args)
@@ -0,0 +1,72 @@
+"""
+render_cache.py: Per-item render state kept apart from the saved classroom data.
+
+Drawing a student box works out the text lines shown in it and the box's
+drawn (dynamic) size, which layout tools such as collision handling and
+alignment then reuse. These used to be stored on the student/furniture dicts
+themselves (`display_lines`, `incident_display_lines`, `_current_world_width`,
+`_current_world_height`), so they were saved, encrypted and copied into undo
+snapshots along with the real data. `RenderCache` holds them by item id instead
+and is never saved; an entry is replaced whenever its item is redrawn and
+dropped when the item is gone.
+"""
+
+RENDER_ONLY_FIELDS = ("display_lines", "incident_display_lines", "_current_world_width", "_current_world_height")
+
+
+def strip_render_fields(item_data):
+    """Removes render-only fields from an item dict in place. :return: True if any were present."""
+    found = False
+    for field in RENDER_ONLY_FIELDS:
+        if field in item_data:
+            del item_data[field]; found = True
+    return found
+
+
+def without_render_fields(item_data):
+    """A copy of `item_data` without render-only fields (the dict itself if it has none)."""
+    if not isinstance(item_data, dict) or not any(field in item_data for field in RENDER_ONLY_FIELDS): return item_data
+    return {key: value for key, value in item_data.items() if key not in RENDER_ONLY_FIELDS}
+
+
+class RenderCache:
+    """Display lines and drawn world size of each student/furniture item, keyed by item id."""
+    def __init__(self):
+        self._entries = {}
+
+    def clear(self):
+        self._entries.clear()
+
+    def invalidate(self, item_id):
+        """Forgets an item's render state (e.g. after it was deleted)."""
+        self._entries.pop(item_id, None)
+
+    def prune(self, live_item_ids):
+        """Drops the entries of items that no longer exist."""
+        for item_id in [item_id for item_id in self._entries if item_id not in live_item_ids]:
+            del self._entries[item_id]
+
+    def set_display_lines(self, item_id, display_lines, incident_display_lines):
+        entry = self._entries.setdefault(item_id, {})
+        entry["display_lines"], entry["incident_display_lines"] = display_lines, incident_display_lines
+
+    def display_lines(self, item_id):
+        return self._entries.get(item_id, {}).get("display_lines", [])
+
+    def incident_display_lines(self, item_id):
+        return self._entries.get(item_id, {}).get("incident_display_lines", [])
+
+    def set_world_size(self, item_id, world_width, world_height):
+        entry = self._entries.setdefault(item_id, {})
+        entry["world_width"], entry["world_height"] = world_width, world_height
+
+    def world_size(self, item_id, item_data, default_width, default_height):
+        """
+        The item's size as last drawn, falling back to its stored size (or the defaults) if it has not been drawn.
+
+        :return: (width, height) in world units.
+        """
+        entry = self._entries.get(item_id, {})
+        width = entry.get("world_width", item_data.get("width", default_width))
+        height = entry.get("world_height", item_data.get("height", default_height))
+        return width, height
@@ -44,6 +44,7 @@ THEME_LIST = ["Light", "Dark", "System"]
 DRAG_THRESHOLD = 5
 DEFAULT_GRID_SIZE = 20
 MAX_UNDO_HISTORY_DAYS = 90
+MAX_UNDO_HISTORY_SIZE_KB = 4096
 LAYOUT_COLLISION_OFFSET = 5
 RESIZE_HANDLE_SIZE = 10 # World units for resize handle
 
@@ -264,6 +265,12 @@ class SettingsDialog(simpledialog.Dialog):
         self.max_undo_days_var.trace_add("write", lambda *args: self.on_setting_change(self.max_undo_days_var, "max_undo_history_days", *args))
         ttk.Spinbox(lf, from_=1, to=90, textvariable=self.max_undo_days_var, width=5).grid(row=10, column=1, sticky=tk.W, padx=5, pady=3)
 
+        # Max Undo History Size
+        ttk.Label(lf, text="Max Undo History Size (KB):").grid(row=11, column=0, sticky=tk.W, padx=5, pady=3)
+        self.max_undo_size_var = tk.IntVar(value=self.settings.get("max_undo_history_size_kb", MAX_UNDO_HISTORY_SIZE_KB), name='max_undo_size_var')
+        self.max_undo_size_var.trace_add("write", lambda *args: self.on_setting_change(self.max_undo_size_var, "max_undo_history_size_kb", *args))
+        ttk.Spinbox(lf, from_=256, to=65536, increment=256, textvariable=self.max_undo_size_var, width=7).grid(row=11, column=1, sticky=tk.W, padx=5, pady=3)
+
 
         # Theme
 
@@ -363,6 +370,18 @@ class SettingsDialog(simpledialog.Dialog):
         self.persist_guides_toggle_var.trace_add("write", lambda *args: self.on_setting_change(self.persist_guides_toggle_var, "guides_stay_when_rulers_hidden", *args))
         ttk.Checkbutton(lf_view_options, text="Keep Guides in Memory when 'Toggle Rulers' is Off", variable=self.persist_guides_toggle_var).grid(row=4, column=0, columnspan=3, sticky=tk.W, padx=5, pady=3)
 
+        self.show_perf_overlay_var = tk.BooleanVar(value=self.settings.get("show_performance_overlay", False), name='show_perf_overlay_var')
+        self.show_perf_overlay_var.trace_add("write", lambda *args: self.on_setting_change(self.show_perf_overlay_var, "show_performance_overlay", *args))
+        ttk.Checkbutton(lf_view_options, text="Show performance overlay (redraw and save times; records a trace for Diagnostics > Export Performance Trace)", variable=self.show_perf_overlay_var).grid(row=5, column=0, columnspan=7, sticky=tk.W, padx=5, pady=3)
+
+        self.stall_watchdog_var = tk.BooleanVar(value=self.settings.get("stall_watchdog_enabled", True), name='stall_watchdog_var')
+        self.stall_watchdog_var.trace_add("write", lambda *args: self.on_setting_change(self.stall_watchdog_var, "stall_watchdog_enabled", *args))
+        ttk.Checkbutton(lf_view_options, text="Record freezes longer than (ms):", variable=self.stall_watchdog_var).grid(row=6, column=0, columnspan=2, sticky=tk.W, padx=5, pady=3)
+        self.stall_threshold_var = tk.IntVar(value=self.settings.get("stall_threshold_ms", 300), name='stall_threshold_var')
+        self.stall_threshold_var.trace_add("write", lambda *args: self.on_setting_change(self.stall_threshold_var, "stall_threshold_ms", *args))
+        ttk.Spinbox(lf_view_options, from_=100, to=5000, increment=50, textvariable=self.stall_threshold_var, width=6).grid(row=6, column=2, sticky=tk.W, padx=5, pady=3)
+        ttk.Label(lf_view_options, text="(to diagnostics.log in the data folder)").grid(row=6, column=3, columnspan=4, sticky=tk.W, padx=5, pady=3)
+
         # Guide Color Settings
         self.guides_color_var = tk.StringVar(value=self.settings.get("guides_color", "blue"), name='guides_color_var')
         self.guides_color_var.trace_add("write", lambda *args: self.on_setting_change(self.guides_color_var, "guides_color", *args))
@@ -882,6 +901,13 @@ class SettingsDialog(simpledialog.Dialog):
         ttk.Checkbutton(lf_autosave_excel, text=f"Enable autosaving log to Excel file ({os.path.basename(AUTOSAVE_EXCEL_FILE)})", variable=self.enable_excel_autosave_var).pack(anchor=tk.W, padx=5, pady=2)
         ttk.Label(lf_autosave_excel, text="Note: This uses current export filters if set, or exports all data. File is overwritten each time.").pack(anchor=tk.W, padx=5, pady=2)
 
+        lf_backup = ttk.LabelFrame(tab_frame, text="Backup Snapshots", padding=10); lf_backup.pack(fill=tk.X, pady=5)
+        self.auto_backup_interval_var = tk.IntVar(value=self.settings.get("auto_backup_interval_minutes", 10), name='auto_backup_interval_var')
+        self.auto_backup_interval_var.trace_add("write", lambda *args: self.on_setting_change(self.auto_backup_interval_var, "auto_backup_interval_minutes", *args))
+        ttk.Label(lf_backup, text="Take a snapshot of all classrooms every (minutes, 0 = off):").pack(side=tk.LEFT, padx=5, pady=2)
+        ttk.Spinbox(lf_backup, from_=0, to=240, increment=5, textvariable=self.auto_backup_interval_var, width=5).pack(side=tk.LEFT, padx=5, pady=2)
+        ttk.Label(lf_backup, text="(only new data is stored; File > Restore Snapshot)").pack(side=tk.LEFT, padx=5, pady=2)
+
         lf_export_image = ttk.LabelFrame(tab_frame, text="Image Exporting", padding=10); lf_export_image.pack(fill=tk.X, pady=5)
         self.dpi_image_export_var = tk.StringVar(value=self.settings.get("output_dpi", 600), name='dpi_image_export_var')
         self.dpi_image_export_var.trace_add("write", lambda *args: self.on_setting_change(self.dpi_image_export_var, "output_dpi", *args))
@@ -981,8 +1007,13 @@ class SettingsDialog(simpledialog.Dialog):
             "grid_size": DEFAULT_GRID_SIZE,
             "current_mode": "behavior", # "behavior", "quiz", or "homework"
             "max_undo_history_days": MAX_UNDO_HISTORY_DAYS,
+            "max_undo_history_size_kb": MAX_UNDO_HISTORY_SIZE_KB,
             "student_groups_enabled": True,
             "show_zoom_level_display": True,
+            "show_performance_overlay": False,
+            "stall_watchdog_enabled": True,
+            "stall_threshold_ms": 300,
+            "auto_backup_interval_minutes": 10,
             "available_fonts": sorted(list(tkfont.families())),
 
             # Quiz specific
@@ -1482,6 +1513,7 @@ class SettingsDialog(simpledialog.Dialog):
             if not file_content: # File is empty
                 return None
 
+            import cryptography.fernet
             try:
                 # Attempt to decrypt first
                 decrypted_data_string = decrypt_data(file_content)
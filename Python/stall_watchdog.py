@@ -0,0 +1,147 @@
+"""
+stall_watchdog.py: Detects and records freezes of the Tk event loop.
+
+A heartbeat scheduled with `root.after` every HEARTBEAT_INTERVAL_MS marks the
+event loop as alive. A helper thread checks it every SAMPLE_INTERVAL_MS; once
+no heartbeat has run for longer than the threshold, the loop is stalled and the
+helper samples the Tk thread's stack (`sys._current_frames`) until the
+heartbeat comes back. Each stall is then written to the rotating diagnostics
+log (`diagnostics.log` in the app data folder) with its duration, the callback
+it started in (e.g. `on_canvas_release`, `autosave_data_wrapper`,
+`update_time_based_formatting`), the most sampled innermost frames and the most
+sampled stack.
+
+Gaps during which the Tk thread was only idle in `mainloop` (for example while
+the computer was asleep) are not stalls and are not recorded.
+"""
+
+import logging
+import os
+import sys
+import threading
+import time
+import tkinter
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+
+DIAGNOSTICS_LOG_FILE_NAME = "diagnostics.log"
+DIAGNOSTICS_LOG_MAX_BYTES = 512 * 1024
+DIAGNOSTICS_LOG_BACKUP_COUNT = 3
+HEARTBEAT_INTERVAL_MS = 50
+SAMPLE_INTERVAL_MS = 20
+DEFAULT_STALL_THRESHOLD_MS = 300
+TOP_FRAMES_TO_LOG = 8
+
+_TKINTER_DIR = os.path.dirname(os.path.abspath(tkinter.__file__))
+
+
+def get_diagnostics_logger(folder):
+    """The logger of the rotating diagnostics log in `folder` (created on first use)."""
+    logger = logging.getLogger("seatingchart.diagnostics")
+    log_path = os.path.join(folder, DIAGNOSTICS_LOG_FILE_NAME)
+    if not any(getattr(handler, "baseFilename", None) == os.path.abspath(log_path) for handler in logger.handlers):
+        for handler in list(logger.handlers): # The data folder changed (e.g. a restore); log to the new one
+            logger.removeHandler(handler); handler.close()
+        try:
+            handler = RotatingFileHandler(log_path, maxBytes=DIAGNOSTICS_LOG_MAX_BYTES, backupCount=DIAGNOSTICS_LOG_BACKUP_COUNT, encoding='utf-8', delay=True)
+        except OSError as e:
+            print(f"Warning: Could not open diagnostics log {log_path}: {e}")
+            return logger
+        handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    return logger
+
+
+def _frame_label(filename, lineno, function):
+    return f"{os.path.basename(filename)}:{lineno} {function}"
+
+
+def _is_tkinter_file(filename):
+    return os.path.dirname(os.path.abspath(filename)) == _TKINTER_DIR
+
+
+class StallWatchdog:
+    """Heartbeat on the Tk thread plus a sampling helper thread; see the module docstring."""
+    def __init__(self, root, log_folder, threshold_ms=DEFAULT_STALL_THRESHOLD_MS):
+        self.root = root
+        self.logger = get_diagnostics_logger(log_folder)
+        self.threshold = threshold_ms / 1000
+        self.running = False
+        self.stall_count = 0
+        self._tk_thread_id = threading.get_ident()
+        self._last_beat = None # perf_counter() of the last heartbeat; None until the event loop runs
+        self._after_id = None
+        self._thread = None
+
+    def start(self):
+        if self.running: return
+        self.running = True
+        self._last_beat = None
+        self._after_id = self.root.after(HEARTBEAT_INTERVAL_MS, self._beat)
+        self._thread = threading.Thread(target=self._watch, name="StallWatchdog", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._after_id is not None:
+            try: self.root.after_cancel(self._after_id)
+            except Exception: pass # The root is already destroyed
+            self._after_id = None
+
+    def _beat(self):
+        self._last_beat = time.perf_counter()
+        if self.running: self._after_id = self.root.after(HEARTBEAT_INTERVAL_MS, self._beat)
+
+    def _watch(self):
+        samples = [] # One tuple of (filename, lineno, function) per sample, outermost frame first
+        stall_beat = None
+        while self.running:
+            time.sleep(SAMPLE_INTERVAL_MS / 1000)
+            last_beat = self._last_beat
+            if last_beat is None: continue
+            if time.perf_counter() - last_beat > self.threshold:
+                if stall_beat != last_beat: stall_beat, samples = last_beat, []
+                stack = self._sample_tk_stack()
+                if stack: samples.append(stack)
+            elif stall_beat is not None:
+                if samples: self._record_stall(last_beat - stall_beat, samples)
+                stall_beat, samples = None, []
+
+    def _sample_tk_stack(self):
+        """The Tk thread's current stack, or None if it is idle in mainloop."""
+        frame = sys._current_frames().get(self._tk_thread_id)
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append((code.co_filename, frame.f_lineno, getattr(code, "co_qualname", code.co_name)))
+            frame = frame.f_back
+        stack.reverse()
+        if not stack or (stack[-1][2].endswith("mainloop") and _is_tkinter_file(stack[-1][0])): return None
+        return tuple(stack)
+
+    @staticmethod
+    def _triggering_callback(stack):
+        """The first app function below Tk's callback dispatch, i.e. the event handler or `after` callback."""
+        inside_tkinter = False
+        for filename, _, function in stack:
+            if _is_tkinter_file(filename): inside_tkinter = True
+            elif inside_tkinter: return function
+        return stack[0][2] if stack else "?"
+
+    def _record_stall(self, duration, samples):
+        self.stall_count += 1
+        # Frames of the stack outside tkinter; the sampled time is attributed to the innermost one
+        innermost = Counter(_frame_label(*next(frame for frame in reversed(stack) if not _is_tkinter_file(frame[0])))
+                            for stack in samples if any(not _is_tkinter_file(frame[0]) for frame in stack))
+        triggers = Counter(self._triggering_callback(stack) for stack in samples)
+        common_stack, common_count = Counter(samples).most_common(1)[0]
+        lines = [f"Stall of {duration * 1000:.0f} ms in {triggers.most_common(1)[0][0]} ({len(samples)} samples)"]
+        if len(triggers) > 1:
+            lines.append("  Callbacks: " + ", ".join(f"{name} x{count}" for name, count in triggers.most_common()))
+        lines.append("  Top frames:")
+        lines += [f"    {count:4d}x {label}" for label, count in innermost.most_common(TOP_FRAMES_TO_LOG)]
+        lines.append(f"  Most sampled stack ({common_count}x):")
+        lines += [f"    {_frame_label(*frame)}" for frame in common_stack if not _is_tkinter_file(frame[0])]
+        self.logger.warning("\n".join(lines))
@@ -0,0 +1,122 @@
+"""
+startup_loader.py: Two-phase startup.
+
+Loading the main data file decrypts and parses every log entry and the undo
+history before anything is drawn, so the time until the seating chart appears
+grows with the log. Startup is split in two phases instead:
+
+1. The layout snapshot, a small file written next to the data file on every
+   save, holds only what drawing the chart needs (students, furniture, guides,
+   settings). It is loaded and drawn right away.
+2. The full data file (logs, log archive, undo history) and the quiz/homework
+   templates are read on a `DeferredLoad` worker thread. The Tk thread polls it
+   with `root.after` and applies the result when it is done, which fills in the
+   recent-incident lines on the student boxes.
+
+The snapshot records the size and modification time of the data file it was
+written with; if the data file has changed since (or the snapshot is missing or
+unreadable), startup falls back to loading the data file in one go.
+"""
+
+import json
+import os
+import threading
+import traceback
+
+from data_encryption import encrypt_data, decrypt_data
+
+# How often (ms) the Tk thread checks whether the deferred load has finished.
+DEFERRED_LOAD_POLL_INTERVAL_MS = 50
+SNAPSHOT_FORMAT = 1
+
+
+def file_stamp(path):
+    """[size, mtime_ns] of a file, or None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def write_layout_snapshot(snapshot_path, data_file_path, layout, encrypt=True):
+    """
+    Writes the layout snapshot for the data file just saved.
+
+    :param layout: Dict with the students, furniture, guides and settings to restore.
+    :param encrypt: Whether to encrypt the snapshot like the data file.
+    """
+    snapshot = {"format": SNAPSHOT_FORMAT, "data_file": file_stamp(data_file_path), "layout": layout}
+    text = json.dumps(snapshot)
+    temp_path = snapshot_path + ".tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(encrypt_data(text) if encrypt else text.encode('utf-8'))
+        os.replace(temp_path, snapshot_path)
+    except OSError as e:
+        print(f"Warning: Could not write layout snapshot {os.path.basename(snapshot_path)}: {e}")
+
+
+def read_layout_snapshot(snapshot_path, data_file_path):
+    """The layout saved with the current data file, or None if the snapshot is missing, unreadable or stale."""
+    if not os.path.exists(snapshot_path): return None
+    import cryptography.fernet
+    try:
+        with open(snapshot_path, 'rb') as f:
+            content = f.read()
+        try:
+            content = decrypt_data(content)
+        except cryptography.fernet.InvalidToken:
+            pass # Written unencrypted
+        snapshot = json.loads(content)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read layout snapshot {os.path.basename(snapshot_path)}: {e}")
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("format") != SNAPSHOT_FORMAT: return None
+    stamp = file_stamp(data_file_path)
+    if stamp is None or snapshot.get("data_file") != stamp: return None # The data file was saved or replaced without it
+    layout = snapshot.get("layout")
+    return layout if isinstance(layout, dict) else None
+
+
+class DeferredLoad:
+    """
+    Runs `load_function` on a worker thread and hands its result to `on_done(result, error)` on the Tk thread.
+
+    The load function must not touch widgets. `wait()` finishes the load synchronously, for actions
+    that need its result before it would otherwise be applied.
+    """
+    def __init__(self, root, load_function, on_done):
+        self.root = root
+        self.on_done = on_done
+        self.result = None
+        self.error = None
+        self.applied = False
+        self._thread = threading.Thread(target=self._run, args=(load_function,), daemon=True)
+        self._thread.start()
+        self.root.after(DEFERRED_LOAD_POLL_INTERVAL_MS, self._poll)
+
+    def _run(self, load_function):
+        try:
+            self.result = load_function()
+        except Exception as e: # Reported on the Tk thread
+            traceback.print_exc()
+            self.error = e
+
+    def _poll(self):
+        if self.applied: return
+        if self._thread.is_alive():
+            self.root.after(DEFERRED_LOAD_POLL_INTERVAL_MS, self._poll)
+            return
+        self._apply()
+
+    def wait(self):
+        """Blocks until the load has finished and its result has been applied."""
+        if self.applied: return
+        self._thread.join()
+        self._apply()
+
+    def _apply(self):
+        if self.applied: return
+        self.applied = True
+        self.on_done(self.result, self.error)
@@ -0,0 +1,102 @@
+"""
+startup_profile.py: The `--profile-startup` mode of the desktop app.
+
+Started with `--profile-startup`, the app times every module import made while
+it starts (like `python -X importtime`, which is not available in a packaged
+build) and records milestones such as the first draw of the seating chart.
+Once the chart has been drawn and the logs and history have finished loading,
+the report is written to the app data folder:
+
+* `startup_profile_<date>_<time>.txt`: the milestones, then one
+  `import time: self [us] | cumulative | imported package` line per import in
+  the format of `-X importtime` (nested imports indented).
+* `startup_profiles.jsonl`: one JSON line per profiled start (milestones and
+  the slowest imports), for comparing startups across versions.
+"""
+
+import builtins
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+PROFILE_STARTUP_FLAG = "--profile-startup"
+PROFILE_HISTORY_FILE_NAME = "startup_profiles.jsonl"
+SLOWEST_IMPORTS_IN_HISTORY = 15
+
+
+def start_startup_profile(argv):
+    """Starts profiling if `argv` contains --profile-startup (the flag is removed). :return: The StartupProfile, or None."""
+    if PROFILE_STARTUP_FLAG not in argv: return None
+    argv.remove(PROFILE_STARTUP_FLAG)
+    return StartupProfile()
+
+
+class StartupProfile:
+    """Import timings and named milestones (seconds since the profile started) of one app start."""
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.milestones = [] # (label, seconds)
+        self.imports = [] # (depth, name, self_us, cumulative_us), in completion order like -X importtime
+        self._stack = [] # Microseconds spent in nested imports, per import in progress
+        self._thread_id = threading.get_ident()
+        self._original_import = builtins.__import__
+        builtins.__import__ = self._timed_import
+
+    def _timed_import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original = self._original_import
+        # Only first imports made on the starting thread are timed (the background loader imports concurrently)
+        if level or threading.get_ident() != self._thread_id or self._is_loaded(name, fromlist):
+            return original(name, globals, locals, fromlist, level)
+        self._stack.append(0)
+        start = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            cumulative_us = int((time.perf_counter() - start) * 1_000_000)
+            nested_us = self._stack.pop()
+            if self._stack: self._stack[-1] += cumulative_us
+            self.imports.append((len(self._stack), name, cumulative_us - nested_us, cumulative_us))
+
+    @staticmethod
+    def _is_loaded(name, fromlist):
+        module = sys.modules.get(name)
+        if module is None: return False
+        return not fromlist or all(hasattr(module, item) for item in fromlist if item != "*")
+
+    def stop_import_timing(self):
+        if builtins.__import__ == self._timed_import: builtins.__import__ = self._original_import
+
+    def mark(self, label):
+        """Records a milestone the first time it is reached."""
+        if not self.has_mark(label):
+            self.milestones.append((label, time.perf_counter() - self.started))
+
+    def has_mark(self, label):
+        return any(existing == label for existing, _ in self.milestones)
+
+    def write(self, folder, app_version=""):
+        """Writes the report and appends the summary to the history file. :return: The report path, or None on error."""
+        self.stop_import_timing()
+        stamp = datetime.now()
+        report_path = os.path.join(folder, f"startup_profile_{stamp.strftime('%Y%m%d_%H%M%S')}.txt")
+        lines = [f"Startup profile {stamp.isoformat(timespec='seconds')} {app_version}".rstrip(), ""]
+        lines += [f"{seconds * 1000:10.1f} ms  {label}" for label, seconds in self.milestones]
+        lines += ["", "import time: self [us] | cumulative | imported package"]
+        lines += [f"import time: {self_us:>9} | {cumulative_us:>10} | {'  ' * depth}{name}" for depth, name, self_us, cumulative_us in self.imports]
+        slowest = sorted((item for item in self.imports if item[0] == 0), key=lambda item: item[3], reverse=True)[:SLOWEST_IMPORTS_IN_HISTORY]
+        summary = {"timestamp": stamp.isoformat(timespec='seconds'), "app_version": app_version,
+                   "milestones_ms": {label: round(seconds * 1000, 1) for label, seconds in self.milestones},
+                   "import_total_ms": round(sum(item[3] for item in self.imports if item[0] == 0) / 1000, 1),
+                   "slowest_imports_ms": {name: round(cumulative_us / 1000, 1) for _, name, _, cumulative_us in slowest}}
+        try:
+            with open(report_path, 'w', encoding='utf-8') as f:
+                f.write("\n".join(lines) + "\n")
+            with open(os.path.join(folder, PROFILE_HISTORY_FILE_NAME), 'a', encoding='utf-8') as f:
+                f.write(json.dumps(summary) + "\n")
+        except OSError as e:
+            print(f"Warning: Could not write startup profile to {folder}: {e}")
+            return None
+        return report_path
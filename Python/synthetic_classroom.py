@@ -0,0 +1,209 @@
+"""
+synthetic_classroom.py: Generates synthetic classroom data files for testing and benchmarks.
+
+The only real data at hand (`Samples/classroom_data_v10.json`) has 4 students and
+66 logs, which says nothing about how the app behaves for a full year of a large
+class. `generate_classroom` builds a valid v10 data file at any scale: students
+in a grid of desks, furniture, behavior/quiz/homework logs spread over a date
+range, conditional formatting rules of the main rule types, and undo history.
+The same seed always gives the same data.
+
+Usage:
+    python synthetic_classroom.py out.json --students 60 --logs 50000 [--days 180] [--seed 1] [--encrypt]
+"""
+
+import argparse
+import json
+import random
+from datetime import datetime, timedelta
+
+BEHAVIORS = ["Talking", "Off Task", "Out of Seat", "Uneasy", "Placecheck",
+             "Great Participation", "Called On", "Complimented", "Fighting", "Other"]
+HOMEWORK_TYPES = ["Reading Assignment", "Worksheet", "Math Problems", "Project Work", "Study for Test"]
+QUIZ_NAMES = ["Pop Quiz", "Chapter Test", "Vocabulary Quiz", "Math Quiz"]
+QUIZ_MARK_IDS = ["mark_correct", "mark_incorrect", "mark_partial"]
+HOMEWORK_MARK_IDS = ["hmark_complete", "hmark_incomplete", "hmark_notdone"]
+FIRST_NAMES = ["Avi", "Ben", "Chaim", "Dovid", "Eli", "Moshe", "Noam", "Shimon", "Yaakov", "Yosef",
+               "Ari", "Levi", "Meir", "Natan", "Ruvi", "Tzvi", "Gavi", "Hillel", "Kalman", "Ezra"]
+LAST_NAMES = ["Cohen", "Levi", "Katz", "Friedman", "Goldberg", "Klein", "Maimon", "Rosen", "Schwartz", "Weiss"]
+
+# Share of the logs of each kind; the rest are behavior logs
+QUIZ_LOG_SHARE = 0.15
+HOMEWORK_LOG_SHARE = 0.25
+DESK_SPACING_X, DESK_SPACING_Y = 170, 120
+
+
+def _timestamps(rng, count, start, days):
+    """`count` sorted ISO timestamps during school hours (8:00-16:00) over `days` days from `start`."""
+    seconds = sorted(rng.randrange(days * 86400) for _ in range(count))
+    stamps = []
+    for offset in seconds:
+        day, second_of_day = divmod(offset, 86400)
+        stamps.append(start + timedelta(days=day, hours=8, seconds=second_of_day / 3)) # The day's 24 hours squeezed into 8
+    return stamps
+
+
+def _students(rng, num_students):
+    students = {}
+    columns = max(1, round(num_students ** 0.5 * 1.5))
+    for index in range(num_students):
+        student_id = f"student_{index + 1}"
+        first_name, last_name = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        row, column = divmod(index, columns)
+        students[student_id] = {
+            "first_name": first_name, "last_name": last_name, "nickname": "",
+            "full_name": f"{first_name} {last_name}", "gender": "Boy",
+            "x": 50.0 + column * DESK_SPACING_X, "y": 250.0 + row * DESK_SPACING_Y, "id": student_id,
+            "width": 130, "height": 80, "original_next_id_num_after_add": index + 2,
+            "group_id": None, "style_overrides": {}
+        }
+    return students
+
+
+def _furniture(num_furniture, num_students):
+    furniture = {}
+    for index in range(num_furniture):
+        furniture_id = f"furniture_{index + 1}"
+        is_desk = index == 0
+        furniture[furniture_id] = {
+            "name": "Desk" if is_desk else f"Shelf {index}", "type": "Rebbi's Desk" if is_desk else "Shelf",
+            "x": 600.0 if is_desk else 50.0 + (index - 1) * 250, "y": 80.0, "id": furniture_id,
+            "width": 200, "height": 100, "fill_color": "lightgray", "outline_color": "dimgray",
+            "original_next_id_num_after_add": index + 2
+        }
+    return furniture
+
+
+def _log_entry(student_id, student, moment, log_type, name, comment=""):
+    return {"timestamp": moment.isoformat(), "student_id": student_id,
+            "student_first_name": student["first_name"], "student_last_name": student["last_name"],
+            "behavior": name, "comment": comment, "type": log_type, "day": moment.strftime('%A')}
+
+
+def _logs(rng, students, num_logs, start, days):
+    """:return: (behavior_log, homework_log), each sorted by timestamp."""
+    behavior_log, homework_log = [], []
+    student_ids = list(students)
+    for moment in _timestamps(rng, num_logs, start, days):
+        student_id = rng.choice(student_ids)
+        student = students[student_id]
+        kind = rng.random()
+        if kind < QUIZ_LOG_SHARE:
+            num_questions = rng.choice((5, 10, 20))
+            correct = rng.randint(0, num_questions)
+            partial = rng.randint(0, num_questions - correct)
+            entry = _log_entry(student_id, student, moment, "quiz", rng.choice(QUIZ_NAMES))
+            entry["marks_data"] = {"mark_correct": correct, "mark_incorrect": num_questions - correct - partial, "mark_partial": partial}
+            entry["num_questions"] = num_questions
+            behavior_log.append(entry)
+        elif kind < QUIZ_LOG_SHARE + HOMEWORK_LOG_SHARE:
+            homework_type = rng.choice(HOMEWORK_TYPES)
+            if rng.random() < 0.5: # Manually logged with marks
+                entry = _log_entry(student_id, student, moment, "homework", homework_type)
+                entry["homework_type"] = homework_type
+                entry["marks_data"] = {rng.choice(HOMEWORK_MARK_IDS): 1}
+                entry["num_items"] = 1
+            else: # From a Yes/No live homework session
+                entry = _log_entry(student_id, student, moment, "homework_session_y", "Homework Check",
+                                   "From Live Homework Session (Yes/No mode).")
+                entry["homework_details"] = {name: rng.choice(("yes", "no")) for name in rng.sample(HOMEWORK_TYPES, 2)}
+            homework_log.append(entry)
+        else:
+            behavior_log.append(_log_entry(student_id, student, moment, "behavior", rng.choice(BEHAVIORS)))
+    return behavior_log, homework_log
+
+
+def _conditional_rules():
+    """One or more rules of each log-based rule type."""
+    return [
+        {"type": "behavior_count", "application_style": "stripe", "active_modes": [], "active_times": [], "enabled": True,
+         "color": "#ff4242", "outline": "#495af8", "behavior_name": "Talking", "count_threshold": 2, "time_window_hours": 24},
+        {"type": "behavior_count", "application_style": "stripe", "active_modes": [], "active_times": [], "enabled": True,
+         "color": "#71d0aa", "outline": "#fb6246", "behavior_name": "Great Participation", "count_threshold": 1, "time_window_hours": 168},
+        {"type": "quiz_score_threshold", "application_style": "override", "active_modes": [], "active_times": [], "enabled": True,
+         "color": "#ffd0d0", "outline": "#c00000", "quiz_name_contains": "Quiz", "operator": "<=", "score_threshold_percent": 50.0},
+        {"type": "quiz_mark_count", "application_style": "stripe", "active_modes": [], "active_times": [], "enabled": True,
+         "color": "#d0ffd0", "outline": "#00a000", "quiz_name_contains": "", "mark_type_id": "mark_correct",
+         "mark_operator": ">=", "mark_count_threshold": 18},
+    ]
+
+
+def _undo_history(rng, students, behavior_log, num_commands):
+    """Serialized commands in the embedded undo stack format that the app moves into its history file on load."""
+    commands = []
+    student_ids = list(students)
+    for index, log_entry in enumerate(behavior_log[-num_commands:]):
+        if index % 4 == 3: # Every fourth command is a move
+            student_id = rng.choice(student_ids)
+            x, y = students[student_id]["x"], students[student_id]["y"]
+            commands.append({"type": "MoveItemsCommand", "timestamp": log_entry["timestamp"],
+                             "data": {"items_moves": [{"id": student_id, "type": "student", "old_x": x, "old_y": y, "new_x": x, "new_y": y}]}})
+        else:
+            commands.append({"type": "LogEntryCommand", "timestamp": log_entry["timestamp"],
+                             "data": {"log_entry": dict(log_entry), "student_id": log_entry["student_id"]}})
+    return commands
+
+
+def generate_classroom(num_students=30, num_logs=5000, num_furniture=3, days=180, undo_commands=100, seed=0, end=None):
+    """
+    Builds a synthetic v10 classroom data dict.
+
+    :param num_logs: Total behavior, quiz and homework log entries.
+    :param days: Length of the period the logs are spread over, ending at `end` (default: now).
+    :param undo_commands: Number of commands on the undo stack (at most the number of behavior logs).
+    :param seed: Random seed; the same arguments give the same data.
+    """
+    rng = random.Random(seed)
+    end = end or datetime.now()
+    start = (end - timedelta(days=days)).replace(hour=0, minute=0, second=0, microsecond=0)
+    students = _students(rng, num_students)
+    behavior_log, homework_log = _logs(rng, students, num_logs, start, days)
+    settings = {
+        "conditional_formatting_rules": _conditional_rules(),
+        "next_student_id_num": num_students + 1, "next_furniture_id_num": num_furniture + 1,
+        "encrypt_data_files": False,
+    }
+    return {
+        "students": students,
+        "furniture": _furniture(num_furniture, num_students),
+        "behavior_log": behavior_log,
+        "homework_log": homework_log,
+        "settings": settings,
+        "last_excel_export_path": None,
+        "_per_student_last_cleared": {},
+        "log_archive": {},
+        "undo_stack": _undo_history(rng, students, behavior_log, undo_commands),
+        "redo_stack": [],
+        "guides": {"guide_v_1": {"id": "guide_v_1", "type": "v", "world_coord": 40.0}},
+        "next_guide_id_num": 2,
+    }
+
+
+def write_classroom(data, path, encrypt=False):
+    """Writes a data dict the way the app saves it (encrypted if `encrypt`)."""
+    data.setdefault("settings", {})["encrypt_data_files"] = encrypt
+    text = json.dumps(data, indent=4)
+    if encrypt:
+        from data_encryption import encrypt_data
+        data_bytes = encrypt_data(text)
+    else:
+        data_bytes = text.encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(data_bytes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic classroom data file (v10).")
+    parser.add_argument("output", help="Path of the data file to write, e.g. classroom_data_v10.json")
+    parser.add_argument("--students", type=int, default=30)
+    parser.add_argument("--logs", type=int, default=5000, help="Total behavior, quiz and homework logs")
+    parser.add_argument("--furniture", type=int, default=3)
+    parser.add_argument("--days", type=int, default=180, help="Number of days the logs are spread over")
+    parser.add_argument("--undo-commands", type=int, default=100)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--encrypt", action="store_true", help="Encrypt the file like the app does by default")
+    args = parser.parse_args()
+    classroom = generate_classroom(args.students, args.logs, args.furniture, args.days, args.undo_commands, args.seed)
+    write_classroom(classroom, args.output, encrypt=args.encrypt)
+    print(f"Wrote {args.students} students, {len(classroom['behavior_log'])} behavior/quiz and "
+          f"{len(classroom['homework_log'])} homework logs to {args.output}")
@@ -9,12 +9,20 @@ from datetime import date
 from tkcalendar import DateEntry
 
 
+ALL_TYPES_LABEL = "All types"
+SEARCH_DELAY_MS = 200 # Filtering waits for a pause in typing
+
 # --- Main Requested Dialog: Undo History ---
 
 class UndoHistoryDialog(tk.Toplevel):
     """
     A dialog that displays the undo history, allowing the user to select
     a point to revert to and redo, effectively branching the history.
+
+    The list is virtual: the listbox only ever holds the rows currently in view, and
+    the scrollbar is driven by the number of (filtered) history entries. Filtering by
+    command type and date uses the history file's record headers, so paged-out
+    commands are not rebuilt just to be listed.
     """
     def __init__(self, parent, app):
         """
@@ -29,42 +37,83 @@ class UndoHistoryDialog(tk.Toplevel):
         self.app = app
         self.result = None
 
-        self.geometry("550x450")
+        self.filtered_indices = [] # undo_stack indices matching the filters, most recent first
+        self.top_row = 0 # Position in filtered_indices of the first visible row
+        self.visible_rows = 1
+        self.selected_index = None # undo_stack index of the selected action
+        self._descriptions = {} # undo_stack index -> description, for this dialog's lifetime
+        self._last_search = ""
+        self._search_job = None
+
+        self.geometry("600x500")
         self.protocol("WM_DELETE_WINDOW", self.cancel)
         self.grab_set()
 
         main_frame = ttk.Frame(self, padding="10")
         main_frame.pack(fill=tk.BOTH, expand=True)
-        main_frame.grid_rowconfigure(1, weight=1)
+        main_frame.grid_rowconfigure(2, weight=1)
         main_frame.grid_columnconfigure(0, weight=1)
 
         info_label = ttk.Label(main_frame, text="Select an action to return to. This will discard all subsequent changes.", wraplength=500)
         info_label.grid(row=0, column=0, columnspan=2, sticky="w", pady=(0, 10))
 
+        filter_frame = ttk.Frame(main_frame)
+        filter_frame.grid(row=1, column=0, columnspan=2, sticky="ew", pady=(0, 5))
+        filter_frame.grid_columnconfigure(1, weight=1)
+        ttk.Label(filter_frame, text="Search:").grid(row=0, column=0, sticky="w", padx=(0, 5))
+        self.search_var = tk.StringVar()
+        self.search_var.trace_add("write", lambda *args: self.schedule_search())
+        ttk.Entry(filter_frame, textvariable=self.search_var).grid(row=0, column=1, sticky="ew")
+        ttk.Label(filter_frame, text="Type:").grid(row=0, column=2, sticky="w", padx=(10, 5))
+        self.type_var = tk.StringVar(value=ALL_TYPES_LABEL)
+        self.type_combo = ttk.Combobox(filter_frame, textvariable=self.type_var, state="readonly", width=24)
+        self.type_combo.grid(row=0, column=3, sticky="w")
+        self.type_combo.bind("<<ComboboxSelected>>", lambda e: self.apply_filters())
+
+        self.date_filter_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(filter_frame, text="Between", variable=self.date_filter_var, command=self.apply_filters).grid(row=1, column=0, sticky="w", pady=(5, 0))
+        date_frame = ttk.Frame(filter_frame)
+        date_frame.grid(row=1, column=1, columnspan=3, sticky="w", pady=(5, 0))
+        self.start_date_entry = DateEntry(date_frame, width=12, date_pattern='yyyy-mm-dd')
+        self.start_date_entry.pack(side=tk.LEFT)
+        ttk.Label(date_frame, text="and").pack(side=tk.LEFT, padx=5)
+        self.end_date_entry = DateEntry(date_frame, width=12, date_pattern='yyyy-mm-dd')
+        self.end_date_entry.pack(side=tk.LEFT)
+        for entry in (self.start_date_entry, self.end_date_entry):
+            entry.bind("<<DateEntrySelected>>", lambda e: self.apply_filters() if self.date_filter_var.get() else None)
+
         list_frame = ttk.Frame(main_frame)
-        list_frame.grid(row=1, column=0, columnspan=2, sticky="nsew")
+        list_frame.grid(row=2, column=0, columnspan=2, sticky="nsew")
         list_frame.grid_rowconfigure(0, weight=1)
         list_frame.grid_columnconfigure(0, weight=1)
 
-        self.listbox = tk.Listbox(list_frame, selectmode=tk.SINGLE, font=("TkDefaultFont", 10))
+        self.listbox = tk.Listbox(list_frame, selectmode=tk.SINGLE, font=("TkDefaultFont", 10), activestyle=tk.NONE, exportselection=False)
         self.listbox.grid(row=0, column=0, sticky="nsew")
         self.listbox.bind('<<ListboxSelect>>', self.on_select)
         self.listbox.bind('<Double-1>', lambda e: self.on_redo())
+        self.listbox.bind('<Configure>', self.on_list_resized)
+        self.listbox.bind('<MouseWheel>', lambda e: self.scroll_rows(-1 if e.delta > 0 else 1) or "break")
+        self.listbox.bind('<Button-4>', lambda e: self.scroll_rows(-1) or "break")
+        self.listbox.bind('<Button-5>', lambda e: self.scroll_rows(1) or "break")
+        for key, step in (('<Up>', -1), ('<Down>', 1), ('<Prior>', "-page"), ('<Next>', "page"), ('<Home>', "home"), ('<End>', "end")):
+            self.listbox.bind(key, lambda e, step=step: self.move_selection(step) or "break")
 
-
-        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.listbox.yview)
+        scrollbar = ttk.Scrollbar(list_frame, orient=tk.VERTICAL, command=self.on_scrollbar)
         scrollbar.grid(row=0, column=1, sticky="ns")
-        self.listbox.config(yscrollcommand=scrollbar.set)
+        self.scrollbar = scrollbar
 
-        self.populate_history()
+        self.count_label = ttk.Label(main_frame, text="")
+        self.count_label.grid(row=3, column=0, sticky="w", pady=(10, 0))
 
         button_frame = ttk.Frame(main_frame)
-        button_frame.grid(row=2, column=0, columnspan=2, sticky="e", pady=(10, 0))
+        button_frame.grid(row=3, column=1, sticky="e", pady=(10, 0))
 
         self.redo_button = ttk.Button(button_frame, text="Go to This Action", command=self.on_redo, state=tk.DISABLED)
         self.redo_button.pack(side=tk.LEFT, padx=5)
         ttk.Button(button_frame, text="Cancel", command=self.cancel).pack(side=tk.LEFT)
 
+        self.populate_history()
+
         # Center the dialog on the parent
         self.update_idletasks()
         parent_x = parent.winfo_x()
@@ -80,31 +129,138 @@ class UndoHistoryDialog(tk.Toplevel):
 
     def populate_history(self):
         """
-        Clears and fills the listbox with descriptions of commands
-        from the application's undo stack.
+        Re-reads the undo stack (e.g. after it changed) and redisplays it with the current filters.
         """
-        self.listbox.delete(0, tk.END)
-        # The undo_stack is in chronological order. We reverse it for display
-        # so the most recent action appears at the top of the list.
-        if not self.app.undo_stack:
-            self.listbox.insert(tk.END, " No actions in history.")
-            self.listbox.config(state=tk.DISABLED)
-            return
+        self._descriptions.clear()
+        self._last_search = ""
+        stack = self.app.undo_stack
+        types = sorted({self._command_type(i) for i in range(len(stack))})
+        self.type_combo.config(values=[ALL_TYPES_LABEL] + types)
+        if self.type_var.get() not in types: self.type_var.set(ALL_TYPES_LABEL)
+        self.apply_filters()
+
+    # --- Entry data (read from the record headers; commands are not paged in) ---
+    def _command_type(self, index):
+        stack = self.app.undo_stack
+        return stack.command_type(index) if hasattr(stack, "command_type") else type(stack[index]).__name__
+
+    def _timestamp(self, index):
+        stack = self.app.undo_stack
+        return (stack.timestamp(index) if hasattr(stack, "timestamp") else stack[index].timestamp) or ""
 
-        for i, command in enumerate(reversed(self.app.undo_stack)):
+    def _description(self, index):
+        if index not in self._descriptions:
+            stack = self.app.undo_stack
             try:
-                # NOTE: This assumes your Command objects have a `get_description()` method.
-                description = command.get_description()
-                # Display with a number, like "15: Moved 1 item(s)"
-                self.listbox.insert(tk.END, f" {len(self.app.undo_stack) - i}: {description}")
+                self._descriptions[index] = stack.description(index) if hasattr(stack, "description") else stack[index].get_description()
             except Exception as e:
                 # Fallback if get_description fails for any reason
-                self.listbox.insert(tk.END, f" {len(self.app.undo_stack) - i}: {type(command).__name__}")
-                print(f"Could not get description for command {type(command).__name__}: {e}")
+                self._descriptions[index] = self._command_type(index)
+                print(f"Could not get description for history entry {index + 1}: {e}")
+        return self._descriptions[index]
+
+    # --- Filtering ---
+    def schedule_search(self):
+        """Refilters shortly after typing stops, so each keystroke does not rescan the history."""
+        if self._search_job: self.after_cancel(self._search_job)
+        self._search_job = self.after(SEARCH_DELAY_MS, self.apply_search)
+
+    def apply_search(self):
+        self._search_job = None
+        search = self.search_var.get().strip().lower()
+        if search.startswith(self._last_search) and self._last_search:
+            # Narrowing the previous search: only its matches can still match
+            self._set_filtered([i for i in self.filtered_indices if search in self._description(i).lower()])
+            self._last_search = search
+        else:
+            self.apply_filters()
+
+    def apply_filters(self):
+        """Rebuilds the filtered index list from all history entries and redisplays it."""
+        search = self.search_var.get().strip().lower()
+        command_type = self.type_var.get()
+        date_range = None
+        if self.date_filter_var.get():
+            date_range = (self.start_date_entry.get_date().isoformat(), self.end_date_entry.get_date().isoformat())
+        matches = []
+        for i in range(len(self.app.undo_stack) - 1, -1, -1):
+            if command_type != ALL_TYPES_LABEL and self._command_type(i) != command_type: continue
+            if date_range and not date_range[0] <= self._timestamp(i)[:10] <= date_range[1]: continue
+            if search and search not in self._description(i).lower(): continue
+            matches.append(i)
+        self._last_search = search
+        self._set_filtered(matches)
+
+    def _set_filtered(self, indices):
+        self.filtered_indices = indices
+        if self.selected_index not in indices: self.selected_index = None
+        self.top_row = 0
+        total = len(self.app.undo_stack)
+        self.count_label.config(text=f"{len(indices)} of {total} actions" if len(indices) != total else f"{total} actions")
+        self.render()
+
+    # --- Virtual list ---
+    def render(self):
+        """Fills the listbox with just the rows in view and syncs the scrollbar."""
+        self.listbox.config(state=tk.NORMAL)
+        self.listbox.delete(0, tk.END)
+        if not self.filtered_indices:
+            self.listbox.insert(tk.END, " No actions in history." if not self.app.undo_stack else " No matching actions.")
+            self.listbox.config(state=tk.DISABLED)
+            self.scrollbar.set(0, 1)
+            self.on_select()
+            return
+        self.top_row = max(0, min(self.top_row, len(self.filtered_indices) - self.visible_rows))
+        visible = self.filtered_indices[self.top_row:self.top_row + self.visible_rows]
+        # Display with a number, like "15: Moved 1 item(s)"
+        self.listbox.insert(tk.END, *(f" {i + 1}: {self._description(i)}" for i in visible))
+        if self.selected_index in visible:
+            self.listbox.selection_set(visible.index(self.selected_index))
+        total = len(self.filtered_indices)
+        self.scrollbar.set(self.top_row / total, min(1.0, (self.top_row + len(visible)) / total))
+        self.on_select()
+
+    def on_list_resized(self, event):
+        line_height = max(1, self.listbox.tk.call("font", "metrics", self.listbox.cget("font"), "-linespace") + 1)
+        rows = max(1, (event.height - 4) // line_height)
+        if rows != self.visible_rows:
+            self.visible_rows = rows
+            self.render()
+
+    def scroll_rows(self, rows):
+        self.top_row += rows
+        self.render()
+
+    def on_scrollbar(self, action, amount, unit=None):
+        """The scrollbar command: 'moveto <fraction>' or 'scroll <n> units|pages'."""
+        if action == "moveto":
+            self.top_row = int(float(amount) * len(self.filtered_indices))
+        elif action == "scroll":
+            self.top_row += int(amount) * (self.visible_rows if unit == "pages" else 1)
+        self.render()
+
+    def move_selection(self, step):
+        """Keyboard navigation: moves the selection, scrolling it into view."""
+        if not self.filtered_indices: return
+        last = len(self.filtered_indices) - 1
+        position = self.filtered_indices.index(self.selected_index) if self.selected_index is not None else -1
+        if step == "home": position = 0
+        elif step == "end": position = last
+        elif step == "page": position += self.visible_rows
+        elif step == "-page": position -= self.visible_rows
+        else: position += step
+        position = max(0, min(position, last))
+        self.selected_index = self.filtered_indices[position]
+        if position < self.top_row: self.top_row = position
+        elif position >= self.top_row + self.visible_rows: self.top_row = position - self.visible_rows + 1
+        self.render()
 
     def on_select(self, event=None):
         """Enables the 'Redo' button when an item is selected in the listbox."""
-        if self.listbox.curselection():
+        selection = self.listbox.curselection()
+        if selection and self.filtered_indices:
+            self.selected_index = self.filtered_indices[self.top_row + selection[0]]
+        if self.selected_index is not None:
             self.redo_button.config(state=tk.NORMAL)
         else:
             self.redo_button.config(state=tk.DISABLED)
@@ -112,26 +268,21 @@ class UndoHistoryDialog(tk.Toplevel):
     def on_redo(self):
         """
         Handles the 'Go to This Action' button click.
-        It calculates the correct index and calls the app's selective redo method.
+        Calls the app's selective redo method with the selected action's undo_stack index.
         """
-        selection_indices = self.listbox.curselection()
-        if not selection_indices:
+        if self.selected_index is None:
             return
 
-        # The listbox is visually reversed, so we must convert the selected
-        # listbox index back to the correct index for the `undo_stack`.
-        selected_listbox_index = selection_indices[0]
-        target_command_index = (len(self.app.undo_stack) - 1) - selected_listbox_index
-
         if messagebox.askyesno("Confirm Action",
                                "This will revert the application to the selected point in history, discarding all changes made after it. This cannot be undone.\n\nAre you sure you want to proceed?",
                                parent=self, icon='warning'):
             # Call the main app's logic handler
-            self.app.selective_redo_action(target_command_index)
+            self.app.selective_redo_action(self.selected_index)
             self.destroy()
 
     def cancel(self):
         """Closes the dialog."""
+        if self._search_job: self.after_cancel(self._search_job)
         self.destroy()
 
 
@@ -0,0 +1,45 @@
+import random
+from datetime import date, datetime, timedelta
+
+from attendance_engine import build_attendance_grid, log_slice_for_dates
+
+
+def make_log(rng, student_ids, count):
+    start = datetime(2025, 8, 25)
+    log = [{"student_id": rng.choice(student_ids), "timestamp": (start + timedelta(minutes=rng.randrange(60 * 24 * 30))).isoformat(), "type": "behavior"}
+           for _ in range(count)]
+    log.sort(key=lambda entry: entry["timestamp"])
+    return log
+
+
+def test_grid_matches_a_scan_of_every_entry():
+    rng = random.Random(3)
+    student_ids = [f"student_{i}" for i in range(1, 9)]
+    behavior_log, homework_log = make_log(rng, student_ids, 400), make_log(rng, student_ids, 100)
+    start, end = date(2025, 9, 1), date(2025, 9, 14)
+    report_students = student_ids[:6] + ["student_1"] # A repeated id is listed once
+    grid = build_attendance_grid((behavior_log, homework_log), start, end, report_students)
+    assert grid.student_ids == student_ids[:6]
+
+    present = {(datetime.fromisoformat(entry["timestamp"]).date(), entry["student_id"]) for entry in behavior_log + homework_log}
+    for day in grid.dates():
+        for student_id in grid.student_ids:
+            assert grid.is_present(day, student_id) == ((day, student_id) in present), (day, student_id)
+    for student_id in grid.student_ids:
+        days_present, days_absent = grid.totals(student_id)
+        assert days_present + days_absent == 14
+    assert not grid.is_present(end + timedelta(days=1), "student_1") and not grid.is_present(start, "student_8")
+
+
+def test_range_edges():
+    log = [{"timestamp": "2025-09-01T00:00:00"}, {"timestamp": "2025-09-01T23:59:59"},
+           {"timestamp": "2025-09-02T12:00:00"}, {"timestamp": "2025-09-03T00:00:00"}]
+    assert log_slice_for_dates(log, date(2025, 9, 1), date(2025, 9, 2)) == (0, 3), "Whole first and last days"
+    assert log_slice_for_dates(log, date(2025, 9, 4), date(2025, 9, 5)) == (4, 4)
+    assert not build_attendance_grid((log,), date(2025, 9, 2), date(2025, 9, 1), ["student_1"]), "An end before the start is empty"
+
+
+if __name__ == "__main__":
+    test_grid_matches_a_scan_of_every_entry()
+    test_range_edges()
+    print("✅ Attendance Engine Verification Passed!")
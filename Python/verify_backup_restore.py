@@ -0,0 +1,89 @@
+import glob
+import json
+import os
+import tempfile
+import zipfile
+
+import backup_restore
+from backup_restore import BackupFormatError, read_backup_members, replace_files_atomically
+
+
+def write(path, content):
+    with open(path, 'wb') as f:
+        f.write(content)
+
+
+def read_all(folder):
+    contents = {}
+    for path in glob.glob(os.path.join(folder, "**", "*"), recursive=True):
+        if os.path.isfile(path):
+            with open(path, 'rb') as f:
+                contents[os.path.relpath(path, folder)] = f.read()
+    return contents
+
+
+def test_restore_that_fails_partway_rolls_back():
+    with tempfile.TemporaryDirectory() as folder:
+        data_file = os.path.join(folder, "classroom_data_v10.json")
+        groups_file = os.path.join(folder, "student_groups_v10.json")
+        stale_template = os.path.join(folder, "layout_templates", "old.json")
+        os.makedirs(os.path.dirname(stale_template))
+        write(data_file, b'{"students": "old"}')
+        write(groups_file, b'{"groups": "old"}')
+        write(stale_template, b'{"template": "old"}')
+        before = read_all(folder)
+        files = [(data_file, b'{"students": "new"}'), (groups_file, b'{"groups": "new"}'),
+                 (os.path.join(folder, "layout_templates", "new.json"), b'{"template": "new"}')]
+
+        real_replace = os.replace
+        # Fail at each os.replace in turn: while moving targets aside and while moving new files into place
+        for failing_call in range(1, 7):
+            calls = [0]
+            def flaky_replace(source, target):
+                calls[0] += 1
+                if calls[0] == failing_call:
+                    raise OSError("disk full (simulated)")
+                return real_replace(source, target)
+            backup_restore.os.replace = flaky_replace
+            try:
+                replace_files_atomically(files, remove_paths=[stale_template])
+                assert False, "The simulated failure should be raised"
+            except OSError:
+                pass
+            finally:
+                backup_restore.os.replace = real_replace
+            assert read_all(folder) == before, f"Failing replace #{failing_call} leaves the original files in place"
+
+        replace_files_atomically(files, remove_paths=[stale_template])
+        after = read_all(folder)
+        assert after == {os.path.relpath(path, folder): content for path, content in files}, "New files in, stale template out"
+
+
+def make_backup(folder, members):
+    zip_path = os.path.join(folder, "backup.zip")
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, content in members.items():
+            zf.writestr(name, content)
+    return zip_path
+
+
+def test_backup_members_are_checked():
+    data = json.dumps({"students": {}}).encode()
+    with tempfile.TemporaryDirectory() as folder:
+        members = read_backup_members(make_backup(folder, {"classroom_data_v10.json": data}), 10)
+        assert members["data"] == ("classroom_data_v10.json", data)
+
+        for bad_members in ({"classroom_data_v11.json": data}, # Newer than this app
+                            {"classroom_data_v10.json": data, "../classroom_data_v9.json": data},
+                            {"custom_behaviors_v10.json": b"[]"}): # No data file
+            try:
+                read_backup_members(make_backup(folder, bad_members), 10)
+                assert False, f"{sorted(bad_members)} should be refused"
+            except BackupFormatError:
+                pass
+
+
+if __name__ == "__main__":
+    test_restore_that_fails_partway_rolls_back()
+    test_backup_members_are_checked()
+    print("✅ Backup Restore Verification Passed!")
@@ -0,0 +1,72 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import zipfile
+from datetime import datetime, timedelta
+
+from batch_export import export_filter_settings
+from seatingchartmain import ClassroomData
+
+
+def student(student_id, first_name, last_name, x):
+    return {"id": student_id, "first_name": first_name, "last_name": last_name, "full_name": f"{first_name} {last_name}",
+            "x": x, "y": 50, "width": 130, "height": 80, "style_overrides": {}}
+
+
+def write_data_file(folder):
+    now = datetime.now()
+    recent = lambda hours: (now - timedelta(hours=hours)).isoformat()
+    talking = {"type": "behavior_count", "application_style": "stripe", "active_modes": [], "active_times": [], "enabled": True,
+               "color": "#ff4242", "outline": "", "behavior_name": "Talking", "count_threshold": 2, "time_window_hours": 24}
+    quiz_mode_only = dict(talking, color="#0000ff", active_modes=["quiz"])
+    data = {
+        "students": {"student_1": student("student_1", "Ada", "Lovelace", 50), "student_2": student("student_2", "Alan", "Turing", 250)},
+        "furniture": {}, "guides": {},
+        "behavior_log": [
+            {"student_id": "student_1", "timestamp": recent(1), "type": "behavior", "behavior": "Talking", "comment": ""},
+            {"student_id": "student_1", "timestamp": recent(2), "type": "behavior", "behavior": "Talking", "comment": ""},
+            {"student_id": "student_2", "timestamp": recent(1), "type": "behavior", "behavior": "Talking", "comment": ""},
+            {"student_id": "student_2", "timestamp": recent(48), "type": "behavior", "behavior": "Talking", "comment": "Outside the window"},
+        ],
+        "homework_log": [],
+        "settings": {"conditional_formatting_rules": [talking, quiz_mode_only], "current_mode": "behavior"},
+    }
+    path = os.path.join(folder, "classroom_data_v10.json")
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    return path
+
+
+def test_rules_apply_without_the_window():
+    with tempfile.TemporaryDirectory() as folder:
+        classroom = ClassroomData()
+        classroom.load_file(write_data_file(folder))
+        talking, quiz_mode_only = classroom.settings["conditional_formatting_rules"]
+        assert classroom.applies_to_conditional("student_1", talking), "Two Talking logs in the last 24 hours"
+        assert not classroom.applies_to_conditional("student_2", talking), "The second log is outside the window"
+        assert not classroom.applies_to_conditional("student_1", quiz_mode_only), "Checked in the saved mode (behavior)"
+
+        boxes = {box["lines"][0]["text"]: box for box in classroom.build_layout_scene()["boxes"]}
+        assert [stripe["fill"] for stripe in boxes["Ada"]["stripes"]] == ["#ff4242"]
+        assert boxes["Alan"]["stripes"] == []
+
+
+def test_csv_export_without_the_window():
+    with tempfile.TemporaryDirectory() as folder:
+        classroom = ClassroomData()
+        classroom.load_file(write_data_file(folder))
+        zip_path = os.path.join(folder, "log.zip")
+        classroom.export_data_to_csv_zip(zip_path, export_filter_settings(None, None))
+        with zipfile.ZipFile(zip_path) as zf:
+            rows = list(csv.DictReader(io.TextIOWrapper(zf.open("all_logs.csv"), encoding="utf-8")))
+            students = list(csv.DictReader(io.TextIOWrapper(zf.open("students.csv"), encoding="utf-8")))
+        assert len(rows) == 4 and {row["Student_ID"] for row in rows} == {"student_1", "student_2"}
+        assert [row["Last_Name"] for row in students] == ["Lovelace", "Turing"]
+
+
+if __name__ == "__main__":
+    test_rules_apply_without_the_window()
+    test_csv_export_without_the_window()
+    print("✅ Classroom Data Verification Passed!")
@@ -0,0 +1,92 @@
+import os
+import tempfile
+
+from command_history import CommandHistoryStore, HistoryEntryUnavailableError, PagedCommandStack, apply_retention, archive_keys
+from commands import Command
+
+
+class NoteCommand(Command):
+    """A minimal command that only needs to be written to the history file."""
+    def __init__(self, app, note, timestamp=None):
+        super().__init__(app, timestamp)
+        self.note = note
+    def execute(self): pass
+    def undo(self): pass
+    def _get_data_for_serialization(self): return {"note": self.note}
+
+
+def make_store(folder):
+    return CommandHistoryStore(os.path.join(folder, "undo_history.log"), should_encrypt=lambda: False)
+
+
+def test_retention_with_tight_byte_budget():
+    with tempfile.TemporaryDirectory() as folder:
+        store = make_store(folder)
+        seqs = [store.write({"type": "NoteCommand", "timestamp": f"2025-09-0{day}T08:00:00", "data": {"note": "x" * 40}}) for day in range(1, 6)]
+        undo_seqs, redo_seqs = seqs[:4], seqs[4:]
+
+        # Room for the redo entry and the newest undo entry only
+        budget = store.record_size(seqs[4]) + store.record_size(seqs[3])
+        assert apply_retention(store, undo_seqs, redo_seqs, "", budget) == ([seqs[3]], [seqs[4]])
+        # One byte short of the newest undo entry drops it, and everything older with it
+        assert apply_retention(store, undo_seqs, redo_seqs, "", budget - 1) == ([], [seqs[4]])
+        # Smaller than the redo entry itself: nothing fits
+        assert apply_retention(store, undo_seqs, redo_seqs, "", store.record_size(seqs[4]) - 1) == ([], [])
+        # The age limit applies before the size limit
+        assert apply_retention(store, undo_seqs, redo_seqs, "2025-09-03", 10 ** 6) == (seqs[2:4], [seqs[4]])
+
+
+def test_unreadable_entry_cannot_be_undone_silently():
+    with tempfile.TemporaryDirectory() as folder:
+        store = make_store(folder)
+        seq = store.write({"type": "NoSuchCommand", "timestamp": "2025-09-01T08:00:00", "data": {}})
+        stack = PagedCommandStack(None, store)
+        stack.load([seq])
+        command = stack.pop()
+        for action in (command.undo, command.execute):
+            try:
+                action()
+                assert False, "An unreadable history entry must not undo or redo silently"
+            except HistoryEntryUnavailableError:
+                pass
+        stack.append(command) # Put back, as the app does after an undo error
+        assert stack.flush() == [seq], "The unreadable record stays listed"
+
+
+def test_known_seqs_survive_a_failed_flush():
+    with tempfile.TemporaryDirectory() as folder:
+        store = make_store(folder)
+        stack = PagedCommandStack(None, store)
+        stack.append(NoteCommand(None, "first"))
+        first_seqs = stack.flush()
+        assert len(first_seqs) == 1
+
+        store.path = os.path.join(folder, "missing", "undo_history.log") # Writes now fail
+        stack.append(NoteCommand(None, "second"))
+        try:
+            stack.flush()
+            assert False, "Writing to a missing folder should fail"
+        except OSError:
+            pass
+        assert stack.seqs() == first_seqs, "The record written before the failure is still listed"
+
+
+def test_archive_keys_of_delete_commands():
+    with tempfile.TemporaryDirectory() as folder:
+        store = make_store(folder)
+        def delete(key): return {"type": "DeleteItemCommand", "timestamp": "2025-09-01T08:00:00", "data": {"item_type": "student", "archive_key": key}}
+        single = store.write(delete("student_1@2025-09-01T08:00:00"))
+        grouped = store.write({"type": "CompositeCommand", "timestamp": "2025-09-02T08:00:00",
+                               "data": {"commands": [delete("student_2@2025-09-02T08:00:00"), {"type": "MoveItemsCommand", "data": {}}]}})
+        legacy = store.write({"type": "DeleteItemCommand", "timestamp": "2025-09-03T08:00:00", "data": {"item_type": "student", "associated_logs": []}})
+        other = store.write({"type": "NoteCommand", "timestamp": "2025-09-04T08:00:00", "data": {"archive_key": "not a delete"}})
+        assert archive_keys(store, [single, grouped, legacy, other, 999]) == {"student_1@2025-09-01T08:00:00", "student_2@2025-09-02T08:00:00"}
+        assert archive_keys(store, [grouped]) == {"student_2@2025-09-02T08:00:00"}, "A dropped delete command no longer keeps its archive"
+
+
+if __name__ == "__main__":
+    test_retention_with_tight_byte_budget()
+    test_unreadable_entry_cannot_be_undone_silently()
+    test_known_seqs_survive_a_failed_flush()
+    test_archive_keys_of_delete_commands()
+    print("✅ Command History Verification Passed!")
@@ -0,0 +1,99 @@
+import copy
+
+from commands import Command, ResetSettingsCommand
+from history_checkpoints import HistoryCheckpoints
+from log_stats import LogStatsCatalog
+
+
+class App:
+    """Just the state a checkpoint copies and restores."""
+    def __init__(self):
+        self.students, self.furniture, self.guides = {}, {}, {}
+        self.behavior_log, self.homework_log, self.log_archive = [], [], {}
+        self.next_student_id_num = self.next_furniture_id_num = self.next_guide_id_num = 1
+        self.selected_items = set()
+        self.log_stats = LogStatsCatalog()
+        self.undo_stack = []
+
+
+class AddStudentWithLogCommand(Command):
+    def __init__(self, app, number):
+        super().__init__(app)
+        self.student_id = f"student_{number}"
+        self.log_entry = {"student_id": self.student_id, "timestamp": f"2025-09-01T08:{number % 60:02d}:00", "type": "behavior", "behavior": "Talking"}
+    def execute(self):
+        self.app.students[self.student_id] = {"id": self.student_id, "x": 0, "y": 0}
+        self.app.next_student_id_num += 1
+        self.app.behavior_log.append(self.log_entry); self.app.log_stats.add_entry(self.log_entry)
+    def undo(self):
+        del self.app.students[self.student_id]
+        self.app.next_student_id_num -= 1
+        self.app.behavior_log.remove(self.log_entry); self.app.log_stats.remove_entry(self.log_entry)
+
+
+class SettingsChangeCommand(ResetSettingsCommand):
+    """Changes state a checkpoint does not hold."""
+    def __init__(self, app):
+        Command.__init__(self, app)
+    def execute(self): pass
+    def undo(self): pass
+
+
+def state(app):
+    return copy.deepcopy((app.students, app.behavior_log, app.next_student_id_num)), app.log_stats.total_count
+
+
+def run(app, checkpoints, commands):
+    states = [state(app)]
+    for command in commands:
+        command.execute()
+        checkpoints.discard_after(len(app.undo_stack))
+        app.undo_stack.append(command)
+        checkpoints.command_executed(app)
+        states.append(state(app))
+    return states
+
+
+def jump_to(app, checkpoints, target_length):
+    """What the undo history dialog does to reach the state after `target_length` commands."""
+    checkpoint = checkpoints.plan(app.undo_stack, target_length)
+    if checkpoint is None:
+        for command in reversed(app.undo_stack[target_length:]): command.undo()
+    else:
+        checkpoint.restore(app)
+        if checkpoint.history_length > target_length:
+            for command in reversed(app.undo_stack[target_length:checkpoint.history_length]): command.undo()
+        else:
+            for command in app.undo_stack[checkpoint.history_length:target_length]: command.execute()
+    return checkpoint
+
+
+def test_jumps_match_step_by_step_undo():
+    app, checkpoints = App(), HistoryCheckpoints(interval=5, max_checkpoints=4)
+    states = run(app, checkpoints, [AddStudentWithLogCommand(app, number) for number in range(1, 51)])
+    assert len(checkpoints.checkpoints) <= 4 and checkpoints.interval == 20, "Thinned out as the history grew"
+    used = {}
+    for target_length in (47, 40, 23, 3, 0):
+        used[target_length] = jump_to(app, checkpoints, target_length)
+        assert state(app) == states[target_length], target_length
+        del app.undo_stack[target_length:]
+        checkpoints.discard_after(target_length)
+        assert all(length <= target_length for length in checkpoints.checkpoints)
+    assert used[47] is None, "Three undos are cheaper than replaying from the checkpoint at 40"
+    assert used[23].history_length == 20, "Restored the checkpoint at 20 and replayed three commands"
+
+
+def test_no_checkpoint_across_uncaptured_commands():
+    app, checkpoints = App(), HistoryCheckpoints(interval=5)
+    commands = [AddStudentWithLogCommand(app, number) for number in range(1, 13)]
+    commands.insert(8, SettingsChangeCommand(app))
+    states = run(app, checkpoints, commands)
+    assert checkpoints.plan(app.undo_stack, 4) is None, "The checkpoint at 5 lies across the settings change"
+    assert checkpoints.plan(app.undo_stack, 11).history_length == 10
+    assert jump_to(app, checkpoints, 4) is None and state(app) == states[4]
+
+
+if __name__ == "__main__":
+    test_jumps_match_step_by_step_undo()
+    test_no_checkpoint_across_uncaptured_commands()
+    print("✅ History Checkpoints Verification Passed!")
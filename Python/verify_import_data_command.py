@@ -0,0 +1,60 @@
+from commands import Command, ImportDataCommand
+from log_records import LogRecordBook
+from log_stats import LogStatsCatalog
+
+
+class Canvas:
+    def delete(self, *tags): pass
+
+
+class App:
+    """Just the state ImportDataCommand reads and writes."""
+    def __init__(self, students, behavior_log):
+        self.students = students
+        self.log_records = LogRecordBook(lambda: self.students)
+        self.behavior_log = self.log_records.make_all(behavior_log)
+        self.log_stats = LogStatsCatalog()
+        self.log_stats.rebuild(self.behavior_log)
+        self.next_student_id_num = 2
+        self.canvas = Canvas()
+        self.selected_items = set()
+    def update_student_display_text(self, student_id): pass
+    def update_status(self, message): pass
+    def draw_all_items(self, **kwargs): pass
+
+
+def log(student_id, timestamp, behavior):
+    return {"student_id": student_id, "timestamp": timestamp, "behavior": behavior, "type": "behavior", "comment": ""}
+
+
+def behaviors(app):
+    return sorted((entry["student_id"], entry["timestamp"], entry["behavior"]) for entry in app.behavior_log)
+
+
+def test_import_undo_after_redo():
+    existing = log("student_1", "2025-09-01T08:00:00", "Talking")
+    app = App({"student_1": {"id": "student_1", "first_name": "Ada", "last_name": "Lovelace", "full_name": "Ada Lovelace"}}, [existing])
+    new_student = {"student_2": {"id": "student_2", "first_name": "Alan", "last_name": "Turing", "full_name": "Alan Turing"}}
+    command = ImportDataCommand(app, new_student, [dict(existing), log("student_2", "2025-09-02T09:00:00", "Helping")], 2, 3, "other.xlsx")
+
+    before = behaviors(app)
+    command.execute()
+    assert len(app.behavior_log) == 2, "The log that was already there is not imported again"
+    command.undo()
+    assert behaviors(app) == before, "Undo keeps the log that existed before the import"
+    command.execute() # Redo
+    assert len(app.behavior_log) == 2 and "student_2" in app.students
+    command.undo()
+    assert behaviors(app) == before and "student_2" not in app.students
+    assert app.log_stats.count() == 1
+
+    # The added keys survive the history file
+    command.execute()
+    rebuilt = Command.from_dict(app, command.to_dict())
+    rebuilt.undo()
+    assert behaviors(app) == before, "A command read back from the history removes only what it added"
+
+
+if __name__ == "__main__":
+    test_import_undo_after_redo()
+    print("✅ Import Undo Verification Passed!")
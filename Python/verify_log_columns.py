@@ -0,0 +1,59 @@
+import log_columns
+from log_columns import LogColumnStore
+
+
+def log(student_id, timestamp, name, log_type="behavior", **extra):
+    entry = {"student_id": student_id, "timestamp": timestamp, "type": log_type, "behavior": name}
+    entry.update(extra)
+    return entry
+
+
+def make_store(entries):
+    store = LogColumnStore()
+    for entry in entries:
+        store.add_entry(entry)
+    return store
+
+
+def test_select_and_count():
+    entries = [log("s1", "2025-09-01T08:00:00", "Talking"),
+               log("s1", "2025-09-02T08:00:00", "Talking"),
+               log("s1", "2025-09-03T08:00:00", "Helping"),
+               log("s2", "2025-09-03T09:00:00", "Talking"),
+               log("s1", "2025-09-04T08:00:00", "Pop Quiz", "quiz", score_details={"correct": 3, "total_asked": 4}),
+               log("s1", "not a date", "Talking")]
+    store = make_store(entries)
+
+    assert store.entries_for(store.select(student_id="s1", item_names=["Talking"], since="2025-09-02T00:00:00")) == [entries[1]]
+    assert store.count(student_id="s1", item_names=["Talking"]) == 3, "Undated entries match when there is no time filter"
+    assert store.count(student_id="s1", item_names=["Talking"], since="2025-01-01T00:00:00") == 2, "...and never match a time filter"
+    assert store.count(log_types=["behavior", "quiz"], name_contains="quiz") == 1
+    assert store.count(student_id="nobody") == 0
+    assert store.entries_for(store.select(student_id="s1", log_types=["behavior", "quiz"], since="2025-09-02T00:00:00", newest_first=True)) == [entries[4], entries[2], entries[1]]
+    assert store.quiz_scores(lambda entry: entry["score_details"]["correct"] / entry["score_details"]["total_asked"] * 100, "s1") == [75.0]
+
+
+def test_removal_and_compaction():
+    entries = [log("s1", f"2025-09-01T08:{minute:02d}:00", "Talking") for minute in range(10)]
+    store = make_store(entries)
+    duplicate = dict(entries[0])
+    store.remove_entry(duplicate) # An equal entry removes one matching row
+    assert store.count(student_id="s1") == 9 and len(store) == 9
+
+    original_threshold = log_columns.MIN_COMPACTION_ROWS
+    log_columns.MIN_COMPACTION_ROWS = 4
+    try:
+        for entry in entries[1:5]:
+            store.remove_entry(entry)
+    finally:
+        log_columns.MIN_COMPACTION_ROWS = original_threshold
+    assert store.dead_rows == 0 and len(store.entries) == 5, "Compacted once half of the rows were dead"
+    assert store.entries_for(store.select(student_id="s1")) == entries[5:]
+    store.remove_entry(entries[9])
+    assert store.count(student_id="s1", since="2025-09-01T08:06:00") == 3
+
+
+if __name__ == "__main__":
+    test_select_and_count()
+    test_removal_and_compaction()
+    print("✅ Log Columns Verification Passed!")
@@ -0,0 +1,44 @@
+import copy
+import json
+
+from log_records import LogRecord, LogRecordBook, json_default
+
+
+def test_records_behave_like_their_dicts():
+    students = {"student_1": {"first_name": "Ada", "last_name": "Lovelace"}}
+    book = LogRecordBook(lambda: students)
+    entry = {"timestamp": "2025-09-01T08:00:00", "student_id": "student_1", "student_first_name": "Ada", "student_last_name": "Lovelace",
+             "behavior": "Pop Quiz", "comment": "", "type": "quiz", "day": "Monday", "marks_data": {"correct": 3}}
+    record = book.make(entry)
+    assert record == entry and entry == record and dict(record) == entry
+    assert list(record) == list(entry), "Keys in the order they are saved"
+    assert book.make(record) is record
+    assert json.loads(json.dumps([record], default=json_default)) == [entry]
+    assert type(copy.deepcopy(record)) is dict and copy.deepcopy(record) == entry
+    record["comment"] = "Late"
+    assert record["comment"] == "Late" and record != entry
+    del record["marks_data"]
+    assert "marks_data" not in record and len(record) == 8
+
+
+def test_student_names_are_resolved_when_read():
+    students = {"student_1": {"first_name": "Ada", "last_name": "Lovelace"}}
+    book = LogRecordBook(lambda: students)
+    current = book.make({"timestamp": "2025-09-01T08:00:00", "student_id": "student_1", "student_first_name": "Ada", "student_last_name": "Lovelace", "type": "behavior"})
+    old_name = book.make({"timestamp": "2025-09-01T09:00:00", "student_id": "student_1", "student_first_name": "Ada", "student_last_name": "Byron", "type": "behavior"})
+    no_names = book.make({"timestamp": "2025-09-01T10:00:00", "student_id": "student_1", "type": "behavior"})
+
+    students["student_1"]["first_name"] = "Augusta" # Renamed
+    assert current["student_first_name"] == "Augusta"
+    assert (old_name["student_first_name"], old_name["student_last_name"]) == ("Ada", "Byron"), "A different logged name is kept"
+    assert "student_first_name" not in no_names
+
+    del students["student_1"] # Deleted: the names last logged are used
+    assert (current["student_first_name"], current["student_last_name"]) == ("Ada", "Byron")
+    assert isinstance(current, LogRecord)
+
+
+if __name__ == "__main__":
+    test_records_behave_like_their_dicts()
+    test_student_names_are_resolved_when_read()
+    print("✅ Log Records Verification Passed!")
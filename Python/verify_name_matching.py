@@ -0,0 +1,46 @@
+import random
+
+from name_matching import NameIndex, bounded_distance, normalize_name
+
+
+def levenshtein(a, b):
+    """Plain full-table edit distance, to check the bounded one against."""
+    previous = list(range(len(b) + 1))
+    for i, c in enumerate(a, 1):
+        current = [i]
+        for j, d in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (c != d)))
+        previous = current
+    return previous[-1]
+
+
+def test_exact_name_matching():
+    index = NameIndex([("student_1", "José Smith"), ("student_2", "Jose Smyth"), ("student_3", "Ann Lee")])
+    assert normalize_name(" JOSÉ__smith ") == "jose smith"
+    assert index.matches("jose_smith", threshold=1.0) == [(1.0, "student_1")], "Only the same normalized name at full threshold"
+    assert index.matches("Jose Smit", threshold=1.0) == []
+    assert [item_id for _, item_id in index.matches("Jose Smith")] == ["student_1", "student_2"], "The exact name ranks first"
+    assert index.matches("Ann Lee", among={"student_1"}) == []
+
+
+def test_index_agrees_with_full_distance():
+    rng = random.Random(7)
+    letters = "abcdefghij "
+    names = ["".join(rng.choice(letters) for _ in range(rng.randint(4, 14))).strip() or "x" for _ in range(300)]
+    index = NameIndex(enumerate(names))
+    for query in names[:40] + [name[:-1] + "z" for name in names[40:80]]:
+        for threshold in (0.6, 0.85):
+            expected = set()
+            for item_id, name in enumerate(names):
+                a, b = normalize_name(query), normalize_name(name)
+                if not a or not b: continue
+                score = 1.0 - levenshtein(a, b) / max(len(a), len(b))
+                if score >= threshold and score > 0: expected.add(item_id)
+            assert {item_id for _, item_id in index.matches(query, threshold)} == expected, (query, threshold)
+    assert bounded_distance("kitten", "sitting", 3) == 3 and bounded_distance("kitten", "sitting", 2) == 3
+
+
+if __name__ == "__main__":
+    test_exact_name_matching()
+    test_index_agrees_with_full_distance()
+    print("✅ Name Matching Verification Passed!")
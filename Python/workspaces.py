@@ -0,0 +1,140 @@
+"""
+workspaces.py: Named classroom workspaces (one per class or period) in the app data folder.
+
+Each workspace has its own data file, undo history, layout snapshot, student
+groups and Excel autosave log. Custom behaviors, homework types and statuses,
+quiz/homework templates and layout templates are shared by all of them. The
+"default" workspace is the app data folder itself, so data from before
+workspaces existed is simply its data; other workspaces live in
+`workspaces/<id>/` and use the same file names.
+
+`workspaces.json` lists the workspaces, which one is active, and a small summary
+of each (student and log counts, when it was last saved), so the switcher can
+describe inactive workspaces without reading their data files. Only the active
+workspace is loaded.
+
+Switching saves the active workspace and puts its decrypted, already-built state
+(students, logs, log statistics, undo/redo sequence numbers, ...) into a
+`WorkspaceCache` of the last MAX_CACHED_WORKSPACES workspaces. Switching back
+to a cached workspace whose data file has not changed since reuses that state
+instead of decrypting and parsing the file again; otherwise the switch goes
+through the two-phase load (layout snapshot first, logs on a worker thread; see
+startup_loader.py).
+"""
+
+import json
+import os
+import re
+from collections import OrderedDict
+
+WORKSPACES_FILE_NAME = "workspaces.json"
+WORKSPACES_DIR_NAME = "workspaces"
+DEFAULT_WORKSPACE_ID = "default"
+DEFAULT_WORKSPACE_NAME = "My Classroom"
+MAX_CACHED_WORKSPACES = 3
+
+
+class WorkspaceRegistry:
+    """
+    The list of workspaces in `workspaces.json` and which one is active.
+
+    :param app_data_dir: The app data folder (the default workspace's folder).
+    """
+    def __init__(self, app_data_dir):
+        self.app_data_dir = app_data_dir
+        self.path = os.path.join(app_data_dir, WORKSPACES_FILE_NAME)
+        self.workspaces = {DEFAULT_WORKSPACE_ID: {"name": DEFAULT_WORKSPACE_NAME, "summary": {}}}
+        self.active_id = DEFAULT_WORKSPACE_ID
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path): return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                registry = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read {WORKSPACES_FILE_NAME}: {e}. Using the default workspace.")
+            return
+        for workspace_id, info in registry.get("workspaces", {}).items():
+            if isinstance(info, dict) and info.get("name"):
+                self.workspaces[workspace_id] = {"name": info["name"], "summary": info.get("summary", {})}
+        if registry.get("active") in self.workspaces: self.active_id = registry["active"]
+
+    def save(self):
+        temp_path = self.path + ".tmp"
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump({"active": self.active_id, "workspaces": self.workspaces}, f, indent=4)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print(f"Warning: Could not write {WORKSPACES_FILE_NAME}: {e}")
+
+    def folder(self, workspace_id):
+        """The folder holding a workspace's files (created if needed)."""
+        if workspace_id == DEFAULT_WORKSPACE_ID: return self.app_data_dir
+        folder = os.path.join(self.app_data_dir, WORKSPACES_DIR_NAME, workspace_id)
+        os.makedirs(folder, exist_ok=True)
+        return folder
+
+    def name(self, workspace_id=None):
+        return self.workspaces[workspace_id or self.active_id]["name"]
+
+    def ordered_ids(self):
+        """Workspace ids sorted by name, the default workspace first."""
+        return sorted(self.workspaces, key=lambda wid: (wid != DEFAULT_WORKSPACE_ID, self.workspaces[wid]["name"].lower()))
+
+    def name_in_use(self, name, except_id=None):
+        return any(info["name"].lower() == name.lower() for wid, info in self.workspaces.items() if wid != except_id)
+
+    def create(self, name):
+        """Adds a workspace named `name`. :return: Its id, a slug of the name."""
+        base_id = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_") or "classroom"
+        workspace_id, suffix = base_id, 2
+        while workspace_id in self.workspaces or workspace_id == DEFAULT_WORKSPACE_ID:
+            workspace_id = f"{base_id}_{suffix}"; suffix += 1
+        self.workspaces[workspace_id] = {"name": name, "summary": {}}
+        self.folder(workspace_id)
+        self.save()
+        return workspace_id
+
+    def rename(self, workspace_id, name):
+        self.workspaces[workspace_id]["name"] = name
+        self.save()
+
+    def set_active(self, workspace_id):
+        self.active_id = workspace_id
+        self.save()
+
+    def set_summary(self, workspace_id, summary):
+        """Stores a workspace's summary (see `describe`) without writing the file."""
+        self.workspaces[workspace_id]["summary"] = summary
+
+    def describe(self, workspace_id, summary=None):
+        """
+        The name and summary of a workspace for menus, e.g. "Period 2 (28 students, 1204 logs, saved 2025-10-06)".
+
+        :param summary: Summary to show instead of the stored one (e.g. live counts of the active workspace).
+        """
+        info = self.workspaces[workspace_id]
+        summary = summary or info.get("summary") or {}
+        if "students" not in summary: return info["name"]
+        saved = f", saved {summary['last_saved'][:10]}" if summary.get("last_saved") else ""
+        return f"{info['name']} ({summary['students']} students, {summary.get('logs', 0)} logs{saved})"
+
+
+class WorkspaceCache:
+    """The loaded state of recently active workspaces, least recently used first."""
+    def __init__(self, max_entries=MAX_CACHED_WORKSPACES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict() # workspace id -> (data file stamp, state)
+
+    def put(self, workspace_id, data_file_stamp, state):
+        self._entries.pop(workspace_id, None)
+        self._entries[workspace_id] = (data_file_stamp, state)
+        while len(self._entries) > self.max_entries: self._entries.popitem(last=False)
+
+    def take(self, workspace_id, data_file_stamp):
+        """Removes and returns a workspace's state, or None if it is not cached or its data file changed since."""
+        entry = self._entries.pop(workspace_id, None)
+        if entry is None or data_file_stamp is None or entry[0] != data_file_stamp: return None
+        return entry[1]